@@ -1,13 +1,54 @@
+import time
+STARTED = time.perf_counter()
+
 import os
+import sys
+import builtins
 import threading
 import mimetypes
-from http.server import HTTPServer, SimpleHTTPRequestHandler
-import bot  # Import the enhanced bot logic
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+# The bot logic (bot.py) pulls in the whole telegram stack, so it is imported only once the web
+# server is listening; until then /health answers on its own and other routes return 503.
+bot = None
 
 # --- Configuration ---
 PORT = int(os.environ.get("PORT", 10000))
 DATA_DIR = "data"
 MIRROR_DIR = os.path.join(DATA_DIR, "mirror")
+startup_phases = []
+
+def mark_startup_phase(name):
+    startup_phases.append((name, time.perf_counter() - STARTED))
+
+class ImportProfiler:
+    """Times first imports made by this thread, like `python -X importtime`: (module, self, cumulative) seconds."""
+    def __init__(self):
+        self.imports = []
+        self._children = []
+        self._thread = threading.get_ident()
+
+    def __enter__(self):
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+        return self
+
+    def __exit__(self, *exc_info):
+        builtins.__import__ = self._original_import
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules or threading.get_ident() != self._thread:
+            return self._original_import(name, globals, locals, fromlist, level)
+        self._children.append(0.0)
+        started = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = self._children.pop()
+            if self._children:
+                self._children[-1] += elapsed
+            self.imports.append((name, elapsed - children, elapsed))
 
 class CustomHTTPRequestHandler(SimpleHTTPRequestHandler):
     """
@@ -21,7 +62,28 @@ class CustomHTTPRequestHandler(SimpleHTTPRequestHandler):
             self.end_headers()
             self.wfile.write(b'OK')
             return
-            
+
+        if bot is None and self.path != '/':
+            self.send_error(503, "Starting up")
+            return
+
+        # Prometheus metrics
+        if self.path == '/metrics':
+            if not bot.is_metrics_request_authorized(self.headers.get('Authorization'), self.client_address[0]):
+                self.send_error(401, "Unauthorized")
+                return
+            metrics = bot.render_metrics_threadsafe()
+            if metrics is None:
+                self.send_error(503, "Event loop busy")
+                return
+            body = metrics.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
         # Serve files from the mirror directory
         if self.path.startswith('/mirror/'):
             # Sanitize path to prevent directory traversal attacks
@@ -43,6 +105,7 @@ class CustomHTTPRequestHandler(SimpleHTTPRequestHandler):
                         self.send_header('Content-Disposition', f'inline; filename="{os.path.basename(requested_path)}"')
                         self.end_headers()
                         self.wfile.write(f.read())
+                    bot.record_mirror_access(os.path.basename(requested_path))
                 except IOError:
                     self.send_error(404, "File Not Found")
             else:
@@ -88,10 +151,39 @@ class CustomHTTPRequestHandler(SimpleHTTPRequestHandler):
         </html>
         """)
 
-def run_web_server():
-    """Starts the HTTP server."""
-    server_address = ('', PORT)
-    httpd = HTTPServer(server_address, CustomHTTPRequestHandler)
+    def do_POST(self):
+        if bot is None:
+            self.send_error(503, "Starting up")
+            return
+
+        # Telegram updates for the manager bot in webhook mode
+        if bot.is_manager_webhook_path(self.path):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > bot.WEBHOOK_MAX_BODY:
+                self.send_error(413, "Payload Too Large")
+                return
+            status = bot.submit_webhook_update(self.headers.get('X-Telegram-Bot-Api-Secret-Token'), self.rfile.read(length))
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        # Telegram updates for hosted bots, forwarded to the bot's process
+        if self.path.startswith(bot.INGRESS_PATH_PREFIX):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > bot.WEBHOOK_MAX_BODY:
+                self.send_error(413, "Payload Too Large")
+                return
+            status = bot.forward_ingress_update(self.path, self.headers.get('X-Telegram-Bot-Api-Secret-Token'), self.rfile.read(length))
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_error(404, "Not Found")
+
+def run_web_server(httpd):
+    """Serves HTTP requests on the already bound server."""
     print(f"Web server running on http://0.0.0.0:{PORT}")
     httpd.serve_forever()
 
@@ -107,10 +199,17 @@ if __name__ == '__main__':
     os.makedirs(os.path.join(DATA_DIR, "logs"), exist_ok=True)
     os.makedirs(os.path.join(DATA_DIR, "templates"), exist_ok=True)
     
-    # Start the web server in a background thread
-    web_server_thread = threading.Thread(target=run_web_server)
+    # Start the web server in a background thread; the socket is bound here, so /health is reachable from now on
+    httpd = ThreadingHTTPServer(('', PORT), CustomHTTPRequestHandler)
+    web_server_thread = threading.Thread(target=run_web_server, args=(httpd,))
     web_server_thread.daemon = True
     web_server_thread.start()
+    mark_startup_phase('healthy')
+
+    with ImportProfiler() as profiler:
+        import bot  # Import the enhanced bot logic
+    mark_startup_phase('bot_imported')
+    bot.set_startup_profile(STARTED, startup_phases, profiler.imports)
     
     # Run the bot in the main thread
     run_bot()
@@ -0,0 +1,159 @@
+"""Bot API proxy load test.
+
+Starts the manager's Bot API proxy in front of a local fake Bot API that answers each call after
+--api-latency seconds. Every simulated hosted bot then has --clients threads send sendMessage calls
+through the proxy over keep-alive connections. A client for a token that no hosted bot uses runs at the
+same time. The run reports throughput and p50/p95/p99 latency through the proxy, the proxy's per-bot
+stats, and these checks:
+- the fake never answered more calls for one token at a time than bot_api_proxy_max_concurrency;
+- with more clients than that limit, the proxy counted throttled requests;
+- the proxy's request counts match what was sent, with no errors and nothing left in flight;
+- every request for the unknown token got 403 and none of them reached the fake.
+Any failed check makes the run fail.
+
+    python benchmarks/bot_api_proxy.py --bots 4 --clients 16 --requests 50 --max-concurrency 8
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotAPI
+
+UNKNOWN_TOKEN = "999999:not-hosted"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def client(port, token, requests, latencies, statuses, lock):
+    """Sends sendMessage calls for token through the proxy on one keep-alive connection."""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    body = json.dumps({"chat_id": 1, "text": "proxy load test"})
+    for _ in range(requests):
+        started = time.perf_counter()
+        try:
+            connection.request("POST", f"/bot{token}/sendMessage", body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+            if response.will_close:
+                connection.close()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            status = 0
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+    connection.close()
+
+
+def summarize(values):
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"count": len(ordered), "mean": statistics.fmean(ordered), "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bots", type=int, default=4, help="hosted bots sending through the proxy")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent connections per bot")
+    parser.add_argument("--requests", type=int, default=50, help="calls each connection sends")
+    parser.add_argument("--unknown-requests", type=int, default=20, help="calls sent for a token no hosted bot uses")
+    parser.add_argument("--max-concurrency", type=int, help="override bot_api_proxy_max_concurrency")
+    parser.add_argument("--api-latency", type=float, default=0.02, help="seconds the fake Bot API waits before answering")
+    parser.add_argument("--output", default="bot_api_proxy_benchmark.json")
+    args = parser.parse_args()
+    output_path = os.path.abspath(args.output)
+
+    api = FakeBotAPI(latency=args.api_latency).start()
+    workdir = tempfile.mkdtemp(prefix="bothoster-proxy-")
+    os.chdir(workdir)
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+    os.environ["TELEGRAM_API_UPSTREAM"] = api.url
+    sys.path.insert(0, REPO_DIR)
+    import bot
+
+    if args.max_concurrency is not None:
+        bot.BOT_API_PROXY_MAX_CONCURRENCY = args.max_concurrency
+    limit = bot.BOT_API_PROXY_MAX_CONCURRENCY
+    bot.BOT_API_PROXY_PORT = free_port()
+    tokens = {f"proxy{i:03d}": f"{300000 + i}:proxy" for i in range(args.bots)}
+    for bot_name, token in tokens.items():
+        bot.running_bots[bot_name] = {"token": token}
+
+    latencies, statuses, unknown_statuses = [], {}, {}
+    lock = threading.Lock()
+    try:
+        bot.start_bot_api_proxy()
+        threads = [threading.Thread(target=client, args=(bot.BOT_API_PROXY_PORT, token, args.requests, latencies, statuses, lock))
+                   for token in tokens.values() for _ in range(args.clients)]
+        threads.append(threading.Thread(target=client, args=(bot.BOT_API_PROXY_PORT, UNKNOWN_TOKEN, args.unknown_requests, [], unknown_statuses, lock)))
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+        summary = dict(bot.get_bot_api_proxy_summary())
+    finally:
+        if bot.bot_api_proxy_server:
+            bot.bot_api_proxy_server.shutdown()
+            bot.bot_api_proxy_server.server_close()
+        if bot.bot_api_proxy_client:
+            bot.bot_api_proxy_client.close()
+        api.stop()
+        os.chdir(os.path.dirname(output_path))
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    sent_per_bot = args.clients * args.requests
+    max_in_flight = {bot_name: api.max_in_flight.get(token, 0) for bot_name, token in tokens.items()}
+    checks = {
+        "within_limit": all(value <= limit for value in max_in_flight.values()),
+        "throttled": args.clients <= limit or all(summary.get(bot_name, {}).get("throttled", 0) > 0 for bot_name in tokens),
+        "all_answered": statuses == {200: args.bots * sent_per_bot},
+        "stats_match": all(
+            {key: summary.get(bot_name, {}).get(key) for key in ("requests", "errors", "in_flight")} == {"requests": sent_per_bot, "errors": 0, "in_flight": 0}
+            for bot_name in tokens
+        ),
+        "unknown_rejected": unknown_statuses == {403: args.unknown_requests} and UNKNOWN_TOKEN not in api.max_in_flight
+                            and UNKNOWN_TOKEN not in bot.bot_api_proxy_stats,
+    }
+    results = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "settings": {**{key: value for key, value in vars(args).items() if key != "output"}, "max_concurrency": limit},
+        "duration": wall,
+        "requests": len(latencies),
+        "requests_per_second": len(latencies) / wall,
+        "latency": summarize(latencies),
+        "statuses": statuses,
+        "unknown_token_statuses": unknown_statuses,
+        "upstream_max_in_flight": max_in_flight,
+        "proxy_stats": summary,
+        "checks": checks,
+        "ok": all(checks.values()),
+    }
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    if not results["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""A minimal local stand-in for the Telegram Bot API, used by the benchmarks.
+
+It answers every method with a plausible `ok` result, records the calls it served, hands out queued
+updates through getUpdates and serves registered files to getFile downloads. Point the manager at it
+with TELEGRAM_API_BASE_URL=<url>/bot. Once setWebhook has been called, updates are POSTed to the
+registered URL with its secret token instead, like Telegram does.
+"""
+import json
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qsl
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # the default of 5 resets connections when many clients connect at once
+
+
+class FakeBotAPI:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, poll_timeout=0.5):
+        self.latency = latency
+        self.poll_timeout = poll_timeout
+        self.calls = deque(maxlen=100000)  # (monotonic time, token, method, params)
+        self.updates = deque()
+        self.updates_ready = threading.Condition()
+        self.files = {}  # file_id -> bytes
+        self.webhook = None  # setWebhook parameters while a webhook is set
+        self.webhook_statuses = {}  # HTTP status -> deliveries answered with it
+        self.in_flight = {}  # token -> calls being answered right now
+        self.max_in_flight = {}  # token -> most calls answered at the same time
+        self.next_message_id = 1
+        self.lock = threading.Lock()
+        self.server = FakeServer((host, port), self._make_handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-bot-api", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def push_update(self, update):
+        if self.webhook:
+            threading.Thread(target=self.deliver_update, args=(update,), daemon=True).start()
+            return
+        with self.updates_ready:
+            self.updates.append(update)
+            self.updates_ready.notify_all()
+
+    def post_update(self, update, secret_token=None, url=None):
+        """POSTs an update to the webhook URL; returns the HTTP status it was answered with."""
+        request = urllib.request.Request(url or self.webhook["url"], data=json.dumps(update).encode("utf-8"), method="POST")
+        request.add_header("Content-Type", "application/json")
+        if secret_token:
+            request.add_header("X-Telegram-Bot-Api-Secret-Token", secret_token)
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except OSError:
+            return 0
+
+    def deliver_update(self, update):
+        status = self.post_update(update, self.webhook.get("secret_token"))
+        with self.lock:
+            self.webhook_statuses[status] = self.webhook_statuses.get(status, 0) + 1
+
+    def add_file(self, file_id, data):
+        self.files[file_id] = data
+
+    def count_calls(self, method=None):
+        return sum(1 for _, _, name, _ in list(self.calls) if method is None or name == method)
+
+    def _message(self, params):
+        with self.lock:
+            message_id = self.next_message_id
+            self.next_message_id += 1
+        chat_id = int(params.get("chat_id") or 1)
+        message = {
+            "message_id": message_id, "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"},
+            "text": params.get("text") or params.get("caption") or "",
+        }
+        if "animation" in params or "document" in params:
+            message["animation"] = {"file_id": "fake-animation", "file_unique_id": "fake-animation", "width": 1, "height": 1, "duration": 1}
+        return message
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        timeout = min(float(params.get("timeout") or 0), self.poll_timeout)
+        with self.updates_ready:
+            while self.updates and self.updates[0]["update_id"] < offset:
+                self.updates.popleft()
+            if not self.updates and timeout:
+                self.updates_ready.wait(timeout)
+            return list(self.updates)[:int(params.get("limit") or 100)]
+
+    def _answer(self, token, method, params):
+        if method == "getMe":
+            return {"id": int(token.split(":")[0] or 1), "is_bot": True, "first_name": "Fake", "username": "fake_bot",
+                    "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False}
+        if method == "getUpdates":
+            return self._get_updates(params)
+        if method.startswith("send") or method.startswith("edit") or method == "forwardMessage":
+            return self._message(params)
+        if method == "setWebhook":
+            self.webhook = params
+            return True
+        if method == "deleteWebhook":
+            self.webhook = None
+            return True
+        if method == "getFile":
+            file_id = params.get("file_id")
+            return {"file_id": file_id, "file_unique_id": file_id, "file_size": len(self.files.get(file_id, b"")), "file_path": f"files/{file_id}"}
+        return True
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out in separate writes; without this, delayed ACKs add ~40ms per call
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if not self.path.startswith("/file/bot"):
+                    self.do_POST()
+                    return
+                data = api.files.get(self.path.rsplit("/", 1)[-1])
+                if data is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                try:
+                    _, token, method = self.path.split("/", 2)
+                    token = token[len("bot"):]
+                except ValueError:
+                    self.send_error(404)
+                    return
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    params = json.loads(body or b"{}")
+                else:
+                    params = dict(parse_qsl(body.decode("utf-8", "replace")))
+                api.calls.append((time.monotonic(), token, method, params))
+                with api.lock:
+                    api.in_flight[token] = api.in_flight.get(token, 0) + 1
+                    api.max_in_flight[token] = max(api.max_in_flight.get(token, 0), api.in_flight[token])
+                try:
+                    if api.latency:
+                        time.sleep(api.latency)
+                    data = json.dumps({"ok": True, "result": api._answer(token, method, params)}).encode("utf-8")
+                finally:
+                    with api.lock:
+                        api.in_flight[token] -= 1
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
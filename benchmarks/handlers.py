@@ -0,0 +1,373 @@
+"""End-to-end handler load test.
+
+Runs the manager's real Application, built by bot.main(), against a local fake Bot API, so nothing
+touches the network. Simulated users replay scripted sessions concurrently:
+- browse: menus, stats and health screens
+- upload: the full upload conversation, which starts a real hosted bot
+- logs: bot details, the log pager and the resources screen
+- mirror: mirroring a file and browsing the mirror
+- bulk: stop all and start all
+
+Every handler callback is timed. Two latencies are recorded per handler:
+- handler: time spent in the callback;
+- end-to-end: from the update being queued to the callback finishing.
+p50/p95/p99 are reported for both as JSON. With --baseline the run fails when a handler's p95 regresses
+beyond --tolerance:
+
+    python benchmarks/handlers.py --users 20 --rounds 3 --output after.json --baseline before.json
+
+With --webhook the manager runs with MANAGER_WEBHOOK behind app.py's web server. The fake Bot API then
+POSTs every update to the webhook the manager registered. Before the sessions start, updates with a wrong
+or missing secret token must be rejected with 403 and never reach a handler, and one with the right
+token must be answered with 200 and handled. Otherwise the run fails.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import ThreadingHTTPServer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotAPI
+
+STUB_BOT_CODE = b'''import time
+TOKEN = ""
+print("load test bot started", flush=True)
+while True:
+    time.sleep(1)
+'''
+MIRROR_FILE = os.urandom(256 * 1024)
+SESSIONS = ("browse", "upload", "logs", "mirror", "bulk")
+
+
+class LoadTest:
+    def __init__(self, api, args):
+        self.api = api
+        self.args = args
+        self.lock = threading.Lock()
+        self.next_update_id = 1
+        self.next_message_id = 1000
+        self.pending = {}  # update_id -> [queued at, threading.Event]
+        self.handler_times = {}  # handler -> [seconds]
+        self.end_to_end_times = {}
+        self.errors = {}
+        self.timeouts = []
+        self.bot_names = []
+
+    # --- Instrumentation ---
+    def wrap_callback(self, callback):
+        async def timed(update, context, *args, **kwargs):
+            started = time.perf_counter()
+            name = callback.__name__
+            try:
+                return await callback(update, context, *args, **kwargs)
+            except Exception:
+                with self.lock:
+                    self.errors[name] = self.errors.get(name, 0) + 1
+                raise
+            finally:
+                finished = time.perf_counter()
+                with self.lock:
+                    self.handler_times.setdefault(name, []).append(finished - started)
+                    entry = self.pending.pop(getattr(update, 'update_id', None), None)
+                    if entry:
+                        self.end_to_end_times.setdefault(name, []).append(finished - entry[0])
+                if entry:
+                    entry[1].set()
+        timed.__name__ = callback.__name__
+        return timed
+
+    def instrument(self, application):
+        from telegram.ext import ConversationHandler
+
+        def wrap_all(handlers):
+            for handler in handlers:
+                if isinstance(handler, ConversationHandler):
+                    wrap_all(handler.entry_points)
+                    for state_handlers in handler.states.values():
+                        wrap_all(state_handlers)
+                    wrap_all(handler.fallbacks)
+                else:
+                    handler.callback = self.wrap_callback(handler.callback)
+
+        for group in application.handlers.values():
+            wrap_all(group)
+
+    # --- Updates ---
+    def send(self, update_body, user_id):
+        """Queues an update from user_id and waits until a handler has finished with it."""
+        done = threading.Event()
+        with self.lock:
+            update_id = self.next_update_id
+            self.next_update_id += 1
+            self.pending[update_id] = [time.perf_counter(), done]
+            self.api.push_update({"update_id": update_id, **update_body})
+        if not done.wait(self.args.step_timeout):
+            with self.lock:
+                self.pending.pop(update_id, None)
+            self.timeouts.append(update_body)
+        time.sleep(random.uniform(0, self.args.think_time))
+
+    def user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+
+    def message(self, user_id, text=None, document=None):
+        with self.lock:
+            self.next_message_id += 1
+            message_id = self.next_message_id
+        message = {"message_id": message_id, "date": int(time.time()), "chat": {"id": user_id, "type": "private"}, "from": self.user(user_id)}
+        if text is not None:
+            message["text"] = text
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        if document is not None:
+            message["document"] = document
+        return {"message": message}
+
+    def command(self, user_id, text):
+        self.send(self.message(user_id, text), user_id)
+
+    def text(self, user_id, text):
+        self.send(self.message(user_id, text), user_id)
+
+    def document(self, user_id, file_id, file_name, data):
+        self.api.add_file(file_id, data)
+        document = {"file_id": file_id, "file_unique_id": file_id, "file_name": file_name, "file_size": len(data)}
+        self.send(self.message(user_id, document=document), user_id)
+
+    def click(self, user_id, data):
+        menu = self.message(user_id, "menu")["message"]
+        menu["from"] = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        callback_query = {"id": str(random.getrandbits(32)), "from": self.user(user_id), "chat_instance": str(user_id), "data": data, "message": menu}
+        self.send({"callback_query": callback_query}, user_id)
+
+    # --- Sessions ---
+    def browse(self, user_id, round_number):
+        self.command(user_id, "/start")
+        for data in ("list_bots", "stats", "perf_stats", "loop_health", "help", "settings", "template_list", "select_template:echo_bot", "main_menu"):
+            self.click(user_id, data)
+        if self.args.include_slow:
+            self.click(user_id, "system_health")
+
+    def upload(self, user_id, round_number):
+        bot_name = f"load{user_id}r{round_number}"
+        self.click(user_id, "upload_start")
+        self.text(user_id, bot_name)
+        self.document(user_id, f"code-{bot_name}", "bot.py", STUB_BOT_CODE)
+        self.text(user_id, f"{user_id}{round_number}:loadtest")
+        self.click(user_id, "no_requirements")
+        with self.lock:
+            self.bot_names.append(bot_name)
+
+    def logs(self, user_id, round_number):
+        with self.lock:
+            bot_name = random.choice(self.bot_names) if self.bot_names else None
+        if not bot_name:
+            self.command(user_id, "/logs")
+            return
+        self.click(user_id, f"select_bot:{bot_name}")
+        self.click(user_id, f"logs_page:0:0:{bot_name}")
+        self.click(user_id, f"bot_action:resources:{bot_name}")
+        self.command(user_id, "/logs")
+
+    def mirror(self, user_id, round_number):
+        self.click(user_id, "mirror_start")
+        self.document(user_id, f"mirror-{user_id}-{round_number}", f"file{user_id}_{round_number}.bin", MIRROR_FILE)
+        self.click(user_id, "mirror_done")
+        self.click(user_id, "manage_mirror")
+        self.click(user_id, "browse_mirror")
+
+    def bulk(self, user_id, round_number):
+        self.click(user_id, "stop_all_bots")
+        self.click(user_id, "start_all_bots")
+
+    # --- Webhook ---
+    def probe_webhook(self, user_id, secret_token):
+        """POSTs a /start update with secret_token; returns the HTTP status and whether a handler ran for it."""
+        done = threading.Event()
+        with self.lock:
+            update_id = self.next_update_id
+            self.next_update_id += 1
+            self.pending[update_id] = [time.perf_counter(), done]
+        status = self.api.post_update({"update_id": update_id, **self.message(user_id, "/start")}, secret_token)
+        handled = done.wait(self.args.step_timeout if status == 200 else 1.0)
+        with self.lock:
+            self.pending.pop(update_id, None)
+        return {"status": status, "handled": handled}
+
+    def check_webhook(self, user_id, webhook_path):
+        secret_token = self.api.webhook.get("secret_token")
+        checks = {
+            "url": self.api.webhook["url"],
+            "wrong_secret": self.probe_webhook(user_id, "not-the-secret"),
+            "missing_secret": self.probe_webhook(user_id, None),
+            "right_secret": self.probe_webhook(user_id, secret_token),
+        }
+        checks["ok"] = (
+            checks["url"].endswith(webhook_path) and bool(secret_token)
+            and all(checks[name] == {"status": 403, "handled": False} for name in ("wrong_secret", "missing_secret"))
+            and checks["right_secret"] == {"status": 200, "handled": True}
+        )
+        return checks
+
+    def run_user(self, user_id, sessions):
+        for round_number in range(self.args.rounds):
+            for session in sessions:
+                getattr(self, session)(user_id, round_number)
+
+
+def summarize(values):
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"count": len(ordered), "mean": statistics.fmean(ordered), "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1]}
+
+
+def compare(results, baseline, tolerance, floor):
+    """Returns the handlers whose p95 is worse than the baseline's by more than tolerance (and floor seconds)."""
+    regressions = []
+    for name, stats in results["handlers"].items():
+        before = baseline.get("handlers", {}).get(name)
+        if not before:
+            continue
+        allowed = before["handler"]["p95"] * (1 + tolerance) + floor
+        if stats["handler"]["p95"] > allowed:
+            regressions.append({"handler": name, "baseline_p95": before["handler"]["p95"], "p95": stats["handler"]["p95"]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10, help="simulated users running sessions at the same time")
+    parser.add_argument("--rounds", type=int, default=2, help="times each user repeats its sessions")
+    parser.add_argument("--sessions", nargs="+", default=list(SESSIONS), choices=SESSIONS)
+    parser.add_argument("--think-time", type=float, default=0.05, help="maximum random pause between a user's steps")
+    parser.add_argument("--step-timeout", type=float, default=30.0, help="seconds to wait for an update to be handled")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds the fake Bot API waits before answering")
+    parser.add_argument("--include-slow", action="store_true", help="also open System Health, which samples CPU for a second")
+    parser.add_argument("--webhook", action="store_true", help="receive updates through the manager webhook instead of polling")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="handler_benchmark.json")
+    parser.add_argument("--baseline", help="results of an earlier run to compare p95 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p95 regression")
+    parser.add_argument("--floor", type=float, default=0.005, help="absolute slack in seconds added to the allowed p95")
+    args = parser.parse_args()
+    random.seed(args.seed)
+    output_path = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    api = FakeBotAPI(latency=args.api_latency).start()
+    user_ids = [700000 + i for i in range(args.users)]
+    workdir = tempfile.mkdtemp(prefix="bothoster-loadtest-")
+    os.chdir(workdir)
+    os.makedirs("data", exist_ok=True)
+    with open("data/users.json", "w") as f:
+        json.dump({"authorized_users": user_ids, "bot_settings": {"max_bots_per_user": 100000}}, f)
+    os.environ["TELEGRAM_BOT_TOKEN"] = "123456:loadtest"
+    os.environ["TELEGRAM_API_BASE_URL"] = f"{api.url}/bot"
+    sys.path.insert(0, REPO_DIR)
+    httpd = None
+    if args.webhook:
+        import app
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), app.CustomHTTPRequestHandler)
+        threading.Thread(target=httpd.serve_forever, name="webhook-server", daemon=True).start()
+        os.environ["MANAGER_WEBHOOK"] = "1"
+        os.environ["WEBHOOK_URL"] = "http://127.0.0.1:%d" % httpd.server_address[1]
+        os.environ["WEBHOOK_SECRET"] = "loadtest-webhook-secret"
+    import bot
+    if httpd:
+        app.bot = bot
+
+    # Loading animations come from the media cache, so nothing is fetched from the internet
+    with open(bot.MEDIA_CACHE_FILE, "w") as f:
+        json.dump({bot.LOADING_ANIMATION_URL: "fake-animation", bot.START_IMAGE_URL: "fake-animation"}, f)
+
+    load_test = LoadTest(api, args)
+    ready = threading.Event()
+    original_post_init = bot.post_init
+
+    async def post_init(application):
+        load_test.instrument(application)
+        await original_post_init(application)
+        ready.set()
+
+    bot.post_init = post_init
+    results = {}
+
+    def drive():
+        if not ready.wait(60):
+            os.kill(os.getpid(), signal.SIGINT)
+            return
+        webhook = None
+        if args.webhook:
+            deadline = time.monotonic() + 60
+            while not api.webhook and time.monotonic() < deadline:
+                time.sleep(0.05)
+            if not api.webhook:
+                os.kill(os.getpid(), signal.SIGINT)
+                return
+            webhook = load_test.check_webhook(user_ids[0], bot.get_webhook_path())
+        started = time.perf_counter()
+        threads = [threading.Thread(target=load_test.run_user, args=(user_id, args.sessions)) for user_id in user_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+        updates = load_test.next_update_id - 1
+        results.update({
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+            "duration": wall,
+            "updates": updates,
+            "updates_per_second": updates / wall,
+            "timeouts": len(load_test.timeouts),
+            "api_calls": api.count_calls(),
+            **({"webhook": {**webhook, "deliveries": api.webhook_statuses}} if webhook else {}),
+            "handlers": {
+                name: {
+                    "handler": summarize(times),
+                    "end_to_end": summarize(load_test.end_to_end_times.get(name, times)),
+                    "errors": load_test.errors.get(name, 0),
+                }
+                for name, times in sorted(load_test.handler_times.items())
+            },
+        })
+        os.kill(os.getpid(), signal.SIGINT)
+
+    threading.Thread(target=drive, daemon=True).start()
+    try:
+        bot.main()
+    finally:
+        for bot_name in list(bot.running_bots):
+            bot.stop_bot_process(bot_name)
+        api.stop()
+        if httpd:
+            httpd.shutdown()
+            httpd.server_close()
+        os.chdir(os.path.dirname(output_path))
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if not results:
+        raise SystemExit("The manager did not start receiving updates from the fake Bot API")
+    if baseline_path:
+        with open(baseline_path) as f:
+            results["regressions"] = compare(results, json.load(f), args.tolerance, args.floor)
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    if results.get("regressions") or not results.get("webhook", {}).get("ok", True):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Log ingestion throughput benchmark.
+
+Starts hosted bots that print as fast as they can through the real start_bot_subprocess. It then drains
+their output with update_bot_logs in a tight loop, as the monitor and live tails do. For each bot count it reports:
+- the manager's sustained ingest in MB/s and its CPU use;
+- how much output the log rate limit kept, dropped and wrote to disk.
+
+    python benchmarks/log_ingest.py --bots 1 10 50 --duration 10
+    python benchmarks/log_ingest.py --rate-limit 0   # measure without flood protection
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FLOOD_BOT_CODE = '''import sys
+TOKEN = ""
+line = "flood " + "x" * ({line_bytes} - 7) + "\\n"
+block = line * max(1, 65536 // len(line))
+while True:
+    sys.stdout.write(block)
+    sys.stdout.flush()
+'''
+
+
+def run(bot, bot_count, args):
+    import psutil
+
+    manager = psutil.Process()
+    code = FLOOD_BOT_CODE.format(line_bytes=args.line_bytes)
+    names = [f"flood{bot_count}_{i:03d}" for i in range(bot_count)]
+    for i, name in enumerate(names):
+        bot.running_bots[name] = bot.start_bot_subprocess(name, f"{200000 + i}:flood", code)
+    time.sleep(args.warmup)
+    for name in names:
+        bot.update_bot_logs(name)  # Drain what piled up while the bots started
+        bot.log_ingest_stats.pop(name, None)
+
+    cpu_before = manager.cpu_times()
+    started = time.perf_counter()
+    while time.perf_counter() - started < args.duration:
+        for name in names:
+            bot.update_bot_logs(name)
+        time.sleep(args.poll_interval)
+    wall = time.perf_counter() - started
+    cpu_after = manager.cpu_times()
+
+    stats = [bot.log_ingest_stats.get(name, {'read_bytes': 0, 'dropped_lines': 0, 'dropped_bytes': 0}) for name in names]
+    disk_bytes = 0
+    for name in names:
+        log_dir = os.path.join(bot.LOGS_DIR, name)
+        bot.stop_bot_process(name)
+        disk_bytes += sum(entry.stat().st_size for entry in os.scandir(log_dir))
+        del bot.running_bots[name]
+        shutil.rmtree(log_dir, ignore_errors=True)
+        shutil.rmtree(os.path.join(bot.BOTS_DIR, name), ignore_errors=True)
+        bot.forget_log_segments(name)
+
+    read_bytes = sum(entry['read_bytes'] for entry in stats)
+    dropped_bytes = sum(entry['dropped_bytes'] for entry in stats)
+    return {
+        "bots": bot_count,
+        "duration": wall,
+        "ingest_mb_per_second": read_bytes / wall / 2**20,
+        "ingest_mb_per_second_per_bot": read_bytes / wall / 2**20 / bot_count,
+        "kept_mb_per_second": (read_bytes - dropped_bytes) / wall / 2**20,
+        "dropped_lines": sum(entry['dropped_lines'] for entry in stats),
+        "dropped_fraction": dropped_bytes / read_bytes if read_bytes else 0.0,
+        "log_files_mb": disk_bytes / 2**20,
+        "manager_cpu_percent": 100 * ((cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system)) / wall,
+        "manager_rss_mb": manager.memory_info().rss / 2**20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bots", type=int, nargs="+", default=[1, 10, 50], help="numbers of flooding bots to run")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to ingest for at each bot count")
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="pause between passes over all bots")
+    parser.add_argument("--line-bytes", type=int, default=120)
+    parser.add_argument("--rate-limit", type=int, help="override log_rate_limit (bytes/s per bot, 0 disables it)")
+    parser.add_argument("--output", default="log_ingest_benchmark.json")
+    args = parser.parse_args()
+    output_path = os.path.abspath(args.output)
+
+    workdir = tempfile.mkdtemp(prefix="bothoster-ingest-")
+    os.chdir(workdir)
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+    sys.path.insert(0, REPO_DIR)
+    import bot
+
+    if args.rate_limit is not None:
+        bot.LOG_RATE_LIMIT = args.rate_limit
+    results = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "settings": {**{key: value for key, value in vars(args).items() if key != "output"},
+                     "log_rate_limit": bot.LOG_RATE_LIMIT, "log_rate_burst": bot.LOG_RATE_BURST, "log_sample_every": bot.LOG_SAMPLE_EVERY},
+        "scenarios": [],
+    }
+    try:
+        for bot_count in args.bots:
+            print(f"Ingesting from {bot_count} flooding bots for {args.duration:.0f}s...", file=sys.stderr)
+            results["scenarios"].append(run(bot, bot_count, args))
+    finally:
+        for name in list(bot.running_bots):
+            bot.stop_bot_process(name)
+        os.chdir(os.path.dirname(output_path))
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
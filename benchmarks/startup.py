@@ -0,0 +1,83 @@
+"""Time-to-healthy benchmark for the manager.
+
+Starts app.py in a scratch data directory, polls /health until it answers and reports how long that
+took over several runs as JSON. With --budget the script exits non-zero when the median is slower, so it
+can guard against boot-time regressions:
+
+    python benchmarks/startup.py --runs 10 --budget 0.5
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_once(timeout):
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), TELEGRAM_BOT_TOKEN=os.environ.get("TELEGRAM_BOT_TOKEN", "123456:benchmark"))
+    # Keep the manager off the real Bot API; only the web server matters here
+    env.setdefault("TELEGRAM_API_BASE_URL", "http://127.0.0.1:9/bot")
+    with tempfile.TemporaryDirectory() as workdir:
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, APP], cwd=workdir, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+        )
+        try:
+            while time.perf_counter() - started < timeout:
+                if process.poll() is not None:
+                    raise RuntimeError(f"app.py exited with code {process.returncode} before /health answered")
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                        if response.status == 200:
+                            return time.perf_counter() - started
+                except (urllib.error.URLError, ConnectionError):
+                    pass
+                time.sleep(0.005)
+            raise RuntimeError(f"/health did not answer within {timeout}s")
+        finally:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for /health per run")
+    parser.add_argument("--budget", type=float, help="fail if the median time-to-healthy exceeds this many seconds")
+    args = parser.parse_args()
+
+    samples = [measure_once(args.timeout) for _ in range(args.runs)]
+    result = {
+        "runs": args.runs,
+        "time_to_healthy_median": statistics.median(samples),
+        "time_to_healthy_min": min(samples),
+        "time_to_healthy_max": max(samples),
+        "samples": samples,
+    }
+    if args.budget is not None:
+        result["budget"] = args.budget
+        result["passed"] = result["time_to_healthy_median"] <= args.budget
+    print(json.dumps(result, indent=2))
+    if args.budget is not None and not result["passed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Supervisor scalability benchmark.
+
+Runs the manager's real start_bot_subprocess / monitor_bots / stop_bot_process code against a fleet of
+stub hosted bots. The stubs print a configurable amount of output, crash at a configurable rate and call
+a local fake Bot API when they start. Each fleet size runs in a fresh worker process with its own
+scratch data directory, so the manager's CPU and RSS are measured in isolation.
+
+Reported per fleet size:
+- manager CPU and RSS;
+- event loop lag and the worst stall sites;
+- crash-detection latency and restart throughput;
+- start and stop times.
+
+Results are written as JSON, so runs before and after a supervisor change can be compared:
+
+    python benchmarks/supervisor.py --bots 10 100 500 --duration 120 --output before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotAPI
+
+STUB_BOT_CODE = '''
+import os
+import random
+import sys
+import time
+import urllib.request
+
+TOKEN = ""
+LINES_PER_SECOND = {lines_per_second}
+LINE_BYTES = {line_bytes}
+CRASHES_PER_MINUTE = {crashes_per_minute}
+API_URL = {api_url!r}
+
+if API_URL:
+    try:
+        urllib.request.urlopen(f"{{API_URL}}/bot{{TOKEN}}/getMe", data=b"", timeout=5).read()
+    except OSError as e:
+        print(f"getMe failed: {{e}}", flush=True)
+print("stub bot started", flush=True)
+
+crash_at = time.monotonic() + random.expovariate(CRASHES_PER_MINUTE / 60) if CRASHES_PER_MINUTE else float("inf")
+line = "x" * LINE_BYTES
+while True:
+    if time.monotonic() >= crash_at:
+        with open("crashed_at", "w") as f:
+            f.write(repr(time.time()))
+        print("stub bot crashing", flush=True)
+        sys.exit(1)
+    if LINES_PER_SECOND:
+        print(line, flush=True)
+        time.sleep(1 / LINES_PER_SECOND)
+    else:
+        time.sleep(1)
+'''
+
+
+def summarize(values):
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"count": len(ordered), "mean": statistics.fmean(ordered), "p50": pick(0.5), "p95": pick(0.95), "max": ordered[-1]}
+
+
+def run_scenario(args):
+    """Worker side: drives one fleet size inside this process and prints the result as JSON."""
+    workdir = tempfile.mkdtemp(prefix="bothoster-bench-")
+    os.chdir(workdir)
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+    sys.path.insert(0, REPO_DIR)
+    import bot
+    import psutil
+
+    manager = psutil.Process()
+    stub_code = STUB_BOT_CODE.format(
+        lines_per_second=args.lines_per_second, line_bytes=args.line_bytes,
+        crashes_per_minute=args.crashes_per_minute, api_url=args.api_url,
+    )
+
+    crash_detections, restart_durations, restart_failures = [], [], []
+    original_restart = bot.restart_bot_process
+
+    def timed_restart(bot_name):
+        detected_at = time.time()
+        try:
+            with open(os.path.join(bot.running_bots[bot_name]['bot_dir'], "crashed_at")) as f:
+                crash_detections.append(detected_at - float(f.read()))
+        except (OSError, ValueError, KeyError):
+            pass
+        started = time.perf_counter()
+        ok = original_restart(bot_name)
+        (restart_durations if ok else restart_failures).append(time.perf_counter() - started)
+        return ok
+
+    # monitor_bots looks the function up as a module global
+    bot.restart_bot_process = timed_restart
+
+    rss_samples = []
+    sampling = threading.Event()
+
+    def sample_rss():
+        while not sampling.wait(0.5):
+            rss_samples.append(manager.memory_info().rss)
+
+    async def scenario():
+        start_times = []
+        started = time.perf_counter()
+        for i in range(args.bots):
+            bot_started = time.perf_counter()
+            bot_info = bot.start_bot_subprocess(f"stub{i:04d}", f"{100000 + i}:stub", stub_code)
+            if bot_info:
+                bot.running_bots[f"stub{i:04d}"] = bot_info
+            start_times.append(time.perf_counter() - bot_started)
+        start_total = time.perf_counter() - started
+
+        bot.start_loop_watchdog()
+        await asyncio.sleep(0.3)  # Let the watchdog see a heartbeat before the first monitor pass
+        bot.reset_loop_watchdog()
+        cpu_before = manager.cpu_times()
+        run_started = time.perf_counter()
+        monitor = asyncio.create_task(bot.monitor_bots())
+        await asyncio.sleep(args.duration)
+        monitor.cancel()
+        wall = time.perf_counter() - run_started
+        cpu_after = manager.cpu_times()
+        await asyncio.sleep(0.3)  # A stall that just ended is recorded after the next heartbeat
+        lag = bot.get_loop_lag_summary()
+        log_bytes = sum(len(info['logs']) for info in bot.running_bots.values())
+        alive = sum(1 for info in bot.running_bots.values() if info['process'].poll() is None)
+
+        stop_started = time.perf_counter()
+        for bot_name in list(bot.running_bots):
+            bot.stop_bot_process(bot_name)
+        stop_total = time.perf_counter() - stop_started
+
+        cpu_seconds = (cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system)
+        return {
+            "bots": args.bots,
+            "duration": wall,
+            "start": {"total_seconds": start_total, "per_bot": summarize(start_times)},
+            "stop": {"total_seconds": stop_total, "per_bot_mean": stop_total / max(1, args.bots)},
+            "manager_cpu_percent": 100 * cpu_seconds / wall,
+            "manager_rss_mb": {"peak": max(rss_samples, default=0) / 2**20, "end": manager.memory_info().rss / 2**20},
+            "loop_lag_seconds": {"p50": lag['p50'], "p99": lag['p99'], "max": lag['window_max']},
+            "loop_stalls": {
+                "count": lag['stalls'], "seconds": lag['stall_time'],
+                "top_sites": [{"site": site, "count": entry['count'], "seconds": entry['total']} for site, entry in lag['offenders'][:5]],
+            },
+            "crash_detection_latency_seconds": summarize(crash_detections),
+            "restarts": {
+                "succeeded": len(restart_durations),
+                "failed": len(restart_failures),
+                "duration_seconds": summarize(restart_durations),
+                "per_second_while_restarting": len(restart_durations) / sum(restart_durations) if restart_durations else 0.0,
+                "per_minute": 60 * len(restart_durations) / wall,
+            },
+            "bots_alive_at_end": alive,
+            "log_bytes_collected": log_bytes,
+        }
+
+    threading.Thread(target=sample_rss, daemon=True).start()
+    try:
+        result = asyncio.run(scenario())
+    finally:
+        sampling.set()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bots", type=int, nargs="+", default=[10, 100], help="fleet sizes to run, e.g. 10 100 500")
+    parser.add_argument("--duration", type=float, default=75.0, help="seconds to supervise each fleet (monitor_bots runs every 30s)")
+    parser.add_argument("--lines-per-second", type=float, default=2.0, help="stdout lines each stub prints per second")
+    parser.add_argument("--line-bytes", type=int, default=100)
+    parser.add_argument("--crashes-per-minute", type=float, default=0.2, help="mean crash rate of each stub")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds the fake Bot API waits before answering")
+    parser.add_argument("--output", default="supervisor_benchmark.json")
+    parser.add_argument("--scenario", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--api-url", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        args.bots = args.bots[0]
+        run_scenario(args)
+        return
+
+    api = FakeBotAPI(latency=args.api_latency).start()
+    results = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("scenario", "api_url", "output")},
+        "scenarios": [],
+    }
+    try:
+        for bots in args.bots:
+            print(f"Supervising {bots} stub bots for {args.duration:.0f}s...", file=sys.stderr)
+            command = [
+                sys.executable, os.path.abspath(__file__), "--scenario", "--bots", str(bots),
+                "--duration", str(args.duration), "--lines-per-second", str(args.lines_per_second),
+                "--line-bytes", str(args.line_bytes), "--crashes-per-minute", str(args.crashes_per_minute),
+                "--api-url", api.url,
+            ]
+            worker = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+            if worker.returncode != 0:
+                raise SystemExit(f"Scenario with {bots} bots failed (exit code {worker.returncode})")
+            scenario = json.loads(worker.stdout.strip().splitlines()[-1])
+            scenario["fake_api_calls"] = api.count_calls()
+            api.calls.clear()
+            results["scenarios"].append(scenario)
+    finally:
+        api.stop()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,14 +5,35 @@ import asyncio
 import json
 import time
 import signal
+import socket
+import threading
 import tempfile
 import shutil
 import zipfile
-import io
 import math
+import mmap
+import re
+import hashlib
+import hmac
+import struct
+import bisect
+import contextvars
+import types
+import sys
+import sysconfig
+import traceback
+import codecs
+import importlib.util
+import zlib
+from stat import S_ISLNK
 import fcntl
-import psutil
+from collections import deque
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from typing import Union, Dict, Any, Optional, List, Tuple
 from telegram import (
     Update,
@@ -26,6 +47,7 @@ from telegram import (
 )
 from telegram.ext import (
     Application,
+    BaseRateLimiter,
     CommandHandler,
     CallbackQueryHandler,
     ContextTypes,
@@ -34,7 +56,37 @@ from telegram.ext import (
     filters,
 )
 from telegram.constants import ParseMode
-from telegram.error import BadRequest, TelegramError
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+class LazyModule(types.ModuleType):
+    """Stands in for a module that is imported the first time one of its attributes is used.
+
+    importlib's LazyLoader is not thread-safe before Python 3.12, and these modules are first touched from
+    worker threads, so the real import happens under a lock.
+    """
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lazy_lock = threading.Lock()
+        self._lazy_module = None
+
+    def __getattr__(self, attr: str):
+        module = self._lazy_module
+        if module is None:
+            with self._lazy_lock:
+                if self._lazy_module is None:
+                    self._lazy_module = importlib.import_module(self.__name__)
+                module = self._lazy_module
+        return getattr(module, attr)
+
+def lazy_import(name: str):
+    """Returns module `name`, deferring its actual import until one of its attributes is first used."""
+    return sys.modules.get(name) or LazyModule(name)
+
+# Only the monitor and the health screens need psutil, only snapshots need multiprocessing, and httpx is
+# only used for media downloads and the Bot API proxy, so none of them is loaded while the manager boots
+psutil = lazy_import("psutil")
+multiprocessing = lazy_import("multiprocessing")
+httpx = lazy_import("httpx")
 
 # --- Basic Setup ---
 logging.basicConfig(
@@ -50,12 +102,28 @@ if not TOKEN:
     exit(1)
 
 RENDER_EXTERNAL_URL = os.environ.get("RENDER_EXTERNAL_URL", "https://your-app-name.onrender.com")
+# Webhook mode for the manager bot (served by app.py); polling stays the default
+MANAGER_WEBHOOK = os.environ.get("MANAGER_WEBHOOK", "").lower() in ("1", "true", "yes")
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", RENDER_EXTERNAL_URL)
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or hashlib.sha256(f"webhook:{TOKEN}".encode('utf-8')).hexdigest()
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", 40))
+WEBHOOK_CONCURRENT_UPDATES = int(os.environ.get("WEBHOOK_CONCURRENT_UPDATES", 16))
+# Bearer token required by the /metrics endpoint of app.py; without one, /metrics only answers local requests
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+# Lets the manager talk to a local or fake Bot API server, e.g. http://127.0.0.1:8081/bot
+TELEGRAM_API_BASE_URL = os.environ.get("TELEGRAM_API_BASE_URL")
 USERS_FILE = "data/users.json"
 DATA_DIR = "data"
 BOTS_DIR = "data/bots"
 MIRROR_DIR = "data/mirror"
 TEMPLATES_DIR = "data/templates"
 LOGS_DIR = "data/logs"
+MIRROR_INDEX_FILE = "data/mirror_index.json"
+SNAPSHOTS_DIR = "data/snapshots"
+REQUIREMENTS_CACHE_FILE = "data/requirements_cache.json"
+MEDIA_DIR = "data/media"
+MEDIA_CACHE_FILE = "data/media_cache.json"
+LIFECYCLE_TRACE_FILE = "data/lifecycle_traces.json"
 
 # --- Create directories if they don't exist ---
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -63,6 +131,8 @@ os.makedirs(BOTS_DIR, exist_ok=True)
 os.makedirs(MIRROR_DIR, exist_ok=True)
 os.makedirs(TEMPLATES_DIR, exist_ok=True)
 os.makedirs(LOGS_DIR, exist_ok=True)
+os.makedirs(SNAPSHOTS_DIR, exist_ok=True)
+os.makedirs(MEDIA_DIR, exist_ok=True)
 
 # --- Load user configuration ---
 try:
@@ -75,6 +145,34 @@ try:
         ALLOWED_FILE_TYPES = users_config.get("bot_settings", {}).get("allowed_file_types", [".py"])
         AUTO_RESTART_BOTS = users_config.get("bot_settings", {}).get("auto_restart_bots", True)
         LOG_RETENTION_DAYS = users_config.get("bot_settings", {}).get("log_retention_days", 7)
+        MIRROR_WORKERS = users_config.get("bot_settings", {}).get("mirror_workers", 2)
+        MIRROR_MAX_QUEUED_PER_USER = users_config.get("bot_settings", {}).get("mirror_max_queued_per_user", 10)
+        MIRROR_MIN_FREE_DISK = users_config.get("bot_settings", {}).get("mirror_min_free_disk", 524288000)  # 500MB
+        MIRROR_PROGRESS_INTERVAL = users_config.get("bot_settings", {}).get("mirror_progress_interval", 3)
+        MIRROR_STORAGE_QUOTA = users_config.get("bot_settings", {}).get("mirror_storage_quota", 2147483648)  # 2GB
+        MIRROR_DEFAULT_TTL_HOURS = users_config.get("bot_settings", {}).get("mirror_default_ttl_hours", 168)
+        MIRROR_SWEEP_INTERVAL = users_config.get("bot_settings", {}).get("mirror_sweep_interval", 600)
+        ARCHIVE_COMPRESSION_LEVEL = users_config.get("bot_settings", {}).get("archive_compression_level", 6)
+        ARCHIVE_EXCLUDE_DIRS = users_config.get("bot_settings", {}).get("archive_exclude_dirs", ["venv", ".venv", "env", "__pycache__", ".cache", ".git", "node_modules"])
+        LOG_MAX_BYTES_PER_BOT = users_config.get("bot_settings", {}).get("log_max_bytes_per_bot", 52428800)  # 50MB
+        LOG_MAX_TOTAL_BYTES = users_config.get("bot_settings", {}).get("log_max_total_bytes", 524288000)  # 500MB
+        LOG_SEGMENT_MAX_BYTES = users_config.get("bot_settings", {}).get("log_segment_max_bytes", 10485760)  # 10MB
+        LOG_RETENTION_INTERVAL = users_config.get("bot_settings", {}).get("log_retention_interval", 3600)
+        SNAPSHOT_INTERVAL_HOURS = users_config.get("bot_settings", {}).get("snapshot_interval_hours", 24)
+        SNAPSHOT_RETENTION_COUNT = users_config.get("bot_settings", {}).get("snapshot_retention_count", 7)
+        SNAPSHOT_WORKERS = users_config.get("bot_settings", {}).get("snapshot_workers", 0)  # 0 = one per CPU core
+        WEBHOOK_INGRESS = users_config.get("bot_settings", {}).get("webhook_ingress", False)
+        BOT_API_PROXY = users_config.get("bot_settings", {}).get("bot_api_proxy", False)
+        BOT_API_PROXY_PORT = users_config.get("bot_settings", {}).get("bot_api_proxy_port", 8081)
+        BOT_API_PROXY_MAX_CONCURRENCY = users_config.get("bot_settings", {}).get("bot_api_proxy_max_concurrency", 8)  # concurrent requests per bot token
+        SHARED_RUNTIME = users_config.get("bot_settings", {}).get("shared_runtime", False)  # Run opted-in bots as Applications inside one shared worker process
+        SHARED_RUNTIME_MAX_BOTS = users_config.get("bot_settings", {}).get("shared_runtime_max_bots", 50)
+        FILESYSTEM_WORKERS = users_config.get("bot_settings", {}).get("filesystem_workers", 4)  # Threads for handler file I/O
+        SLOW_CALL_WARNING_MS = users_config.get("bot_settings", {}).get("slow_call_warning_ms", 0)  # Log every callback that blocks the event loop this long (asyncio debug mode), 0 to disable
+        LOOP_LAG_THRESHOLD_MS = users_config.get("bot_settings", {}).get("loop_lag_threshold_ms", 200)  # Capture the blocking stack when the event loop lags this long, 0 to disable
+        LOG_RATE_LIMIT = users_config.get("bot_settings", {}).get("log_rate_limit", 262144)  # Bytes per second of output kept per bot, 0 disables
+        LOG_RATE_BURST = users_config.get("bot_settings", {}).get("log_rate_burst", 4194304)
+        LOG_SAMPLE_EVERY = users_config.get("bot_settings", {}).get("log_sample_every", 100)  # Over the limit, keep one line in this many
 except (FileNotFoundError, json.JSONDecodeError):
     AUTHORIZED_USERS = [5431714552, 6392830471]
     MAX_BOTS_PER_USER = 5
@@ -83,6 +181,34 @@ except (FileNotFoundError, json.JSONDecodeError):
     ALLOWED_FILE_TYPES = [".py"]
     AUTO_RESTART_BOTS = True
     LOG_RETENTION_DAYS = 7
+    MIRROR_WORKERS = 2
+    MIRROR_MAX_QUEUED_PER_USER = 10
+    MIRROR_MIN_FREE_DISK = 524288000  # 500MB
+    MIRROR_PROGRESS_INTERVAL = 3
+    MIRROR_STORAGE_QUOTA = 2147483648  # 2GB
+    MIRROR_DEFAULT_TTL_HOURS = 168
+    MIRROR_SWEEP_INTERVAL = 600
+    ARCHIVE_COMPRESSION_LEVEL = 6
+    ARCHIVE_EXCLUDE_DIRS = ["venv", ".venv", "env", "__pycache__", ".cache", ".git", "node_modules"]
+    LOG_MAX_BYTES_PER_BOT = 52428800  # 50MB
+    LOG_MAX_TOTAL_BYTES = 524288000  # 500MB
+    LOG_SEGMENT_MAX_BYTES = 10485760  # 10MB
+    LOG_RETENTION_INTERVAL = 3600
+    SNAPSHOT_INTERVAL_HOURS = 24
+    SNAPSHOT_RETENTION_COUNT = 7
+    SNAPSHOT_WORKERS = 0
+    WEBHOOK_INGRESS = False
+    BOT_API_PROXY = False
+    BOT_API_PROXY_PORT = 8081
+    BOT_API_PROXY_MAX_CONCURRENCY = 8
+    SHARED_RUNTIME = False
+    SHARED_RUNTIME_MAX_BOTS = 50
+    FILESYSTEM_WORKERS = 4
+    SLOW_CALL_WARNING_MS = 0
+    LOOP_LAG_THRESHOLD_MS = 200
+    LOG_RATE_LIMIT = 262144
+    LOG_RATE_BURST = 4194304
+    LOG_SAMPLE_EVERY = 100
     
     default_config = {
         "authorized_users": AUTHORIZED_USERS,
@@ -92,7 +218,35 @@ except (FileNotFoundError, json.JSONDecodeError):
             "max_mirror_file_size": MAX_MIRROR_FILE_SIZE,
             "allowed_file_types": ALLOWED_FILE_TYPES,
             "auto_restart_bots": AUTO_RESTART_BOTS,
-            "log_retention_days": LOG_RETENTION_DAYS
+            "log_retention_days": LOG_RETENTION_DAYS,
+            "mirror_workers": MIRROR_WORKERS,
+            "mirror_max_queued_per_user": MIRROR_MAX_QUEUED_PER_USER,
+            "mirror_min_free_disk": MIRROR_MIN_FREE_DISK,
+            "mirror_progress_interval": MIRROR_PROGRESS_INTERVAL,
+            "mirror_storage_quota": MIRROR_STORAGE_QUOTA,
+            "mirror_default_ttl_hours": MIRROR_DEFAULT_TTL_HOURS,
+            "mirror_sweep_interval": MIRROR_SWEEP_INTERVAL,
+            "archive_compression_level": ARCHIVE_COMPRESSION_LEVEL,
+            "archive_exclude_dirs": ARCHIVE_EXCLUDE_DIRS,
+            "log_max_bytes_per_bot": LOG_MAX_BYTES_PER_BOT,
+            "log_max_total_bytes": LOG_MAX_TOTAL_BYTES,
+            "log_segment_max_bytes": LOG_SEGMENT_MAX_BYTES,
+            "log_retention_interval": LOG_RETENTION_INTERVAL,
+            "snapshot_interval_hours": SNAPSHOT_INTERVAL_HOURS,
+            "snapshot_retention_count": SNAPSHOT_RETENTION_COUNT,
+            "snapshot_workers": SNAPSHOT_WORKERS,
+            "webhook_ingress": WEBHOOK_INGRESS,
+            "bot_api_proxy": BOT_API_PROXY,
+            "bot_api_proxy_port": BOT_API_PROXY_PORT,
+            "bot_api_proxy_max_concurrency": BOT_API_PROXY_MAX_CONCURRENCY,
+            "shared_runtime": SHARED_RUNTIME,
+            "shared_runtime_max_bots": SHARED_RUNTIME_MAX_BOTS,
+            "filesystem_workers": FILESYSTEM_WORKERS,
+            "slow_call_warning_ms": SLOW_CALL_WARNING_MS,
+            "loop_lag_threshold_ms": LOOP_LAG_THRESHOLD_MS,
+            "log_rate_limit": LOG_RATE_LIMIT,
+            "log_rate_burst": LOG_RATE_BURST,
+            "log_sample_every": LOG_SAMPLE_EVERY
         }
     }
     with open(USERS_FILE, 'w') as f:
@@ -129,7 +283,37 @@ BOT_TEMPLATES = {
 
 # --- Global State ---
 running_bots: Dict[str, Dict[str, Any]] = {}
+reserved_bot_names: set = set()  # Bots being deployed or restored that are not in running_bots yet
 bot_monitor_task = None
+# The event loop the manager bot runs on, for handing work over from the web server's threads
+event_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Mirror ingest queue: pending jobs per user, served round-robin by a pool of workers
+mirror_pending_jobs: Dict[int, deque] = {}
+mirror_user_order: deque = deque()
+mirror_active_jobs: Dict[str, Dict[str, Any]] = {}
+mirror_queue_condition: Optional[asyncio.Condition] = None
+mirror_worker_tasks: List[asyncio.Task] = []
+mirror_reserved_bytes = 0
+
+# Mirror storage index: file name -> size, creation time, TTL and last access
+mirror_index: Dict[str, Dict[str, Any]] = {}
+mirror_index_lock = threading.Lock()
+mirror_access_times: Dict[str, float] = {}
+mirror_sweeper_task = None
+snapshot_scheduler_task = None
+
+# Log segment index: bot name -> segments (oldest first) with their path, size and last write time
+log_segments: Dict[str, List[Dict[str, Any]]] = {}
+log_segments_lock = threading.Lock()
+# Per-bot lock around a running bot's log file, its line index and the output drained into them: the event
+# loop drains and rotates logs while the lifecycle thread writes the stop marker and closes the segment
+log_file_locks: Dict[str, threading.RLock] = {}
+log_retention_task = None
+log_retention_stats = {'last_run': None, 'last_files': 0, 'last_bytes': 0, 'total_files': 0, 'total_bytes': 0}
+
+# Live log tails: bot name -> shared subscription with its viewers, recent lines and polling task
+log_tails: Dict[str, Dict[str, Any]] = {}
 
 # --- URLs ---
 LOADING_ANIMATION_URL = "https://media.tenor.com/25ykirk3P4YAAAAd/loading-gif.gif"
@@ -138,46 +322,49 @@ START_IMAGE_URL = "https://media.tenor.com/25ykirk3P4YAAAAd/loading-gif.gif"
 # --- UI Elements (Emojis & Keyboards) ---
 class EMOJI:
     SPARKLES = "\u2728"
-    ROBOT = "\ud83e\udd16"
-    CLIPBOARD = "\ud83d\udccb"
-    BAR_CHART = "\ud83d\udcca"
+    ROBOT = "\U0001f916"
+    CLIPBOARD = "\U0001f4cb"
+    BAR_CHART = "\U0001f4ca"
     QUESTION = "\u2753"
-    UPLOAD = "\ud83d\udce4"
-    SNAKE = "\ud83d\udc0d"
-    MEMO = "\ud83d\udcdd"
-    KEY = "\ud83d\udd11"
+    UPLOAD = "\U0001f4e4"
+    SNAKE = "\U0001f40d"
+    MEMO = "\U0001f4dd"
+    KEY = "\U0001f511"
     BACK = "\u2b05\ufe0f"
     STOP = "\u23f9\ufe0f"
-    RESTART = "\ud83d\udd04"
-    LOGS = "\ud83d\udcc4"
+    RESTART = "\U0001f504"
+    LOGS = "\U0001f4c4"
     CANCEL = "\u274c"
     SUCCESS = "\u2705"
     LOADING = "\u23f3"
-    ROCKET = "\ud83d\ude80"
-    PACKAGE = "\ud83d\udce6"
-    PARTY = "\ud83c\udf89"
+    ROCKET = "\U0001f680"
+    PACKAGE = "\U0001f4e6"
+    PARTY = "\U0001f389"
     INFO = "\u2139\ufe0f"
-    GREEN_CIRCLE = "\ud83d\udfe2"
-    RED_CIRCLE = "\ud83d\udd34"
+    GREEN_CIRCLE = "\U0001f7e2"
+    RED_CIRCLE = "\U0001f534"
     GEAR = "\u2699\ufe0f"
-    DELETE = "\ud83d\uddd1\ufe0f"
+    DELETE = "\U0001f5d1\ufe0f"
     DOWNLOAD = "\u2b07\ufe0f"
     WARNING = "\u26a0\ufe0f"
-    FILE = "\ud83d\udcc4"
-    CODE = "\ud83d\udc68\u200d\ud83d\udcbb"
-    WRENCH = "\ud83d\udd27"
-    MIRROR = "\ud83e\ude9e"
-    STORAGE = "\ud83d\udcbe"
-    TEMPLATE = "\ud83d\udcdd" # This is the corrected line
+    FILE = "\U0001f4c4"
+    CODE = "\U0001f468\u200d\U0001f4bb"
+    WRENCH = "\U0001f527"
+    MIRROR = "\U0001fa9e"
+    STORAGE = "\U0001f4be"
+    TEMPLATE = "\U0001f4dd" # This is the corrected line
     HEALTH = "\u2764\ufe0f"
-    SEARCH = "\ud83d\udd0d"
-    FILTER = "\ud83d\udd0e"
-    BACKUP = "\ud83d\udcbe"
+    SEARCH = "\U0001f50d"
+    FILTER = "\U0001f50e"
+    BACKUP = "\U0001f4be"
     RESTORE = "\u267b\ufe0f"
     PLAY_ALL = "\u25b6\ufe0f"
     STOP_ALL = "\u23f9\ufe0f"
-    CLEAN = "\ud83e\uddf9"
+    CLEAN = "\U0001f9f9"
     STAR = "\u2b50"
+    LIVE = "\U0001f4e1"
+    TIMER = "\u23f1\ufe0f"
+    SLEEP = "\U0001f4a4"
 
 # --- Keyboard Generation Functions ---
 def get_main_menu_keyboard():
@@ -186,7 +373,8 @@ def get_main_menu_keyboard():
          InlineKeyboardButton(f"{EMOJI.TEMPLATE} Use Template", callback_data='template_list')],
         [InlineKeyboardButton(f"{EMOJI.CLIPBOARD} My Bots", callback_data='list_bots')],
         [InlineKeyboardButton(f"{EMOJI.BAR_CHART} Statistics & Storage", callback_data='stats')],
-        [InlineKeyboardButton(f"{EMOJI.MIRROR} Mirror File", callback_data='mirror_start')],
+        [InlineKeyboardButton(f"{EMOJI.MIRROR} Mirror File", callback_data='mirror_start'),
+         InlineKeyboardButton(f"{EMOJI.RESTORE} Restore Backup", callback_data='restore_start')],
         [InlineKeyboardButton(f"{EMOJI.GEAR} Settings", callback_data='settings'), 
          InlineKeyboardButton(f"{EMOJI.QUESTION} Help", callback_data='help')]
     ]
@@ -200,13 +388,40 @@ def get_main_menu_keyboard():
 
 def get_stats_keyboard():
     keyboard = [
-        [InlineKeyboardButton(f"{EMOJI.HEALTH} System Health", callback_data='system_health')],
-        [InlineKeyboardButton(f"{EMOJI.MIRROR} Manage Mirror", callback_data='manage_mirror')],
+        [InlineKeyboardButton(f"{EMOJI.HEALTH} System Health", callback_data='system_health'),
+         InlineKeyboardButton(f"{EMOJI.TIMER} Event Loop", callback_data='loop_health')],
+        [InlineKeyboardButton(f"{EMOJI.ROCKET} Performance", callback_data='perf_stats'),
+         InlineKeyboardButton(f"{EMOJI.MIRROR} Manage Mirror", callback_data='manage_mirror')],
         [InlineKeyboardButton(f"{EMOJI.CLEAN} Clean Logs", callback_data='clean_logs')],
+        [InlineKeyboardButton(f"{EMOJI.SEARCH} Search Logs", callback_data='log_search'),
+         InlineKeyboardButton(f"{EMOJI.BACKUP} Snapshots", callback_data='snap_list')],
         [InlineKeyboardButton(f"{EMOJI.BACK} Main Menu", callback_data='main_menu')]
     ]
     return InlineKeyboardMarkup(keyboard)
 
+def get_snapshot_list_keyboard(snapshot_ids: List[str]):
+    keyboard = [[InlineKeyboardButton(f"{EMOJI.BACKUP} Take Snapshot Now", callback_data='snap_now')]]
+    for snapshot_id in snapshot_ids[:10]:
+        keyboard.append([InlineKeyboardButton(f"{EMOJI.RESTORE} {snapshot_id}", callback_data=f'snap_view:{snapshot_id}')])
+    keyboard.append([InlineKeyboardButton(f"{EMOJI.BACK} Back to Stats", callback_data='stats')])
+    return InlineKeyboardMarkup(keyboard)
+
+def get_snapshot_keyboard(snapshot_id: str, bot_names: List[str]):
+    # Bots are referred to by their position in the manifest, as long names would not fit in callback data
+    keyboard = [[InlineKeyboardButton(f"{EMOJI.RESTORE} Restore All Bots", callback_data=f'snap_rc:{snapshot_id}:*')]]
+    for position, bot_name in enumerate(bot_names):
+        keyboard.append([InlineKeyboardButton(f"{EMOJI.RESTORE} Restore {bot_name}", callback_data=f'snap_rc:{snapshot_id}:{position}')])
+    keyboard.append([InlineKeyboardButton(f"{EMOJI.BACK} Back to Snapshots", callback_data='snap_list')])
+    return InlineKeyboardMarkup(keyboard)
+
+def get_snapshot_restore_confirmation_keyboard(snapshot_id: str, target: str):
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton(f"{EMOJI.WARNING} Yes, Restore", callback_data=f'snap_r:{snapshot_id}:{target}'),
+            InlineKeyboardButton(f"{EMOJI.CANCEL} No, Cancel", callback_data=f'snap_view:{snapshot_id}')
+        ]
+    ])
+
 def get_mirror_management_keyboard(mirror_size_gb: float):
     keyboard = []
     if mirror_size_gb > 0:
@@ -224,12 +439,21 @@ def get_delete_all_mirror_confirmation_keyboard():
     ])
 
 def get_bot_actions_keyboard(bot_name: str):
-    is_running = running_bots.get(bot_name) and running_bots[bot_name]['process'].poll() is None
+    bot_info = running_bots.get(bot_name, {})
+    is_running = bot_info and bot_info['process'].poll() is None
     first_row = [InlineKeyboardButton(f"{EMOJI.RESTART} Restart", callback_data=f'bot_action:restart:{bot_name}')]
     if is_running:
         first_row.insert(0, InlineKeyboardButton(f"{EMOJI.STOP} Stop", callback_data=f'bot_action:stop:{bot_name}'))
     else:
         first_row.insert(0, InlineKeyboardButton(f"{EMOJI.PLAY_ALL} Start", callback_data=f'bot_action:start:{bot_name}'))
+    runtime_row = []
+    if SHARED_RUNTIME:
+        runtime_label = "Run as Own Process" if bot_info.get('shared_runtime') else "Run in Shared Runtime"
+        runtime_row.append([InlineKeyboardButton(f"{EMOJI.WRENCH} {runtime_label}", callback_data=f'bot_action:runtime:{bot_name}')])
+    if WEBHOOK_INGRESS:
+        minutes = bot_info.get('hibernate_minutes', 0)
+        hibernate_label = f"after {minutes} min idle" if minutes else "never"
+        runtime_row.append([InlineKeyboardButton(f"{EMOJI.SLEEP} Hibernate: {hibernate_label}", callback_data=f'bot_action:hibernate:{bot_name}')])
     return InlineKeyboardMarkup([
         first_row,
         [
@@ -237,9 +461,12 @@ def get_bot_actions_keyboard(bot_name: str):
             InlineKeyboardButton(f"{EMOJI.DOWNLOAD} Download Code", callback_data=f'bot_action:download:{bot_name}')
         ],
         [InlineKeyboardButton(f"{EMOJI.LOGS} View Logs", callback_data=f'bot_action:logs:{bot_name}'),
+         InlineKeyboardButton(f"{EMOJI.SEARCH} Search Logs", callback_data=f'log_search:{bot_name}')],
+        [InlineKeyboardButton(f"{EMOJI.LIVE} Live Tail", callback_data=f'tail_start:{bot_name}'),
          InlineKeyboardButton(f"{EMOJI.HEALTH} Resource Usage", callback_data=f'bot_action:resources:{bot_name}')],
         [InlineKeyboardButton(f"{EMOJI.BACKUP} Backup Bot", callback_data=f'bot_action:backup:{bot_name}'),
          InlineKeyboardButton(f"{EMOJI.CODE} Edit Code", callback_data=f'bot_action:edit:{bot_name}')],
+        *runtime_row,
         [InlineKeyboardButton(f"{EMOJI.BACK} Back to Bot List", callback_data='list_bots')]
     ])
 
@@ -278,12 +505,580 @@ def get_template_action_keyboard(template_id: str):
         [InlineKeyboardButton(f"{EMOJI.BACK} Back to Templates", callback_data='template_list')]
     ])
 
+def get_mirror_queue_keyboard(ttl_hours: Optional[int] = None):
+    keyboard = []
+    if ttl_hours is not None:
+        keyboard.append([
+            InlineKeyboardButton(f"{EMOJI.SUCCESS if hours == ttl_hours else ''} {format_mirror_ttl(hours)}".strip(), callback_data=f'mirror_ttl:{hours}')
+            for hours in MIRROR_TTL_CHOICES
+        ])
+    keyboard.append([
+        InlineKeyboardButton(f"{EMOJI.SUCCESS} Done", callback_data='mirror_done'),
+        InlineKeyboardButton(f"{EMOJI.CANCEL} Cancel", callback_data='cancel_operation')
+    ])
+    return InlineKeyboardMarkup(keyboard)
+
+def get_log_search_results_keyboard(page: int, has_more: bool):
+    nav_row = []
+    if page > 0:
+        nav_row.append(InlineKeyboardButton(f"{EMOJI.BACK} Newer", callback_data=f'log_search_page:{page - 1}'))
+    if has_more:
+        nav_row.append(InlineKeyboardButton("Older \u27a1\ufe0f", callback_data=f'log_search_page:{page + 1}'))
+    keyboard = [nav_row] if nav_row else []
+    keyboard.append([InlineKeyboardButton(f"{EMOJI.SEARCH} New Search", callback_data='log_search')])
+    keyboard.append([InlineKeyboardButton(f"{EMOJI.BACK} Back to Stats", callback_data='stats')])
+    return InlineKeyboardMarkup(keyboard)
+
+def get_log_page_keyboard(bot_name: str, segment_pos: int, page: int, total_pages: int, segment_count: int):
+    nav_row = []
+    if page > 0:
+        nav_row.append(InlineKeyboardButton(f"{EMOJI.BACK} Newer", callback_data=f'logs_page:{segment_pos}:{page - 1}:{bot_name}'))
+    elif segment_pos > 0:
+        nav_row.append(InlineKeyboardButton(f"{EMOJI.BACK} Newer", callback_data=f'logs_page:{segment_pos - 1}:-1:{bot_name}'))
+    if page < total_pages - 1:
+        nav_row.append(InlineKeyboardButton("Older \u27a1\ufe0f", callback_data=f'logs_page:{segment_pos}:{page + 1}:{bot_name}'))
+    elif segment_pos < segment_count - 1:
+        nav_row.append(InlineKeyboardButton("Older \u27a1\ufe0f", callback_data=f'logs_page:{segment_pos + 1}:0:{bot_name}'))
+    keyboard = [nav_row] if nav_row else []
+    keyboard.append([InlineKeyboardButton(f"{EMOJI.RESTART} Latest", callback_data=f'logs_page:0:0:{bot_name}')])
+    keyboard.append([InlineKeyboardButton(f"{EMOJI.BACK} Back to Bot", callback_data=f'select_bot:{bot_name}')])
+    return InlineKeyboardMarkup(keyboard)
+
+def get_log_tail_keyboard(bot_name: str, live: bool = True):
+    if live:
+        control = InlineKeyboardButton(f"{EMOJI.STOP} Stop Tail", callback_data=f'tail_stop:{bot_name}')
+    else:
+        control = InlineKeyboardButton(f"{EMOJI.LIVE} Resume Tail", callback_data=f'tail_resume:{bot_name}')
+    return InlineKeyboardMarkup([
+        [control],
+        [InlineKeyboardButton(f"{EMOJI.BACK} Back to Bot", callback_data=f'select_bot:{bot_name}')]
+    ])
+
 def get_edit_code_keyboard(bot_name: str):
     return InlineKeyboardMarkup([
         [InlineKeyboardButton(f"{EMOJI.SUCCESS} Save Changes", callback_data=f'save_code:{bot_name}')],
         [InlineKeyboardButton(f"{EMOJI.CANCEL} Cancel", callback_data=f'select_bot:{bot_name}')]
     ])
 
+# --- Outbound Rate Limiting ---
+# Every Bot API call goes through OutboundRateLimiter. Requests to a chat are sent one at a time and in
+# order, spending a token from the chat's bucket and from the global bucket, so bursts (bulk start/stop,
+# progress updates) are spread out instead of running into Telegram's flood limits.
+OUTBOUND_GLOBAL_RATE = 25
+OUTBOUND_CHAT_RATE = 1
+OUTBOUND_GROUP_RATE = 20 / 60
+OUTBOUND_CHAT_BURST = 3
+OUTBOUND_MAX_RETRIES = 3
+OUTBOUND_UNTHROTTLED_ENDPOINTS = {'answerCallbackQuery', 'deleteMessage', 'sendChatAction', 'getFile'}
+OUTBOUND_COALESCED_ENDPOINTS = {'editMessageText', 'editMessageCaption', 'editMessageMedia', 'editMessageReplyMarkup'}
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `capacity`; `blocked_until` holds it empty after a flood wait."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self) -> float:
+        """Returns how long to wait before a token is available (0 if one is available now)."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+class OutboundRateLimiter(BaseRateLimiter):
+    """Per-chat and global throttling for outgoing requests, with RetryAfter handling and edit coalescing.
+
+    An edit that is still waiting when a newer edit of the same message is queued is dropped, so only the
+    latest state of a message is ever sent. The dropped edit returns the result of the edit that replaced it.
+    """
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_RATE)
+        self.chat_buckets: Dict[Any, TokenBucket] = {}
+        self.chat_locks: Dict[Any, asyncio.Lock] = {}
+        self.edit_generations: Dict[Tuple[str, Any, Any], int] = {}
+        self.edit_waiters: Dict[Tuple[str, Any, Any], List[Tuple[int, asyncio.Future]]] = {}
+        self.stats = {'sent': 0, 'throttled': 0, 'coalesced': 0, 'flood_waits': 0}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            # Private chats have positive ids; groups and channels are limited to about 20 messages a minute
+            is_private = isinstance(chat_id, int) and chat_id > 0
+            bucket = TokenBucket(OUTBOUND_CHAT_RATE if is_private else OUTBOUND_GROUP_RATE, OUTBOUND_CHAT_BURST)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _call(self, callback, args, kwargs, endpoint: str, bucket: Optional[TokenBucket] = None):
+        """Makes the request, waiting out RetryAfter errors up to OUTBOUND_MAX_RETRIES times."""
+        for attempt in range(OUTBOUND_MAX_RETRIES + 1):
+            try:
+                result = await callback(*args, **kwargs)
+                self.stats['sent'] += 1
+                return result
+            except RetryAfter as e:
+                self.stats['flood_waits'] += 1
+                if attempt == OUTBOUND_MAX_RETRIES:
+                    raise
+                logger.warning(f"Flood limit hit on {endpoint}, retrying in {e.retry_after}s.")
+                if bucket is None:
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                bucket.blocked_until = time.monotonic() + e.retry_after
+                await self._wait_for_tokens(bucket)
+
+    async def _wait_for_tokens(self, bucket: TokenBucket, superseded=lambda: False) -> bool:
+        """Waits for a token in both the chat's and the global bucket; False if the request was superseded."""
+        throttled = False
+        while True:
+            if superseded():
+                self.stats['coalesced'] += 1
+                return False
+            delay = max(bucket.delay(), self.global_bucket.delay())
+            if delay <= 0:
+                bucket.take()
+                self.global_bucket.take()
+                return True
+            if not throttled:
+                throttled = True
+                self.stats['throttled'] += 1
+            await asyncio.sleep(delay)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        timing = handler_timing.get()
+        if timing is None:
+            return await self._throttle_request(callback, args, kwargs, endpoint, data)
+        # Charge the time spent on Telegram, throttling included, to the handler that made the call
+        started = time.perf_counter()
+        try:
+            return await self._throttle_request(callback, args, kwargs, endpoint, data)
+        finally:
+            timing['api'] += time.perf_counter() - started
+
+    async def _throttle_request(self, callback, args, kwargs, endpoint: str, data: Dict[str, Any]):
+        chat_id = data.get('chat_id')
+        if chat_id is None or endpoint in OUTBOUND_UNTHROTTLED_ENDPOINTS:
+            return await self._call(callback, args, kwargs, endpoint)
+
+        edit_key, generation = None, 0
+        if endpoint in OUTBOUND_COALESCED_ENDPOINTS and data.get('message_id') is not None:
+            edit_key = (endpoint, chat_id, data['message_id'])
+            generation = self.edit_generations.get(edit_key, 0) + 1
+            self.edit_generations[edit_key] = generation
+        superseded = lambda: edit_key is not None and self.edit_generations.get(edit_key) != generation
+
+        lock = self.chat_locks.setdefault(chat_id, asyncio.Lock())
+        try:
+            async with lock:
+                bucket = self._chat_bucket(chat_id)
+                if await self._wait_for_tokens(bucket, superseded):
+                    try:
+                        result = await self._call(callback, args, kwargs, endpoint, bucket)
+                    except BaseException as e:
+                        self._settle_superseded_edits(edit_key, generation, error=e)
+                        raise
+                    self._settle_superseded_edits(edit_key, generation, result)
+                    return result
+                # A newer edit of this message is queued behind us and carries the latest state, so answer with its result
+                waiter = asyncio.get_running_loop().create_future()
+                self.edit_waiters.setdefault(edit_key, []).append((generation, waiter))
+        finally:
+            if edit_key is not None and self.edit_generations.get(edit_key) == generation:
+                del self.edit_generations[edit_key]
+        return await waiter
+
+    def _settle_superseded_edits(self, edit_key, generation: int, result: Any = None, error: Optional[BaseException] = None):
+        """Hands the outcome of a sent edit to the older edits of the same message it replaced."""
+        if edit_key is None or edit_key not in self.edit_waiters:
+            return
+        waiters = self.edit_waiters.pop(edit_key)
+        newer = [(waiter_generation, waiter) for waiter_generation, waiter in waiters if waiter_generation > generation]
+        if newer:
+            self.edit_waiters[edit_key] = newer
+        for waiter_generation, waiter in waiters:
+            if waiter_generation > generation or waiter.done():
+                continue
+            if isinstance(error, asyncio.CancelledError):
+                waiter.cancel()
+            elif error is not None:
+                waiter.set_exception(error)
+            else:
+                waiter.set_result(result)
+
+# --- Async Filesystem ---
+# Handlers do their file I/O through these helpers, which run it on a small dedicated thread pool so one slow
+# disk operation doesn't hold up every other user. Anything else that blocks the event loop too long is logged.
+filesystem_executor = ThreadPoolExecutor(max_workers=FILESYSTEM_WORKERS, thread_name_prefix='bothoster-fs')
+
+async def fs_call(func, *args, **kwargs):
+    """Runs a blocking filesystem function on the filesystem pool."""
+    return await asyncio.get_running_loop().run_in_executor(filesystem_executor, partial(func, *args, **kwargs))
+
+def _read_text_file(path: str) -> Optional[str]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def _read_bytes_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _write_bytes_file(path: str, data: bytes):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def _write_text_file(path: str, text: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def _scan_dir(path: str) -> List[os.DirEntry]:
+    try:
+        with os.scandir(path) as entries:
+            # stat() is cached on the entry, so callers can sort and display without touching the disk again
+            return [entry for entry in entries if entry.is_file() and entry.stat()]
+    except FileNotFoundError:
+        return []
+
+async def fs_read_text(path: str) -> Optional[str]:
+    """Reads a UTF-8 text file; None if it doesn't exist."""
+    return await fs_call(_read_text_file, path)
+
+async def fs_read_bytes(path: str) -> bytes:
+    return await fs_call(_read_bytes_file, path)
+
+async def fs_write_text(path: str, text: str):
+    await fs_call(_write_text_file, path, text)
+
+async def fs_exists(path: str) -> bool:
+    return await fs_call(os.path.exists, path)
+
+async def fs_remove_tree(path: str):
+    await fs_call(shutil.rmtree, path, ignore_errors=True)
+
+async def fs_scan_dir(path: str) -> List[os.DirEntry]:
+    """Lists the files in a directory with their stat results already loaded."""
+    return await fs_call(_scan_dir, path)
+
+# Starting, stopping and restarting bots blocks on process management, pip, compiling and the shared runtime's
+# control socket. Every caller on the event loop runs these operations on one lifecycle thread, so they never
+# stall the loop and never overlap each other. The thread may update a bot's entry, but running_bots only gains
+# and loses entries on the event loop.
+lifecycle_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bothoster-lifecycle')
+
+async def lifecycle_call(func, *args, **kwargs):
+    """Runs a blocking bot lifecycle function on the lifecycle thread, inside the caller's lifecycle trace."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(lifecycle_executor, partial(context.run, func, *args, **kwargs))
+
+def enable_slow_call_warning(threshold_ms: int):
+    """Turns on asyncio's debug mode, which logs every event loop callback that runs longer than threshold_ms.
+
+    Debug mode adds overhead to every callback and coroutine, so this is off by default; the loop watchdog below
+    already reports stalls with the stack that caused them.
+    """
+    loop = asyncio.get_running_loop()
+    loop.slow_callback_duration = threshold_ms / 1000
+    loop.set_debug(True)
+
+# --- Event Loop Watchdog ---
+# A heartbeat task measures how late the event loop wakes it up. When it is late by more than
+# LOOP_LAG_THRESHOLD_MS, a helper thread grabs the stack of the loop thread, which is still inside the
+# blocking call, and the stall is attributed to the innermost bot.py frame once the loop recovers.
+LOOP_LAG_INTERVAL = 0.1
+LOOP_WATCHDOG_POLL = 0.02
+LOOP_LAG_SAMPLES = 3000  # Five minutes of heartbeats
+LOOP_STACK_DEPTH = 8
+
+loop_lag_samples: deque = deque(maxlen=LOOP_LAG_SAMPLES)
+loop_heartbeat = {'time': 0.0, 'lag': 0.0, 'thread_id': None}
+loop_stall_stats = {'stalls': 0, 'stall_time': 0.0, 'max_lag': 0.0}
+loop_offenders: Dict[str, Dict[str, Any]] = {}
+loop_watchdog_lock = threading.Lock()
+loop_watchdog_thread: Optional[threading.Thread] = None
+
+async def measure_loop_lag():
+    loop_heartbeat['thread_id'] = threading.get_ident()
+    while True:
+        expected = time.monotonic() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        now = time.monotonic()
+        lag = max(0.0, now - expected)
+        loop_lag_samples.append(lag)
+        loop_heartbeat['lag'] = lag
+        loop_heartbeat['time'] = now
+
+def describe_blocking_frame(frame) -> Tuple[str, str]:
+    """Returns (site, stack) for the loop thread's current frame.
+
+    The site is the innermost frame of our own code (bot.py, else anything outside the standard library and
+    installed packages), followed by the library function it was blocked in.
+    """
+    stack = traceback.extract_stack(frame)
+    library_paths = tuple({sysconfig.get_path('stdlib'), sysconfig.get_path('purelib'), sysconfig.get_path('platlib')})
+    own_frames = [entry for entry in stack if entry.filename == __file__]
+    own_frames = own_frames or [entry for entry in stack if not entry.filename.startswith(library_paths)]
+    site_frame = own_frames[-1] if own_frames else stack[-1]
+    site = f"{site_frame.name} ({os.path.basename(site_frame.filename)}:{site_frame.lineno})"
+    if site_frame is not stack[-1]:
+        site += f" -> {stack[-1].name}"
+    stack_text = "".join(traceback.format_list(stack[-LOOP_STACK_DEPTH:]))
+    return site, stack_text
+
+def record_loop_stall(site: str, stack_text: str, duration: float):
+    with loop_watchdog_lock:
+        loop_stall_stats['stalls'] += 1
+        loop_stall_stats['stall_time'] += duration
+        loop_stall_stats['max_lag'] = max(loop_stall_stats['max_lag'], duration)
+        offender = loop_offenders.setdefault(site, {'count': 0, 'total': 0.0, 'max': 0.0, 'stack': stack_text})
+        offender['count'] += 1
+        offender['total'] += duration
+        if duration >= offender['max']:
+            offender['max'] = duration
+            offender['stack'] = stack_text
+    logger.warning(f"Event loop stalled for {duration * 1000:.0f} ms in {site}")
+
+def run_loop_watchdog():
+    threshold = LOOP_LAG_INTERVAL + LOOP_LAG_THRESHOLD_MS / 1000
+    stalled = None
+    while True:
+        time.sleep(LOOP_WATCHDOG_POLL)
+        beat = loop_heartbeat['time']
+        if not beat:
+            continue
+        if stalled is None:
+            if time.monotonic() - beat > threshold:
+                frame = sys._current_frames().get(loop_heartbeat['thread_id'])
+                if frame is not None:
+                    stalled = (beat, *describe_blocking_frame(frame))
+        elif loop_heartbeat['time'] != stalled[0]:
+            # The heartbeat that ended the stall has recorded how late it was
+            record_loop_stall(stalled[1], stalled[2], loop_heartbeat['lag'])
+            stalled = None
+
+def start_loop_watchdog():
+    global loop_watchdog_thread
+    asyncio.create_task(measure_loop_lag())
+    if LOOP_LAG_THRESHOLD_MS and loop_watchdog_thread is None:
+        loop_watchdog_thread = threading.Thread(target=run_loop_watchdog, name='loop-watchdog', daemon=True)
+        loop_watchdog_thread.start()
+
+def get_loop_lag_summary() -> Dict[str, Any]:
+    samples = sorted(loop_lag_samples)
+    percentile = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+    with loop_watchdog_lock:
+        offenders = sorted(((site, dict(entry)) for site, entry in loop_offenders.items()), key=lambda item: item[1]['total'], reverse=True)
+        return {
+            'current': loop_heartbeat['lag'],
+            'p50': percentile(0.5),
+            'p99': percentile(0.99),
+            'window_max': samples[-1] if samples else 0.0,
+            **loop_stall_stats,
+            'offenders': offenders,
+        }
+
+def reset_loop_watchdog():
+    loop_lag_samples.clear()
+    with loop_watchdog_lock:
+        loop_offenders.clear()
+        loop_stall_stats.update(stalls=0, stall_time=0.0, max_lag=0.0)
+
+# --- Lifecycle Tracing ---
+# Deploys, starts, restarts and stops record how long each of their steps took, so a slow deploy shows where
+# the time went. The active trace lives in a context variable; spans opened while it is set add to its
+# breakdown, and an operation started inside another (the start within a restart) is folded into the outer one.
+LIFECYCLE_TRACE_HISTORY = 20
+FIRST_OUTPUT_MARKER = ".first_output"
+LIFECYCLE_SPAN_LABELS = {
+    'download': "download", 'compile': "compile", 'unload': "unload", 'terminate': "terminate", 'backoff': "backoff",
+    'write_code': "write", 'pip': "pip", 'spawn': "spawn", 'first_output': "first output"
+}
+
+lifecycle_traces: Dict[str, deque] = {}
+lifecycle_traces_lock = threading.Lock()
+current_lifecycle_trace: contextvars.ContextVar = contextvars.ContextVar('current_lifecycle_trace', default=None)
+
+def load_lifecycle_traces():
+    try:
+        with open(LIFECYCLE_TRACE_FILE, 'r') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return
+    with lifecycle_traces_lock:
+        for bot_name, traces in data.items():
+            lifecycle_traces[bot_name] = deque(traces, maxlen=LIFECYCLE_TRACE_HISTORY)
+
+def save_lifecycle_traces():
+    with lifecycle_traces_lock:
+        temp_path = f"{LIFECYCLE_TRACE_FILE}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({bot_name: list(traces) for bot_name, traces in lifecycle_traces.items()}, f, indent=2)
+        os.replace(temp_path, LIFECYCLE_TRACE_FILE)
+
+def forget_lifecycle_traces(bot_name: str):
+    with lifecycle_traces_lock:
+        lifecycle_traces.pop(bot_name, None)
+    save_lifecycle_traces()
+
+@contextmanager
+def lifecycle_span(name: str):
+    """Adds the time spent in the block to the active trace, if there is one."""
+    trace = current_lifecycle_trace.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace['spans'][name] = trace['spans'].get(name, 0.0) + time.perf_counter() - started
+
+@contextmanager
+def lifecycle_trace(bot_name: str, operation: str, carried_spans: Optional[Dict[str, float]] = None):
+    """Traces a lifecycle operation and stores it when it ends. Yields the trace; set trace['ok'] on failure.
+
+    carried_spans are steps timed before the operation began (e.g. the upload of a deploy) and count towards its total.
+    """
+    outer = current_lifecycle_trace.get()
+    if outer is not None:
+        yield outer
+        return
+    trace = {
+        'operation': operation, 'started': datetime.now().isoformat(timespec='seconds'),
+        'total': 0.0, 'spans': dict(carried_spans or {}), 'ok': True
+    }
+    token = current_lifecycle_trace.set(trace)
+    started = time.perf_counter()
+    try:
+        yield trace
+    except BaseException:
+        trace['ok'] = False
+        raise
+    finally:
+        current_lifecycle_trace.reset(token)
+        trace['total'] = time.perf_counter() - started + sum((carried_spans or {}).values())
+        with lifecycle_traces_lock:
+            lifecycle_traces.setdefault(bot_name, deque(maxlen=LIFECYCLE_TRACE_HISTORY)).append(trace)
+        save_lifecycle_traces()
+
+def traced_lifecycle(operation: str):
+    """Decorator tracing a lifecycle function that takes the bot name first and returns a falsy value on failure."""
+    def decorator(func):
+        @wraps(func)
+        def wrapped(bot_name: str, *args, **kwargs):
+            with lifecycle_trace(bot_name, operation) as trace:
+                result = func(bot_name, *args, **kwargs)
+                if not result:
+                    trace['ok'] = False
+                return result
+        return wrapped
+    return decorator
+
+def check_first_output(bot_name: str, has_output: bool = False):
+    """Completes the 'first output' span of a freshly started bot once it has written anything.
+
+    The shim notes when the bot first wrote; bots without the marker (shared runtime) use the time their output was read.
+    """
+    bot_info = running_bots.get(bot_name)
+    trace = bot_info.get('first_output_trace') if bot_info else None
+    if trace is None:
+        return
+    try:
+        with open(os.path.join(bot_info['bot_dir'], FIRST_OUTPUT_MARKER), 'r') as f:
+            first_output_at = float(f.read())
+    except (OSError, ValueError):
+        if not has_output:
+            return
+        first_output_at = time.time()
+    bot_info.pop('first_output_trace', None)
+    trace['spans']['first_output'] = max(0.0, first_output_at - bot_info['start_time'].timestamp())
+    save_lifecycle_traces()
+
+def format_lifecycle_trace(trace: Dict[str, Any]) -> str:
+    """e.g. "14.2s (download 0.3s, compile 0.1s, pip 12.9s, spawn 0.0s, first output 1.6s)"."""
+    order = list(LIFECYCLE_SPAN_LABELS)
+    spans = sorted(trace['spans'].items(), key=lambda item: order.index(item[0]) if item[0] in order else len(order))
+    text = f"{trace['total']:.1f}s"
+    if spans:
+        text += " (" + ", ".join(f"{LIFECYCLE_SPAN_LABELS.get(name, name)} {seconds:.1f}s" for name, seconds in spans) + ")"
+    if not trace.get('ok', True):
+        text += ", failed"
+    return text
+
+def get_last_lifecycle_trace(bot_name: str, operations: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+    with lifecycle_traces_lock:
+        for trace in reversed(lifecycle_traces.get(bot_name, ())):
+            if trace['operation'] in operations:
+                return trace
+    return None
+
+# --- Log Flood Protection ---
+# A bot stuck in a print loop must not fill the manager's memory and disk. Each bot's output passes a
+# token bucket of LOG_RATE_LIMIT bytes per second (bursts up to LOG_RATE_BURST). Over the limit only one
+# line in LOG_SAMPLE_EVERY is kept, and a marker records how much was dropped. The pipe is still drained,
+# so the bot itself never blocks on its output.
+LOG_MEMORY_TAIL = 256 * 1024  # Characters of recent output kept in memory; older output is in the log files
+
+log_ingest_stats: Dict[str, Dict[str, int]] = {}
+
+def limit_log_output(bot_name: str, bot_info: Dict[str, Any], output: str) -> str:
+    """Returns the part of output that fits the bot's log rate limit, with a marker for what was dropped.
+
+    The limit and the stats count UTF-8 bytes, as written to the log files.
+    """
+    size = len(output) if output.isascii() else len(output.encode('utf-8'))
+    stats = log_ingest_stats.setdefault(bot_name, {'read_bytes': 0, 'dropped_lines': 0, 'dropped_bytes': 0})
+    stats['read_bytes'] += size
+    if not LOG_RATE_LIMIT:
+        return output
+
+    now = time.monotonic()
+    bucket = bot_info.setdefault('log_bucket', {'tokens': float(LOG_RATE_BURST), 'updated': now, 'sampled': 0})
+    bucket['tokens'] = min(float(LOG_RATE_BURST), bucket['tokens'] + (now - bucket['updated']) * LOG_RATE_LIMIT)
+    bucket['updated'] = now
+    if size <= bucket['tokens']:
+        bucket['tokens'] -= size
+        return output
+
+    # Keep the whole lines that still fit, then sample the rest
+    data = output.encode('utf-8')
+    cut_bytes = data.rfind(b'\n', 0, int(bucket['tokens'])) + 1
+    bucket['tokens'] -= cut_bytes
+    cut = len(data[:cut_bytes].decode('utf-8'))
+    rest = output[cut:].splitlines(keepends=True)
+    if LOG_SAMPLE_EVERY:
+        sampled = rest[LOG_SAMPLE_EVERY - 1 - bucket['sampled'] % LOG_SAMPLE_EVERY::LOG_SAMPLE_EVERY]
+        bucket['sampled'] += len(rest)
+    else:
+        sampled = []
+    dropped_lines = len(rest) - len(sampled)
+    if not dropped_lines:
+        return output
+    dropped_bytes = size - cut_bytes - sum(len(line.encode('utf-8')) for line in sampled)
+    stats['dropped_lines'] += dropped_lines
+    stats['dropped_bytes'] += dropped_bytes
+    marker = f"--- {dropped_lines} lines ({format_bytes(dropped_bytes)}) dropped: over the log rate limit of {format_bytes(LOG_RATE_LIMIT)}/s ---\n"
+    if sampled and not sampled[-1].endswith('\n'):
+        marker = "\n" + marker
+    return output[:cut] + "".join(sampled) + marker
+
+def forget_log_ingest_stats(bot_name: str):
+    log_ingest_stats.pop(bot_name, None)
+
 # --- Helper Functions ---
 async def edit_or_reply_message(update: Update, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None, photo_url: Optional[str] = None, use_animation: bool = False):
     try:
@@ -339,28 +1134,161 @@ async def edit_or_reply_message(update: Update, text: str, reply_markup: Optiona
             logger.error(f"Error in edit_or_reply_message: {e}")
             await update.effective_chat.send_message(text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup, disable_web_page_preview=True)
 
-async def send_loading_animation(context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str):
+async def send_loading_animation(context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
     """Sends a loading animation with a text message."""
-    return await context.bot.send_animation(
+    return await send_media_asset(
+        context.bot.send_animation,
+        LOADING_ANIMATION_URL,
         chat_id=chat_id,
-        animation=LOADING_ANIMATION_URL,
         caption=text,
-        parse_mode=ParseMode.MARKDOWN
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=reply_markup
     )
 
+# --- Media Assets ---
+# The loading animation and start image are downloaded once into MEDIA_DIR and uploaded from there. The
+# file_id Telegram returns is kept in MEDIA_CACHE_FILE (keyed by source URL) and reused for every later
+# send, so Telegram never has to fetch the remote GIF again. A rejected file_id triggers a re-upload.
+MEDIA_MAX_SIZE = 20 * 1024 * 1024
+media_file_ids: Dict[str, str] = {}
+media_locks: Dict[str, asyncio.Lock] = {}
+
+def load_media_cache():
+    try:
+        with open(MEDIA_CACHE_FILE, 'r') as f:
+            media_file_ids.update(json.load(f))
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+
+def save_media_cache(cache: Dict[str, str]):
+    temp_path = f"{MEDIA_CACHE_FILE}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(cache, f, indent=4)
+    os.replace(temp_path, MEDIA_CACHE_FILE)
+
+def get_media_path(url: str) -> str:
+    extension = os.path.splitext(url.split('?', 1)[0])[1] or '.gif'
+    return os.path.join(MEDIA_DIR, hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + extension)
+
+async def fetch_media_asset(url: str) -> Optional[str]:
+    """Returns the local copy of a media asset, downloading it on first use."""
+    local_path = get_media_path(url)
+    if await fs_exists(local_path):
+        return local_path
+    temp_path = f"{local_path}.part"
+    try:
+        async with httpx.AsyncClient(timeout=httpx.Timeout(15.0), follow_redirects=True) as client:
+            async with client.stream('GET', url) as response:
+                response.raise_for_status()
+                size = 0
+                f = await fs_call(open, temp_path, 'wb')
+                try:
+                    async for chunk in response.aiter_bytes():
+                        size += len(chunk)
+                        if size > MEDIA_MAX_SIZE:
+                            raise ValueError(f"asset is larger than {format_bytes(MEDIA_MAX_SIZE)}")
+                        await fs_call(f.write, chunk)
+                finally:
+                    await fs_call(f.close)
+        await fs_call(os.replace, temp_path, local_path)
+        return local_path
+    except Exception as e:
+        logger.warning(f"Could not cache media asset {url}: {e}")
+        if await fs_exists(temp_path):
+            await fs_call(os.remove, temp_path)
+        return None
+
+async def send_media_asset(send_animation, url: str, **kwargs):
+    """Sends a media asset with `send_animation` (e.g. `bot.send_animation` or `message.reply_animation`).
+
+    Uses the cached file_id when there is one, otherwise uploads the local copy (or, if it could not be
+    downloaded, lets Telegram fetch the URL) and caches the file_id of the result.
+    """
+    file_id = media_file_ids.get(url)
+    if file_id:
+        try:
+            return await send_animation(animation=file_id, **kwargs)
+        except BadRequest as e:
+            if "file" not in str(e).lower():
+                raise
+            logger.warning(f"Telegram rejected the cached file_id for {url} ({e}), uploading it again.")
+            if media_file_ids.get(url) == file_id:
+                del media_file_ids[url]
+
+    async with media_locks.setdefault(url, asyncio.Lock()):
+        # Another send may have uploaded the asset while we waited
+        if url in media_file_ids:
+            return await send_animation(animation=media_file_ids[url], **kwargs)
+        local_path = await fetch_media_asset(url)
+        if local_path:
+            message = await send_animation(animation=await fs_read_bytes(local_path), filename=os.path.basename(local_path), **kwargs)
+        else:
+            message = await send_animation(animation=url, **kwargs)
+        media = message.animation or message.document or message.video
+        if media:
+            media_file_ids[url] = media.file_id
+            await fs_call(save_media_cache, dict(media_file_ids))
+        return message
+
+def reserve_bot_name(bot_name: str) -> bool:
+    """Claims the name of a bot that is about to be created; False if a bot or another deploy or restore has it.
+
+    Only call it on the event loop, so the check and the claim cannot interleave with another caller's.
+    """
+    if bot_name in running_bots or bot_name in reserved_bot_names:
+        return False
+    reserved_bot_names.add(bot_name)
+    return True
+
 def create_bot_directory(bot_name: str) -> str:
     bot_dir = os.path.join(BOTS_DIR, bot_name)
     os.makedirs(bot_dir, exist_ok=True)
     return bot_dir
 
+# Requirement sets are installed into the shared interpreter, so a set that installed cleanly once
+# does not need another pip run when a bot is restarted or restored.
+requirements_cache_lock = threading.Lock()
+
+def get_requirements_hash(requirements_content: str) -> str:
+    """Hashes a requirements file, ignoring comments, blank lines and line order."""
+    lines = sorted(
+        line.strip() for line in requirements_content.splitlines()
+        if line.strip() and not line.strip().startswith('#')
+    )
+    return hashlib.sha256("\n".join(lines).encode('utf-8')).hexdigest()
+
+def _load_requirements_cache() -> Dict[str, str]:
+    try:
+        with open(REQUIREMENTS_CACHE_FILE, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def is_requirements_installed(requirements_hash: str) -> bool:
+    with requirements_cache_lock:
+        return requirements_hash in _load_requirements_cache()
+
+def mark_requirements_installed(requirements_hash: str):
+    with requirements_cache_lock:
+        cache = _load_requirements_cache()
+        cache[requirements_hash] = datetime.now().isoformat()
+        with open(REQUIREMENTS_CACHE_FILE, 'w') as f:
+            json.dump(cache, f, indent=2)
+
 def create_log_file(bot_name: str) -> str:
     """Create a log file for the bot and return the path."""
     log_dir = os.path.join(LOGS_DIR, bot_name)
     os.makedirs(log_dir, exist_ok=True)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     log_file = os.path.join(log_dir, f"{timestamp}.log")
+    suffix = 1
+    while os.path.exists(log_file):
+        log_file = os.path.join(log_dir, f"{timestamp}_{suffix}.log")
+        suffix += 1
+    register_log_segment(bot_name, log_file)
     return log_file
 
+@traced_lifecycle('start')
 def start_bot_subprocess(bot_name: str, bot_token: str, bot_code: str, requirements_content: Optional[str] = None) -> Optional[Dict[str, Any]]:
     try:
         bot_dir = create_bot_directory(bot_name)
@@ -376,49 +1304,73 @@ def start_bot_subprocess(bot_name: str, bot_token: str, bot_code: str, requireme
             # If no TOKEN variable is found, add it at the top of the file
             modified_code = f"TOKEN = \"{bot_token}\"\n{bot_code}"
         
-        with open(bot_file_path, 'w', encoding='utf-8') as f:
-            f.write(modified_code)
+        with lifecycle_span('write_code'):
+            write_bot_code(bot_file_path, modified_code)
         
         if requirements_content:
             requirements_path = os.path.join(bot_dir, "requirements.txt")
             with open(requirements_path, 'w', encoding='utf-8') as f:
                 f.write(requirements_content)
             
-            logger.info(f"Installing requirements for {bot_name}...")
+            requirements_hash = get_requirements_hash(requirements_content)
             with open(log_file_path, 'a') as log_file:
-                log_file.write(f"--- Installing requirements at {datetime.now().isoformat()} ---\n")
-                pip_process = subprocess.run(
-                    ['pip', 'install', '-r', requirements_path],
-                    capture_output=True, text=True, cwd=bot_dir
-                )
-                log_file.write(pip_process.stdout)
-                if pip_process.returncode != 0:
-                    log_file.write(f"ERROR: {pip_process.stderr}\n")
-                    logger.error(f"Failed to install requirements for {bot_name}. Stderr: {pip_process.stderr}")
+                if is_requirements_installed(requirements_hash):
+                    logger.info(f"Requirements for {bot_name} unchanged, reusing installed environment.")
+                    log_file.write(f"--- Requirements {requirements_hash[:12]} already installed, skipping pip ---\n")
+                else:
+                    logger.info(f"Installing requirements for {bot_name}...")
+                    log_file.write(f"--- Installing requirements at {datetime.now().isoformat()} ---\n")
+                    with lifecycle_span('pip'):
+                        pip_process = subprocess.run(
+                            ['pip', 'install', '-r', requirements_path],
+                            capture_output=True, text=True, cwd=bot_dir
+                        )
+                    log_file.write(pip_process.stdout)
+                    if pip_process.returncode != 0:
+                        log_file.write(f"ERROR: {pip_process.stderr}\n")
+                        logger.error(f"Failed to install requirements for {bot_name}. Stderr: {pip_process.stderr}")
+                    else:
+                        mark_requirements_installed(requirements_hash)
         
         # Open log file for the process
-        log_file = open(log_file_path, 'a')
+        log_file = open(log_file_path, 'a', encoding='utf-8')
         log_file.write(f"--- Bot started at {datetime.now().isoformat()} ---\n")
+        log_file.flush()
+        log_index = build_log_index(log_file_path)
         
-        process = subprocess.Popen(
-            ['python3', 'bot.py'],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            cwd=bot_dir,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            preexec_fn=os.setsid,
-            bufsize=1
-        )
-        
-        logger.info(f"Started subprocess for bot '{bot_name}' with PID {process.pid}.")
+        first_output_marker = os.path.join(bot_dir, FIRST_OUTPUT_MARKER)
+        if os.path.exists(first_output_marker):
+            os.remove(first_output_marker)
         
-        # Make stdout non-blocking
-        if process.stdout:
-            fd = process.stdout.fileno()
-            fl = fcntl.fcntl(fd, fcntl.F_GETFL)
-            fcntl.fcntl(fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
+        shared = is_shared_runtime_bot(bot_name)
+        if SHARED_RUNTIME and shared:
+            with lifecycle_span('spawn'):
+                process = load_into_shared_runtime(bot_name, bot_dir)
+            logger.info(f"Handed bot '{bot_name}' to the shared runtime (PID {process.pid}).")
+        else:
+            env = prepare_bot_shim(bot_name, bot_token, bot_dir)
+            env['BOTHOSTER_FIRST_OUTPUT_FILE'] = os.path.abspath(first_output_marker)
+            with lifecycle_span('spawn'):
+                process = subprocess.Popen(
+                    ['python3', BOT_SHIM_NAME, 'bot.py'],
+                    env=env,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    cwd=bot_dir,
+                    text=True,
+                    encoding='utf-8',
+                    errors='replace',
+                    preexec_fn=os.setsid,
+                    bufsize=1
+                )
+            
+            logger.info(f"Started subprocess for bot '{bot_name}' with PID {process.pid}.")
+            
+            # Make stdout non-blocking
+            if process.stdout:
+                fd = process.stdout.fileno()
+                fl = fcntl.fcntl(fd, fcntl.F_GETFL)
+                fcntl.fcntl(fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
         
         return {
             'process': process,
@@ -428,47 +1380,62 @@ def start_bot_subprocess(bot_name: str, bot_token: str, bot_code: str, requireme
             'logs': "",
             'log_file': log_file,
             'log_file_path': log_file_path,
+            'log_index': log_index,
             'restart_count': 0,
             'last_restart': None,
             'cpu_usage': 0.0,
-            'memory_usage': 0.0
+            'memory_usage': 0.0,
+            'first_output_trace': current_lifecycle_trace.get(),
+            # Per-bot settings from marker files, kept here so keyboards and the monitor don't read the disk
+            'shared_runtime': shared,
+            'hibernate_minutes': get_hibernate_minutes(bot_name)
         }
     except Exception as e:
         logger.error(f"Failed to start subprocess for {bot_name}: {e}", exc_info=True)
         return None
 
+@traced_lifecycle('stop')
 def stop_bot_process(bot_name: str) -> bool:
     if bot_name in running_bots:
-        process = running_bots[bot_name]['process']
-        log_file = running_bots[bot_name].get('log_file')
+        bot_info = running_bots[bot_name]
+        bot_info.pop('hibernation', None)
+        process = bot_info['process']
         
-        if process.poll() is None:
+        if isinstance(process, SharedRuntimeBot):
+            if process.poll() is None:
+                with lifecycle_span('unload'):
+                    process.unload()
+                logger.info(f"Unloaded bot {bot_name} from the shared runtime.")
+                update_bot_logs(bot_name)
+                write_log_marker(bot_name, bot_info, f"--- Bot stopped at {datetime.now().isoformat()} ---\n")
+        elif process.poll() is None:
             logger.info(f"Stopping process group for bot {bot_name} with PGID {process.pid}...")
             try:
-                os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-                process.wait(timeout=5)
+                with lifecycle_span('terminate'):
+                    os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+                    process.wait(timeout=5)
                 logger.info(f"Terminated process group for bot {bot_name}.")
                 
                 # Log the termination
-                if log_file and not log_file.closed:
-                    log_file.write(f"--- Bot stopped at {datetime.now().isoformat()} ---\n")
-                    log_file.flush()
+                write_log_marker(bot_name, bot_info, f"--- Bot stopped at {datetime.now().isoformat()} ---\n")
             except subprocess.TimeoutExpired:
                 logger.warning(f"Process group for {bot_name} did not terminate in time. Killing...")
                 os.killpg(os.getpgid(process.pid), signal.SIGKILL)
-                if log_file and not log_file.closed:
-                    log_file.write(f"--- Bot forcefully killed at {datetime.now().isoformat()} ---\n")
-                    log_file.flush()
+                write_log_marker(bot_name, bot_info, f"--- Bot forcefully killed at {datetime.now().isoformat()} ---\n")
             except ProcessLookupError:
                 logger.info(f"Process for bot {bot_name} already terminated.")
         
         # Close the log file if it's open
-        if log_file and not log_file.closed:
-            log_file.close()
+        with get_log_lock(bot_name):
+            log_file = bot_info.get('log_file')
+            if log_file and not log_file.closed:
+                log_file.close()
+            finalize_log_segment(bot_name, bot_info.get('log_file_path'))
             
         return True
     return False
 
+@traced_lifecycle('start')
 def start_bot_process(bot_name: str) -> bool:
     """Start a previously stopped bot."""
     if bot_name in running_bots:
@@ -500,6 +1467,7 @@ def start_bot_process(bot_name: str) -> bool:
             return True
     return False
 
+@traced_lifecycle('restart')
 def restart_bot_process(bot_name: str) -> bool:
     if bot_name in running_bots:
         bot_info = running_bots[bot_name]
@@ -522,7 +1490,8 @@ def restart_bot_process(bot_name: str) -> bool:
         
         logger.info(f"Attempting to restart bot: {bot_name}")
         stop_bot_process(bot_name)
-        time.sleep(2)
+        with lifecycle_span('backoff'):
+            time.sleep(2)
         
         new_bot_info = start_bot_subprocess(bot_name, bot_token, bot_code, requirements_content)
         if new_bot_info:
@@ -533,24 +1502,59 @@ def restart_bot_process(bot_name: str) -> bool:
             return True
     return False
 
+def get_log_lock(bot_name: str) -> threading.RLock:
+    lock = log_file_locks.get(bot_name)
+    if lock is None:
+        lock = log_file_locks.setdefault(bot_name, threading.RLock())
+    return lock
+
+def write_log_marker(bot_name: str, bot_info: Dict[str, Any], marker: str):
+    with get_log_lock(bot_name):
+        log_file = bot_info.get('log_file')
+        if log_file and not log_file.closed:
+            log_file.write(marker)
+            log_file.flush()
+
 def update_bot_logs(bot_name: str):
-    if bot_name in running_bots:
-        bot_info = running_bots[bot_name]
+    bot_info = running_bots.get(bot_name)
+    if bot_info is None:
+        return
+    with get_log_lock(bot_name):
         process = bot_info['process']
         log_file = bot_info.get('log_file')
         
         if process.stdout:
             try:
                 output = process.stdout.read()
+                check_first_output(bot_name, bool(output))
                 if output:
-                    running_bots[bot_name]['logs'] += output
+                    output = limit_log_output(bot_name, bot_info, output)
+                    bot_info['logs'] = (bot_info['logs'] + output)[-LOG_MEMORY_TAIL:]
+                    publish_log_output(bot_name, output)
                     # Also write to the log file
                     if log_file and not log_file.closed:
                         log_file.write(output)
                         log_file.flush()
+                        append_log_index(bot_info, output)
+                        if log_file.tell() >= LOG_SEGMENT_MAX_BYTES:
+                            rotate_bot_log(bot_name)
             except (TypeError, IOError):
                 pass
 
+def rotate_bot_log(bot_name: str):
+    """Closes the bot's current log segment and continues in a fresh one."""
+    bot_info = running_bots[bot_name]
+    with get_log_lock(bot_name):
+        log_file = bot_info.get('log_file')
+        if log_file and not log_file.closed:
+            log_file.close()
+        finalize_log_segment(bot_name, bot_info.get('log_file_path'))
+
+        log_file_path = create_log_file(bot_name)
+        bot_info['log_file'] = open(log_file_path, 'a', encoding='utf-8')
+        bot_info['log_file_path'] = log_file_path
+        bot_info['log_index'] = build_log_index(log_file_path)
+
 def get_bot_logs(bot_name: str, max_lines: int = 100) -> str:
     """Get logs for a bot, either from memory or from log files."""
     if bot_name in running_bots:
@@ -597,12 +1601,527 @@ def get_bot_logs(bot_name: str, max_lines: int = 100) -> str:
 async def download_file(bot: Bot, file_id: str, destination_path: str) -> bool:
     try:
         file = await bot.get_file(file_id)
-        await file.download_to_drive(destination_path)
+        data = await file.download_as_bytearray()
+        await fs_call(_write_bytes_file, destination_path, data)
+        return True
+    except Exception as e:
+        logger.error(f"Error downloading file {file_id}: {e}")
+        return False
+
+async def download_file_with_progress(bot: Bot, file_id: str, destination_path: str, progress_callback=None) -> bool:
+    """Streams a Telegram file to disk in chunks, reporting (downloaded, total) to progress_callback."""
+    temp_path = f"{destination_path}.part"
+    try:
+        file = await bot.get_file(file_id)
+        # Local Bot API servers hand out filesystem paths, which cannot be streamed over HTTP
+        if not file.file_path or not file.file_path.startswith(('http://', 'https://')):
+            await file.download_to_drive(destination_path)
+            return True
+
+        downloaded = 0
+        async with httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=60.0)) as client:
+            async with client.stream('GET', file.file_path) as response:
+                response.raise_for_status()
+                total = int(response.headers.get('Content-Length') or file.file_size or 0)
+                f = await fs_call(open, temp_path, 'wb')
+                try:
+                    async for chunk in response.aiter_bytes(MIRROR_CHUNK_SIZE):
+                        await fs_call(f.write, chunk)
+                        downloaded += len(chunk)
+                        if progress_callback:
+                            await progress_callback(downloaded, total)
+                finally:
+                    await fs_call(f.close)
+        await fs_call(os.replace, temp_path, destination_path)
         return True
     except Exception as e:
         logger.error(f"Error downloading file {file_id}: {e}")
+        if await fs_exists(temp_path):
+            await fs_call(os.remove, temp_path)
         return False
 
+def format_progress_bar(fraction: float, width: int = 10) -> str:
+    """Renders a fraction between 0 and 1 as a text progress bar."""
+    filled = int(round(max(0.0, min(1.0, fraction)) * width))
+    return "\u2588" * filled + "\u2591" * (width - filled)
+
+# --- Pre-flight Compile ---
+# Uploaded and edited code is compiled in a separate interpreter before it is accepted, so syntax errors are
+# reported in the chat instead of turning into a crash-restart loop. bot.py is compiled again whenever the
+# code written for a start changes, into a hash-checked .pyc that the shim loads on every later start.
+PREFLIGHT_TIMEOUT = 30
+PREFLIGHT_SCRIPT = r'''
+import json, os, py_compile, sys
+try:
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            py_compile.compile(path, dfile=os.path.abspath(path), doraise=True, invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH)
+    else:
+        compile(sys.stdin.buffer.read(), "bot.py", "exec", dont_inherit=True)
+except (SyntaxError, ValueError, py_compile.PyCompileError) as e:
+    error = getattr(e, "exc_value", e)
+    print(json.dumps({"type": type(error).__name__, "msg": getattr(error, "msg", str(error)), "line": getattr(error, "lineno", None),
+                      "offset": getattr(error, "offset", None), "text": getattr(error, "text", None)}))
+    sys.exit(1)
+'''
+
+def format_compile_error(error: Dict[str, Any]) -> str:
+    """Formats a compile error from the pre-flight script as a chat message."""
+    location = f" on line {error['line']}" if error.get('line') else ""
+    text = f"{EMOJI.CANCEL} *{error['type']}*{location}: {error['msg']}".replace('`', "'")
+    if error.get('text'):
+        line = error['text'].rstrip('\n').replace('`', "'")
+        caret = f"\n{' ' * (error['offset'] - 1)}^" if error.get('offset') else ""
+        text += f"\n```\n{line}{caret}\n```"
+    return text
+
+async def preflight_compile(code: str) -> Optional[str]:
+    """Compiles code with the interpreter bots run on; returns an error message for the chat, or None if it compiles."""
+    process = await asyncio.create_subprocess_exec(
+        'python3', '-c', PREFLIGHT_SCRIPT,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(code.encode('utf-8')), PREFLIGHT_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return f"{EMOJI.WARNING} Compiling the code took longer than {PREFLIGHT_TIMEOUT}s."
+    if process.returncode == 0:
+        return None
+    try:
+        return format_compile_error(json.loads(stdout))
+    except (ValueError, KeyError, TypeError):
+        # The compiler itself failed (out of memory, crashed), so the code is not known to compile
+        logger.error(f"Pre-flight compile failed unexpectedly (exit code {process.returncode}): {stderr.decode('utf-8', errors='replace')}")
+        return f"{EMOJI.WARNING} The code could not be checked because the compiler failed (exit code {process.returncode}). Please try again."
+
+def write_bot_code(bot_file_path: str, code: str):
+    """Writes bot.py and its bytecode, leaving both untouched when the code has not changed.
+
+    Called from start_bot_subprocess, so the compile runs on the lifecycle thread. Bytecode only saves the bot
+    a compile at startup: if it fails or times out, the bot is still started from bot.py.
+    """
+    try:
+        with open(bot_file_path, 'r', encoding='utf-8') as f:
+            if f.read() == code and os.path.exists(importlib.util.cache_from_source(bot_file_path)):
+                return
+    except (OSError, UnicodeDecodeError):
+        pass
+    with open(bot_file_path, 'w', encoding='utf-8') as f:
+        f.write(code)
+    try:
+        compile_result = subprocess.run(
+            ['python3', '-c', PREFLIGHT_SCRIPT, bot_file_path],
+            capture_output=True, text=True, timeout=PREFLIGHT_TIMEOUT
+        )
+    except subprocess.TimeoutExpired:
+        logger.warning(f"Compiling {bot_file_path} took longer than {PREFLIGHT_TIMEOUT}s, starting it without bytecode.")
+        return
+    if compile_result.returncode != 0:
+        logger.warning(f"Could not compile {bot_file_path}: {compile_result.stdout or compile_result.stderr}")
+
+# --- Mirror Ingest Queue ---
+MIRROR_CHUNK_SIZE = 256 * 1024
+MIRROR_DISK_RETRY_SECONDS = 10
+MIRROR_DISK_WAIT_TIMEOUT = 600
+
+def mirror_queue_length() -> int:
+    return sum(len(jobs) for jobs in mirror_pending_jobs.values())
+
+def get_mirror_disk_shortfall(size: int, reserved: int) -> int:
+    """Bytes that must be freed before a download of `size` bytes leaves the minimum free space on disk."""
+    free = shutil.disk_usage(MIRROR_DIR).free
+    return MIRROR_MIN_FREE_DISK + reserved + size - free
+
+def mirror_disk_can_fit(size: int) -> bool:
+    """Checks that `size` bytes would fit on disk at all, even with every mirrored file evicted."""
+    return get_mirror_disk_shortfall(size, 0) <= get_mirror_usage()
+
+def make_mirror_room(size: int, reserved: int) -> bool:
+    """Evicts files for a download of `size` bytes, then checks that the disk can take it. Blocking.
+
+    Files are only evicted for disk space when that alone makes room; otherwise the download waits for the
+    downloads in flight to finish.
+    """
+    shortfall = get_mirror_disk_shortfall(size, reserved)
+    evict_mirror_files(size + reserved, shortfall if 0 < shortfall <= get_mirror_usage() else 0)
+    return get_mirror_disk_shortfall(size, reserved) <= 0
+
+def mirror_user_queue_full(user_id: int) -> bool:
+    return len(mirror_pending_jobs.get(user_id, ())) >= MIRROR_MAX_QUEUED_PER_USER
+
+async def enqueue_mirror_job(job: Dict[str, Any]):
+    """Adds a job to its user's queue and wakes up a worker."""
+    mirror_pending_jobs.setdefault(job['user_id'], deque()).append(job)
+    if job['user_id'] not in mirror_user_order:
+        mirror_user_order.append(job['user_id'])
+    async with mirror_queue_condition:
+        mirror_queue_condition.notify()
+
+def _next_mirror_job() -> Optional[Dict[str, Any]]:
+    """Pops the next job, rotating between users so one user cannot starve the others."""
+    while mirror_user_order:
+        user_id = mirror_user_order.popleft()
+        user_jobs = mirror_pending_jobs.get(user_id)
+        if not user_jobs:
+            mirror_pending_jobs.pop(user_id, None)
+            continue
+        job = user_jobs.popleft()
+        if user_jobs:
+            mirror_user_order.append(user_id)
+        else:
+            del mirror_pending_jobs[user_id]
+        return job
+    return None
+
+async def update_mirror_job_status(job: Dict[str, Any], text: str, reply_markup: Optional[InlineKeyboardMarkup] = None, force: bool = False):
+    """Edits the job's status message, at most once every MIRROR_PROGRESS_INTERVAL seconds unless forced."""
+    now = time.monotonic()
+    if not force and now - job['last_update'] < MIRROR_PROGRESS_INTERVAL:
+        return
+    job['last_update'] = now
+    try:
+        await job['status_msg'].edit_caption(text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+    except BadRequest as e:
+        if "Message is not modified" not in str(e):
+            logger.warning(f"Could not update mirror status for {job['file_name']}: {e}")
+    except TelegramError as e:
+        logger.warning(f"Could not update mirror status for {job['file_name']}: {e}")
+
+async def process_mirror_job(job: Dict[str, Any]):
+    global mirror_reserved_bytes
+    file_size = job['file_size'] or 0
+
+    # Make room under the storage quota and on disk, then hold the job until the disk can take it without
+    # starving hosted bots. Eviction is retried on every pass, as downloads in flight finish and files expire.
+    deadline = time.monotonic() + MIRROR_DISK_WAIT_TIMEOUT
+    waiting_notified = False
+    while not await fs_call(make_mirror_room, file_size, mirror_reserved_bytes):
+        if time.monotonic() >= deadline:
+            await update_mirror_job_status(
+                job,
+                f"{EMOJI.CANCEL} Not enough free disk space to download `{job['file_name']}`. Please try again later.",
+                get_back_to_main_menu_keyboard(),
+                force=True
+            )
+            return
+        if not waiting_notified:
+            await update_mirror_job_status(job, f"{EMOJI.WARNING} Waiting for free disk space to download `{job['file_name']}`...", force=True)
+            waiting_notified = True
+        await asyncio.sleep(MIRROR_DISK_RETRY_SECONDS)
+
+    mirror_reserved_bytes += file_size
+    mirror_active_jobs[job['id']] = job
+    try:
+        await update_mirror_job_status(job, f"{EMOJI.LOADING} Downloading `{job['file_name']}`...", force=True)
+
+        async def report_progress(downloaded: int, total: int):
+            fraction = downloaded / total if total else 0.0
+            await update_mirror_job_status(
+                job,
+                f"{EMOJI.LOADING} Downloading `{job['file_name']}`...\n\n"
+                f"`{format_progress_bar(fraction)}` {fraction * 100:.0f}%\n"
+                f"`{format_bytes(downloaded)} / {format_bytes(total)}`"
+            )
+
+        if not await download_file_with_progress(job['bot'], job['file_id'], job['file_path'], report_progress):
+            await update_mirror_job_status(job, f"{EMOJI.CANCEL} Failed to download `{job['file_name']}`. Please try again.", get_back_to_main_menu_keyboard(), force=True)
+            return
+
+        file_name = os.path.basename(job['file_path'])
+        await fs_call(register_mirror_file, file_name, await fs_call(os.path.getsize, job['file_path']), job['ttl_hours'])
+        file_url = f"{RENDER_EXTERNAL_URL}/mirror/{file_name}"
+        expiry_text = f"Expires in {format_mirror_ttl(job['ttl_hours'])}." if job['ttl_hours'] else "No expiry, removed only when storage is full."
+        await update_mirror_job_status(
+            job,
+            f"{EMOJI.SUCCESS} *File Mirrored Successfully!*\n\n"
+            f"Here is your direct link:\n`{file_url}`\n\n_{expiry_text}_",
+            get_back_to_main_menu_keyboard(),
+            force=True
+        )
+    finally:
+        mirror_reserved_bytes -= file_size
+        mirror_active_jobs.pop(job['id'], None)
+
+async def mirror_worker(worker_id: int):
+    while True:
+        async with mirror_queue_condition:
+            await mirror_queue_condition.wait_for(lambda: bool(mirror_user_order))
+            job = _next_mirror_job()
+        if not job:
+            continue
+        try:
+            await process_mirror_job(job)
+        except Exception as e:
+            logger.error(f"Mirror worker {worker_id} failed on {job['file_name']}: {e}", exc_info=True)
+
+def start_mirror_workers():
+    """Creates the queue condition and the mirror worker pool on the running event loop."""
+    global mirror_queue_condition
+    mirror_queue_condition = asyncio.Condition()
+    for worker_id in range(max(1, MIRROR_WORKERS)):
+        mirror_worker_tasks.append(asyncio.create_task(mirror_worker(worker_id)))
+    logger.info(f"Started {len(mirror_worker_tasks)} mirror workers.")
+
+# --- Mirror Storage Quota ---
+MIRROR_TTL_CHOICES = [24, 168, 720, 0]  # hours, 0 means no expiry
+
+def format_mirror_ttl(ttl_hours: int) -> str:
+    if not ttl_hours:
+        return "Never"
+    if ttl_hours % 24 == 0:
+        days = ttl_hours // 24
+        return f"{days} day{'s' if days != 1 else ''}"
+    return f"{ttl_hours} hours"
+
+def load_mirror_index():
+    """Loads the mirror index from disk, adopting untracked files and dropping entries whose file is gone."""
+    try:
+        with open(MIRROR_INDEX_FILE, 'r') as f:
+            saved_index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        saved_index = {}
+
+    with mirror_index_lock:
+        mirror_index.clear()
+        with os.scandir(MIRROR_DIR) as it:
+            for entry in it:
+                if not entry.is_file() or entry.name.endswith('.part'):
+                    continue
+                stat = entry.stat()
+                info = saved_index.get(entry.name) or {
+                    'created': stat.st_mtime,
+                    'last_access': stat.st_mtime,
+                    'ttl_hours': MIRROR_DEFAULT_TTL_HOURS,
+                }
+                info['size'] = stat.st_size
+                mirror_index[entry.name] = info
+    save_mirror_index()
+
+def save_mirror_index():
+    with mirror_index_lock:
+        data = json.dumps(mirror_index)
+    temp_path = f"{MIRROR_INDEX_FILE}.tmp"
+    with open(temp_path, 'w') as f:
+        f.write(data)
+    os.replace(temp_path, MIRROR_INDEX_FILE)
+
+def record_mirror_access(file_name: str):
+    """Records a download in memory only; the sweeper folds access times into the index."""
+    mirror_access_times[file_name] = time.time()
+
+def register_mirror_file(file_name: str, size: int, ttl_hours: int):
+    now = time.time()
+    with mirror_index_lock:
+        mirror_index[file_name] = {'size': size, 'created': now, 'last_access': now, 'ttl_hours': ttl_hours}
+    save_mirror_index()
+
+def clear_mirror_index():
+    with mirror_index_lock:
+        mirror_index.clear()
+    mirror_access_times.clear()
+    save_mirror_index()
+
+def get_mirror_usage() -> int:
+    with mirror_index_lock:
+        return sum(info['size'] for info in mirror_index.values())
+
+def _fold_mirror_access_times() -> bool:
+    folded = False
+    for file_name in list(mirror_access_times):
+        accessed_at = mirror_access_times.pop(file_name, None)
+        with mirror_index_lock:
+            info = mirror_index.get(file_name)
+            if info and accessed_at and accessed_at > info['last_access']:
+                info['last_access'] = accessed_at
+                folded = True
+    return folded
+
+def _remove_mirror_file(file_name: str) -> int:
+    with mirror_index_lock:
+        info = mirror_index.pop(file_name, None)
+    try:
+        os.remove(os.path.join(MIRROR_DIR, file_name))
+    except FileNotFoundError:
+        pass
+    return info['size'] if info else 0
+
+def evict_mirror_files(incoming_size: int = 0, disk_shortfall: int = 0) -> Tuple[int, int]:
+    """Removes expired files, then least recently accessed ones until `incoming_size` more bytes fit in the quota
+    and at least `disk_shortfall` bytes have been freed.
+
+    Returns the number of files removed and the bytes freed.
+    """
+    changed = _fold_mirror_access_times()
+    now = time.time()
+    removed_count = 0
+    freed_bytes = 0
+
+    with mirror_index_lock:
+        entries = list(mirror_index.items())
+
+    for file_name, info in entries:
+        if info['ttl_hours'] and info['created'] + info['ttl_hours'] * 3600 <= now:
+            freed_bytes += _remove_mirror_file(file_name)
+            removed_count += 1
+
+    if MIRROR_STORAGE_QUOTA or freed_bytes < disk_shortfall:
+        with mirror_index_lock:
+            lru_entries = sorted(mirror_index.items(), key=lambda item: item[1]['last_access'])
+        usage = sum(info['size'] for _, info in lru_entries)
+        for file_name, info in lru_entries:
+            over_quota = MIRROR_STORAGE_QUOTA and usage + incoming_size > MIRROR_STORAGE_QUOTA
+            if not over_quota and freed_bytes >= disk_shortfall:
+                break
+            size = _remove_mirror_file(file_name)
+            usage -= size
+            freed_bytes += size
+            removed_count += 1
+
+    if changed or removed_count:
+        save_mirror_index()
+    return removed_count, freed_bytes
+
+async def mirror_sweeper():
+    """Periodically expires and evicts mirrored files off the event loop."""
+    while True:
+        await asyncio.sleep(MIRROR_SWEEP_INTERVAL)
+        try:
+            removed_count, freed_bytes = await fs_call(evict_mirror_files)
+            if removed_count:
+                logger.info(f"Mirror sweeper removed {removed_count} files ({format_bytes(freed_bytes)}).")
+        except Exception as e:
+            logger.error(f"Error sweeping mirror storage: {e}", exc_info=True)
+
+# --- Bot Archives ---
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+INCOMPRESSIBLE_EXTENSIONS = {'.zip', '.gz', '.bz2', '.xz', '.7z', '.rar', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.mp3', '.mp4', '.mkv', '.whl'}
+
+def iter_bot_files(bot_dir: str, only_files: Optional[List[str]] = None):
+    """Yields (path, archive name) pairs for a bot directory, skipping virtualenvs and caches."""
+    if only_files:
+        for item_name in only_files:
+            item_path = os.path.join(bot_dir, item_name)
+            if os.path.isfile(item_path):
+                yield item_path, item_name
+        return
+
+    for root, dirs, files in os.walk(bot_dir):
+        dirs[:] = [
+            d for d in dirs
+            if d not in ARCHIVE_EXCLUDE_DIRS and not os.path.exists(os.path.join(root, d, 'pyvenv.cfg'))
+        ]
+        for file in files:
+            file_path = os.path.join(root, file)
+            yield file_path, os.path.relpath(file_path, bot_dir)
+
+def build_bot_archive(bot_dir: str, only_files: Optional[List[str]] = None, metadata: Optional[Dict[str, Any]] = None):
+    """Zips a bot directory into a temporary file on disk. Blocking, so run it in a worker thread.
+
+    The file is deleted when closed. It is a named file because python-telegram-bot takes the
+    upload filename from the handle.
+    """
+    archive = tempfile.NamedTemporaryFile(prefix='bothoster_', suffix='.zip')
+    try:
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED, compresslevel=ARCHIVE_COMPRESSION_LEVEL) as zip_f:
+            for file_path, arc_name in iter_bot_files(bot_dir, only_files):
+                if os.path.splitext(file_path)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+                    zip_f.write(file_path, arc_name, compress_type=zipfile.ZIP_STORED)
+                else:
+                    zip_f.write(file_path, arc_name)
+            if metadata is not None:
+                zip_f.writestr("metadata.json", json.dumps(metadata, indent=2))
+        archive.seek(0)
+        return archive
+    except Exception:
+        archive.close()
+        raise
+
+def get_archive_size(archive) -> int:
+    archive.seek(0, os.SEEK_END)
+    size = archive.tell()
+    archive.seek(0)
+    return size
+
+# --- Backup Restore ---
+RESTORE_MAX_UNPACKED_SIZE = 200 * 1024 * 1024
+RESTORE_MAX_FILES = 5000
+RESTORE_COPY_CHUNK_SIZE = 64 * 1024
+
+def read_backup_metadata(zip_f: zipfile.ZipFile) -> Dict[str, Any]:
+    try:
+        info = zip_f.getinfo("metadata.json")
+    except KeyError:
+        raise ValueError("metadata.json is missing, this is not a BotHoster backup.")
+    if info.file_size > 64 * 1024:
+        raise ValueError("metadata.json is too large.")
+    metadata = json.loads(zip_f.read(info))
+    bot_name = str(metadata.get('bot_name') or '')
+    if not bot_name or not bot_name.replace('_', '').isalnum():
+        raise ValueError("The backup has an invalid bot name.")
+    if not metadata.get('token'):
+        raise ValueError("The backup has no bot token.")
+    return metadata
+
+def read_backup_archive_metadata(archive_path: str) -> Dict[str, Any]:
+    """Returns the validated metadata of a backup zip. Blocking."""
+    with zipfile.ZipFile(archive_path) as zip_f:
+        return read_backup_metadata(zip_f)
+
+def extract_backup_archive(archive_path: str) -> Dict[str, Any]:
+    """Extracts a backup zip into its bot directory and returns its metadata. Blocking.
+
+    The caller reserves the bot name on the event loop first (see reserve_bot_name).
+    Members are streamed to disk in chunks. Paths that escape the bot directory and symlinks are
+    rejected, and the bytes actually written are capped, so a forged size header cannot bypass the limit.
+    """
+    with zipfile.ZipFile(archive_path) as zip_f:
+        metadata = read_backup_metadata(zip_f)
+        bot_name = metadata['bot_name']
+
+        members = [m for m in zip_f.infolist() if not m.is_dir() and m.filename != "metadata.json"]
+        if len(members) > RESTORE_MAX_FILES:
+            raise ValueError(f"The backup has more than {RESTORE_MAX_FILES} files.")
+        if "bot.py" not in {m.filename for m in members}:
+            raise ValueError("The backup does not contain bot.py.")
+
+        bot_dir = os.path.join(BOTS_DIR, bot_name)
+        if os.path.exists(bot_dir):
+            # Left behind by a bot that is no longer registered; its files are not ours to overwrite
+            raise ValueError(f"The directory of {bot_name} already exists on the server. Remove it first to restore this backup.")
+        staging_dir = f"{bot_dir}.restore"
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        staging_root = os.path.realpath(staging_dir)
+        written = 0
+        try:
+            for member in members:
+                if S_ISLNK(member.external_attr >> 16):
+                    raise ValueError(f"Symlinks are not allowed: {member.filename}")
+                target_path = os.path.realpath(os.path.join(staging_root, member.filename))
+                if not target_path.startswith(staging_root + os.sep):
+                    raise ValueError(f"Unsafe path in backup: {member.filename}")
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                with zip_f.open(member) as src, open(target_path, 'wb') as dst:
+                    while True:
+                        chunk = src.read(RESTORE_COPY_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        written += len(chunk)
+                        if written > RESTORE_MAX_UNPACKED_SIZE:
+                            raise ValueError(f"The backup unpacks to more than {format_bytes(RESTORE_MAX_UNPACKED_SIZE)}.")
+                        dst.write(chunk)
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+    try:
+        os.rename(staging_dir, bot_dir)
+    except OSError:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    return metadata
+
 def get_dir_size(path='.'):
     """Calculates the size of a directory."""
     total = 0
@@ -624,8 +2143,30 @@ def format_bytes(size):
     s = round(size / p, 2)
     return f"{s} {size_name[i]}"
 
+def sample_process_usage(pids: Dict[str, int], interval: float = 0.1) -> Dict[str, Tuple[float, int]]:
+    """Returns (CPU percent, RSS) per name, sampling every process over one shared interval.
+
+    Blocks for the interval, so callers on the event loop run it with asyncio.to_thread.
+    """
+    processes = {}
+    for name, pid in pids.items():
+        try:
+            process = psutil.Process(pid)
+            process.cpu_percent(interval=None)  # Primes the counter; the next call measures from here
+            processes[name] = process
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            pass
+    time.sleep(interval)
+    usage = {}
+    for name, process in processes.items():
+        try:
+            usage[name] = (process.cpu_percent(interval=None), process.memory_info().rss)
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            pass
+    return usage
+
 def get_system_health():
-    """Get system health information."""
+    """Get system health information. Blocks for a second to sample the CPU."""
     cpu_percent = psutil.cpu_percent(interval=1)
     memory = psutil.virtual_memory()
     disk = psutil.disk_usage('/')
@@ -647,6 +2188,25 @@ def get_bot_resource_usage(bot_name: str):
         bot_info = running_bots[bot_name]
         process = bot_info['process']
         
+        if isinstance(process, SharedRuntimeBot) and process.poll() is None:
+            # Memory can't be split between bots sharing a process, so the worker's total is shown
+            runtime_stats = get_shared_runtime_usage().get(bot_name, {})
+            try:
+                worker = psutil.Process(process.pid)
+                memory_used = f"{format_bytes(worker.memory_info().rss)} (shared)"
+                memory_percent = worker.memory_percent()
+                threads = worker.num_threads()
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                memory_used, memory_percent, threads = '0B', 0, 0
+            return {
+                'cpu_percent': runtime_stats.get('cpu_percent', 0),
+                'memory_used': memory_used,
+                'memory_percent': memory_percent,
+                'threads': threads,
+                'status': f"shared runtime, {runtime_stats.get('updates', 0)} updates, {runtime_stats.get('errors', 0)} errors",
+                'running_time': str(datetime.now() - bot_info['start_time']).split('.')[0]
+            }
+        
         if process.poll() is None:  # Process is still running
             try:
                 proc = psutil.Process(process.pid)
@@ -654,8 +2214,8 @@ def get_bot_resource_usage(bot_name: str):
                 memory_info = proc.memory_info()
                 
                 # Update the stored values
-                running_bots[bot_name]['cpu_usage'] = cpu_percent
-                running_bots[bot_name]['memory_usage'] = memory_info.rss
+                bot_info['cpu_usage'] = cpu_percent
+                bot_info['memory_usage'] = memory_info.rss
                 
                 return {
                     'cpu_percent': cpu_percent,
@@ -684,26 +2244,785 @@ def get_bot_resource_usage(bot_name: str):
         'running_time': 'N/A'
     }
 
-def clean_old_logs(days=None):
-    """Clean log files older than specified days."""
-    if days is None:
-        days = LOG_RETENTION_DAYS
-        
-    cutoff_date = datetime.now() - timedelta(days=days)
-    cleaned_count = 0
-    
+# --- Log Retention ---
+def load_log_index():
+    """Builds the log segment index with a single scan of LOGS_DIR at startup."""
+    index = {}
     for bot_name in os.listdir(LOGS_DIR):
         bot_log_dir = os.path.join(LOGS_DIR, bot_name)
-        if os.path.isdir(bot_log_dir):
-            for log_file in os.listdir(bot_log_dir):
-                if log_file.endswith('.log'):
-                    log_path = os.path.join(bot_log_dir, log_file)
-                    file_time = datetime.fromtimestamp(os.path.getmtime(log_path))
-                    if file_time < cutoff_date:
-                        os.remove(log_path)
-                        cleaned_count += 1
-    
-    return cleaned_count
+        if not os.path.isdir(bot_log_dir):
+            continue
+        segments = []
+        with os.scandir(bot_log_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.log'):
+                    stat = entry.stat()
+                    segments.append({'path': entry.path, 'size': stat.st_size, 'mtime': stat.st_mtime})
+        segments.sort(key=lambda segment: segment['path'])
+        index[bot_name] = segments
+    with log_segments_lock:
+        # Keep segments registered while the scan was running
+        for bot_name, segments in log_segments.items():
+            known = {segment['path'] for segment in index.get(bot_name, [])}
+            index.setdefault(bot_name, []).extend(segment for segment in segments if segment['path'] not in known)
+        log_segments.clear()
+        log_segments.update(index)
+
+def register_log_segment(bot_name: str, path: str):
+    with log_segments_lock:
+        log_segments.setdefault(bot_name, []).append({'path': path, 'size': 0, 'mtime': time.time()})
+
+def finalize_log_segment(bot_name: str, path: Optional[str]):
+    """Records the final size of a segment that will not be written to again."""
+    if not path:
+        return
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return
+    with log_segments_lock:
+        for segment in log_segments.get(bot_name, []):
+            if segment['path'] == path:
+                segment['size'] = stat.st_size
+                segment['mtime'] = stat.st_mtime
+                break
+
+def forget_log_segments(bot_name: str):
+    with log_segments_lock:
+        log_segments.pop(bot_name, None)
+
+def get_active_log_paths() -> set:
+    return {info.get('log_file_path') for info in list(running_bots.values()) if info.get('log_file_path')}
+
+def enforce_log_retention(days: Optional[int] = None, active_paths: Optional[set] = None) -> Tuple[int, int]:
+    """Applies the age limit and the per-bot and global byte budgets to the log segment index.
+
+    Segments that bots are still writing to are never deleted; only their size is refreshed.
+    Returns the number of files removed and the bytes reclaimed. Blocking, so run it in a worker thread.
+    """
+    if days is None:
+        days = LOG_RETENTION_DAYS
+    if active_paths is None:
+        active_paths = get_active_log_paths()
+    cutoff = time.time() - days * 86400
+
+    removed = []
+    with log_segments_lock:
+        for segments in log_segments.values():
+            for segment in segments:
+                if segment['path'] in active_paths:
+                    try:
+                        stat = os.stat(segment['path'])
+                        segment['size'], segment['mtime'] = stat.st_size, stat.st_mtime
+                    except FileNotFoundError:
+                        pass
+
+        def drop(bot_name, segment):
+            log_segments[bot_name].remove(segment)
+            removed.append(segment)
+
+        # Age limit, then each bot's budget, oldest segments first
+        for bot_name, segments in log_segments.items():
+            for segment in list(segments):
+                if segment['path'] not in active_paths and segment['mtime'] < cutoff:
+                    drop(bot_name, segment)
+            bot_bytes = sum(segment['size'] for segment in segments)
+            for segment in list(segments):
+                if not LOG_MAX_BYTES_PER_BOT or bot_bytes <= LOG_MAX_BYTES_PER_BOT:
+                    break
+                if segment['path'] not in active_paths:
+                    bot_bytes -= segment['size']
+                    drop(bot_name, segment)
+
+        # Global budget across all bots
+        total_bytes = sum(segment['size'] for segments in log_segments.values() for segment in segments)
+        if LOG_MAX_TOTAL_BYTES and total_bytes > LOG_MAX_TOTAL_BYTES:
+            candidates = sorted(
+                ((segment['mtime'], bot_name, segment) for bot_name, segments in log_segments.items()
+                 for segment in segments if segment['path'] not in active_paths),
+                key=lambda item: item[0]
+            )
+            for _, bot_name, segment in candidates:
+                if total_bytes <= LOG_MAX_TOTAL_BYTES:
+                    break
+                total_bytes -= segment['size']
+                drop(bot_name, segment)
+
+    reclaimed = 0
+    for segment in removed:
+        try:
+            os.remove(segment['path'])
+            reclaimed += segment['size']
+        except FileNotFoundError:
+            pass
+        try:
+            os.remove(_log_index_path(segment['path']))
+        except FileNotFoundError:
+            pass
+
+    log_retention_stats['last_run'] = datetime.now()
+    log_retention_stats['last_files'] = len(removed)
+    log_retention_stats['last_bytes'] = reclaimed
+    log_retention_stats['total_files'] += len(removed)
+    log_retention_stats['total_bytes'] += reclaimed
+    return len(removed), reclaimed
+
+async def log_retention_scheduler():
+    """Applies the log retention policy every LOG_RETENTION_INTERVAL seconds, off the event loop."""
+    await fs_call(load_log_index)
+    while True:
+        try:
+            active_paths = get_active_log_paths()
+            removed_count, reclaimed = await fs_call(enforce_log_retention, None, active_paths)
+            if removed_count:
+                logger.info(f"Log retention removed {removed_count} segments ({format_bytes(reclaimed)}).")
+        except Exception as e:
+            logger.error(f"Error applying log retention: {e}", exc_info=True)
+        await asyncio.sleep(LOG_RETENTION_INTERVAL)
+
+# --- Log Search ---
+LOG_SEARCH_PAGE_SIZE = 10
+LOG_SEARCH_LINE_PREVIEW = 200
+LOG_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
+LOG_LEVEL_PATTERN = re.compile(rb'\b(DEBUG|INFO|WARNING|ERROR|CRITICAL)\b')
+LOG_TIMESTAMP_PATTERN = re.compile(rb'^(\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2})')
+LOG_SEGMENT_NAME_PATTERN = re.compile(r'^(\d{8}_\d{6})')
+
+def parse_time_filter(value: str) -> Optional[float]:
+    """Parses `30m`, `2h`, `7d` (relative to now) or `YYYY-MM-DD[THH:MM]` into a timestamp."""
+    match = re.fullmatch(r'(\d+)([mhd])', value)
+    if match:
+        amount, unit = int(match.group(1)), match.group(2)
+        return time.time() - amount * {'m': 60, 'h': 3600, 'd': 86400}[unit]
+    for fmt in ("%Y-%m-%dT%H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            pass
+    return None
+
+def parse_log_query(text: str) -> Dict[str, Any]:
+    """Parses a search query such as `timeout bot:mybot level:error since:2h /conn(ect)?ion/`.
+
+    Plain words are matched case-insensitively; a /.../ term is a regular expression.
+    Raises ValueError for an invalid filter or regex.
+    """
+    query = {'text': text, 'bot': None, 'min_level': None, 'since': None, 'until': None}
+    regex_match = re.search(r'/(.+)/', text)
+    if regex_match:
+        pattern = regex_match.group(1)
+        text = text[:regex_match.start()] + text[regex_match.end():]
+    else:
+        pattern = None
+
+    words = []
+    for token in text.split():
+        key, sep, value = token.partition(':')
+        if sep and key.lower() == 'bot':
+            query['bot'] = value
+        elif sep and key.lower() == 'level':
+            if value.upper() not in LOG_LEVELS:
+                raise ValueError(f"Unknown level '{value}'. Use one of: {', '.join(LOG_LEVELS).lower()}.")
+            query['min_level'] = value.upper()
+        elif sep and key.lower() in ('since', 'until'):
+            timestamp = parse_time_filter(value)
+            if timestamp is None:
+                raise ValueError(f"Invalid time '{value}'. Use 30m, 2h, 7d or YYYY-MM-DD.")
+            query[key.lower()] = timestamp
+        else:
+            words.append(re.escape(token))
+
+    if pattern is None and not words and not query['min_level']:
+        raise ValueError("Please enter some text, a /regex/ or a level: filter to search for.")
+    if pattern is None:
+        pattern = r'.*'.join(words) if words else r'\b(' + '|'.join(LOG_LEVELS[LOG_LEVELS.index(query['min_level']):]) + r')\b'
+    try:
+        query['regex'] = re.compile(pattern.encode('utf-8'), re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"Invalid regex: {e}")
+    return query
+
+def _segment_start_time(path: str) -> Optional[float]:
+    match = LOG_SEGMENT_NAME_PATTERN.match(os.path.basename(path))
+    return datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").timestamp() if match else None
+
+def _log_line_matches(line: bytes, query: Dict[str, Any]) -> bool:
+    if query['min_level']:
+        level_match = LOG_LEVEL_PATTERN.search(line)
+        if not level_match or LOG_LEVELS.index(level_match.group(1).decode()) < LOG_LEVELS.index(query['min_level']):
+            return False
+    if query['since'] or query['until']:
+        time_match = LOG_TIMESTAMP_PATTERN.match(line)
+        if time_match:
+            line_time = datetime.strptime(time_match.group(1).decode().replace('T', ' '), "%Y-%m-%d %H:%M:%S").timestamp()
+            if (query['since'] and line_time < query['since']) or (query['until'] and line_time > query['until']):
+                return False
+    return True
+
+def search_logs(query: Dict[str, Any], active_paths: set, offset: int = 0, limit: int = LOG_SEARCH_PAGE_SIZE) -> Tuple[List[Tuple[str, str]], bool]:
+    """Searches log segments newest first and returns a page of (bot name, line) hits plus whether more exist.
+
+    Segments outside the time range are skipped using the segment index, and each remaining segment is
+    memory-mapped and scanned with the compiled regex, so files are never read into Python strings.
+    active_paths are the segments bots are still writing to, taken on the event loop.
+    Blocking, so run it in a worker thread.
+    """
+    needed = offset + limit + 1
+    with log_segments_lock:
+        candidates = [
+            (segment['mtime'], bot_name, segment['path'])
+            for bot_name, segments in log_segments.items()
+            if not query['bot'] or bot_name == query['bot']
+            for segment in segments
+        ]
+    candidates.sort(reverse=True)
+
+    hits: List[Tuple[str, str]] = []
+    for segment_end, bot_name, path in candidates:
+        if len(hits) >= needed:
+            break
+        if query['since'] and segment_end < query['since'] and path not in active_paths:
+            continue
+        segment_start = _segment_start_time(path)
+        if query['until'] and segment_start and segment_start > query['until']:
+            continue
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    # Keep only the newest matches this segment can contribute
+                    segment_hits = deque(maxlen=needed - len(hits))
+                    last_line_start = -1
+                    for match in query['regex'].finditer(mm):
+                        line_start = mm.rfind(b'\n', 0, match.start()) + 1
+                        if line_start == last_line_start:
+                            continue
+                        line_end = mm.find(b'\n', match.end())
+                        line = mm[line_start:line_end if line_end != -1 else len(mm)]
+                        last_line_start = line_start
+                        if _log_line_matches(line, query):
+                            segment_hits.append(line.decode('utf-8', errors='replace'))
+        except (FileNotFoundError, ValueError):
+            continue
+        hits.extend((bot_name, line) for line in reversed(segment_hits))
+
+    return hits[offset:offset + limit], len(hits) > offset + limit
+
+# --- Log Paging ---
+# Every log segment has a sparse sidecar index (`<segment>.idx`) of fixed-size (line number, byte offset,
+# time) records, one every LOG_INDEX_INTERVAL lines. The log writer appends to it as output arrives, so a
+# page or a point in time is found by bisecting the index on disk and reading only the lines it needs.
+LOG_INDEX_INTERVAL = 64
+LOG_INDEX_RECORD = struct.Struct('<QQd')
+LOG_PAGE_LINES = 25
+LOG_PAGE_LINE_PREVIEW = 130
+
+def _log_index_path(path: str) -> str:
+    return path + '.idx'
+
+def build_log_index(path: str) -> Dict[str, Any]:
+    """Scans a segment once, writes its sidecar index and returns the writer state for appending to it."""
+    last_time = _segment_start_time(path) or os.path.getmtime(path)
+    records = [LOG_INDEX_RECORD.pack(0, 0, last_time)]
+    lines = 0
+    offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            time_match = LOG_TIMESTAMP_PATTERN.match(line)
+            if time_match:
+                try:
+                    line_time = datetime.strptime(time_match.group(1).decode().replace('T', ' '), "%Y-%m-%d %H:%M:%S").timestamp()
+                    last_time = max(last_time, line_time)
+                except ValueError:
+                    pass
+            offset += len(line)
+            if not line.endswith(b'\n'):
+                break
+            lines += 1
+            if lines % LOG_INDEX_INTERVAL == 0:
+                records.append(LOG_INDEX_RECORD.pack(lines, offset, last_time))
+    with open(_log_index_path(path), 'wb') as f:
+        f.write(b''.join(records))
+    return {'path': _log_index_path(path), 'lines': lines, 'offset': offset}
+
+def append_log_index(bot_info: Dict[str, Any], output: str):
+    """Indexes output the log writer has just appended to the bot's current segment."""
+    state = bot_info.get('log_index')
+    if not state:
+        return
+    data = output.encode('utf-8')
+    newlines = data.count(b'\n')
+    next_checkpoint = (state['lines'] // LOG_INDEX_INTERVAL + 1) * LOG_INDEX_INTERVAL
+    if state['lines'] + newlines >= next_checkpoint:
+        now = time.time()
+        records = []
+        position = data.find(b'\n')
+        line_number = state['lines']
+        while position != -1:
+            line_number += 1
+            if line_number % LOG_INDEX_INTERVAL == 0:
+                records.append(LOG_INDEX_RECORD.pack(line_number, state['offset'] + position + 1, now))
+            position = data.find(b'\n', position + 1)
+        try:
+            with open(state['path'], 'ab') as f:
+                f.write(b''.join(records))
+        except OSError as e:
+            logger.error(f"Error writing log index {state['path']}: {e}")
+    state['lines'] += newlines
+    state['offset'] += len(data)
+
+def _read_log_index_record(index_file, position: int) -> Tuple[int, int, float]:
+    index_file.seek(position * LOG_INDEX_RECORD.size)
+    return LOG_INDEX_RECORD.unpack(index_file.read(LOG_INDEX_RECORD.size))
+
+def _bisect_log_index(index_file, count: int, field: int, value: float) -> Tuple[int, int, float]:
+    """Returns the last index record whose `field` is <= value (or the first record)."""
+    low, high = 1, count
+    while low < high:
+        middle = (low + high) // 2
+        if _read_log_index_record(index_file, middle)[field] <= value:
+            low = middle + 1
+        else:
+            high = middle
+    return _read_log_index_record(index_file, low - 1)
+
+def _open_log_index(path: str):
+    """Opens a segment's index, building it first for segments written before indexing existed."""
+    index_path = _log_index_path(path)
+    if not os.path.exists(index_path) or os.path.getsize(index_path) < LOG_INDEX_RECORD.size:
+        build_log_index(path)
+    index_file = open(index_path, 'rb')
+    count = os.fstat(index_file.fileno()).st_size // LOG_INDEX_RECORD.size
+    if _read_log_index_record(index_file, count - 1)[1] > os.path.getsize(path):
+        # The segment is shorter than its index says, so the index is stale
+        index_file.close()
+        build_log_index(path)
+        index_file = open(index_path, 'rb')
+        count = os.fstat(index_file.fileno()).st_size // LOG_INDEX_RECORD.size
+    return index_file, count
+
+def _count_log_lines(index_file, count: int, log_file) -> int:
+    """Counts a segment's lines from its last index record, reading at most one index interval."""
+    last_line, last_offset, _ = _read_log_index_record(index_file, count - 1)
+    log_file.seek(last_offset)
+    tail = log_file.read()
+    return last_line + tail.count(b'\n') + (1 if tail and not tail.endswith(b'\n') else 0)
+
+def read_log_page(path: str, page: int, page_lines: int = LOG_PAGE_LINES) -> Tuple[List[str], int, int]:
+    """Returns the lines of one page of a segment, the page number and the page count.
+
+    Page 0 is the newest page; a negative page counts from the oldest, so -1 is the first page of the file.
+    Blocking, so run it in a worker thread.
+    """
+    index_file, count = _open_log_index(path)
+    with index_file, open(path, 'rb') as log_file:
+        total_lines = _count_log_lines(index_file, count, log_file)
+        total_pages = max(1, math.ceil(total_lines / page_lines))
+        if page < 0:
+            page += total_pages
+        page = min(max(page, 0), total_pages - 1)
+        end_line = total_lines - page * page_lines
+        start_line = max(0, end_line - page_lines)
+
+        line_number, offset, _ = _bisect_log_index(index_file, count, 0, start_line)
+        log_file.seek(offset)
+        for _ in range(start_line - line_number):
+            log_file.readline()
+        lines = [log_file.readline() for _ in range(end_line - start_line)]
+    return [line.decode('utf-8', errors='replace').rstrip('\r\n') for line in lines], page, total_pages
+
+def find_log_page_for_time(path: str, timestamp: float, page_lines: int = LOG_PAGE_LINES) -> int:
+    """Returns the page of a segment holding the lines written around `timestamp`. Blocking."""
+    index_file, count = _open_log_index(path)
+    with index_file, open(path, 'rb') as log_file:
+        total_lines = _count_log_lines(index_file, count, log_file)
+        line_number, _, _ = _bisect_log_index(index_file, count, 2, timestamp)
+    return max(0, (total_lines - line_number - 1) // page_lines)
+
+def get_bot_log_segments(bot_name: str) -> List[str]:
+    """Returns the paths of a bot's log segments, newest first."""
+    with log_segments_lock:
+        paths = [segment['path'] for segment in log_segments.get(bot_name, [])]
+    if not paths:
+        log_dir = os.path.join(LOGS_DIR, bot_name)
+        if os.path.isdir(log_dir):
+            paths = [os.path.join(log_dir, name) for name in os.listdir(log_dir) if name.endswith('.log')]
+    return sorted(paths, reverse=True)
+
+def find_log_segment_for_time(segments: List[str], timestamp: float) -> int:
+    """Returns the position of the newest segment started at or before `timestamp` in a newest-first list."""
+    for position, path in enumerate(segments):
+        segment_start = _segment_start_time(path)
+        if segment_start is not None and segment_start <= timestamp:
+            return position
+    return len(segments) - 1
+
+# --- Live Log Tail ---
+# One subscription per bot, shared by every chat watching it. update_bot_logs publishes new output into
+# the subscription and a single task polls the bot, coalescing output into at most one edit per
+# LIVE_TAIL_EDIT_INTERVAL for each viewer's message, and stops once the bot is quiet for too long.
+LIVE_TAIL_LINES = 30
+LIVE_TAIL_POLL_INTERVAL = 1
+LIVE_TAIL_EDIT_INTERVAL = 3
+LIVE_TAIL_IDLE_TIMEOUT = 300
+LIVE_TAIL_MAX_CHARS = 3500
+
+def publish_log_output(bot_name: str, output: str):
+    """Feeds freshly read bot output to the bot's live tail, if anyone is watching."""
+    tail = log_tails.get(bot_name)
+    if tail is None:
+        return
+    lines = (tail['partial'] + output).split('\n')
+    tail['partial'] = lines.pop()
+    tail['lines'].extend(lines)
+    tail['last_output'] = time.monotonic()
+    tail['dirty'] = True
+
+def render_log_tail(bot_name: str, tail: Dict[str, Any], status: Optional[str] = None) -> str:
+    lines = list(tail['lines']) + ([tail['partial']] if tail['partial'] else [])
+    body = "\n".join(
+        (line[:LOG_PAGE_LINE_PREVIEW] + "...") if len(line) > LOG_PAGE_LINE_PREVIEW else line
+        for line in lines
+    )[-LIVE_TAIL_MAX_CHARS:].replace("`", "'") or "(waiting for output)"
+    if status is None:
+        status = f"{EMOJI.GREEN_CIRCLE} Live, updated {datetime.now().strftime('%H:%M:%S')}"
+    return f"{EMOJI.LIVE} *Live tail of `{bot_name}`*\n{status}\n\n```\n{body}\n```"
+
+def open_log_tail(bot_name: str, bot: Bot, viewer: Tuple[int, int]) -> Dict[str, Any]:
+    """Adds a (chat id, message id) viewer to the bot's live tail, starting the tail if nobody is watching yet."""
+    tail = log_tails.get(bot_name)
+    if tail is not None:
+        tail['viewers'].add(viewer)
+        return tail
+    # Collect pending output, then seed the tail from the newest lines of the bot's in-memory log. Holding the
+    # log lock until the tail is subscribed means no output can slip in between the seed and the subscription.
+    with get_log_lock(bot_name):
+        update_bot_logs(bot_name)
+        history = running_bots[bot_name]['logs'].split('\n') if bot_name in running_bots else ['']
+        tail = {
+            'viewers': {viewer},
+            'lines': deque(history[:-1], maxlen=LIVE_TAIL_LINES),
+            'partial': history[-1],
+            'dirty': False,
+            'last_output': time.monotonic(),
+            'next_edit': 0.0,
+            'bot': bot
+        }
+        log_tails[bot_name] = tail
+    tail['task'] = asyncio.create_task(run_log_tail(bot_name, tail))
+    return tail
+
+async def push_log_tail(bot_name: str, tail: Dict[str, Any], status: Optional[str] = None, live: bool = True):
+    """Edits every viewer's message with the current tail."""
+    text = render_log_tail(bot_name, tail, status)
+    reply_markup = get_log_tail_keyboard(bot_name, live)
+    for chat_id, message_id in list(tail['viewers']):
+        try:
+            await tail['bot'].edit_message_text(text, chat_id=chat_id, message_id=message_id, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+        except RetryAfter as e:
+            # Flood control: keep the pending state and hold back the next edit
+            tail['dirty'] = True
+            tail['next_edit'] = time.monotonic() + e.retry_after
+            return
+        except BadRequest as e:
+            if "not modified" not in str(e):
+                tail['viewers'].discard((chat_id, message_id))
+        except TelegramError as e:
+            logger.warning(f"Error updating live tail of {bot_name} in chat {chat_id}: {e}")
+
+async def run_log_tail(bot_name: str, tail: Dict[str, Any]):
+    reason = None
+    while tail['viewers']:
+        await asyncio.sleep(LIVE_TAIL_POLL_INTERVAL)
+        if bot_name not in running_bots:
+            reason = "the bot was deleted"
+            break
+        update_bot_logs(bot_name)
+        now = time.monotonic()
+        if now - tail['last_output'] >= LIVE_TAIL_IDLE_TIMEOUT:
+            reason = f"no output for {LIVE_TAIL_IDLE_TIMEOUT // 60} minutes"
+            break
+        if tail['dirty'] and now >= tail['next_edit']:
+            tail['dirty'] = False
+            tail['next_edit'] = now + LIVE_TAIL_EDIT_INTERVAL
+            await push_log_tail(bot_name, tail)
+    if log_tails.get(bot_name) is tail:
+        del log_tails[bot_name]
+    if reason and tail['viewers']:
+        await push_log_tail(bot_name, tail, f"{EMOJI.STOP} Live tail stopped: {reason}.", live=False)
+
+# --- Snapshots ---
+# Snapshots store bot files as zlib-compressed, SHA-256 addressed chunks under SNAPSHOTS_DIR/chunks.
+# Each snapshot is a JSON manifest listing the registry entry and the chunk list of every file, so
+# chunks shared with earlier snapshots are never stored twice.
+SNAPSHOT_CHUNK_SIZE = 1024 * 1024
+SNAPSHOT_COMPRESSION_LEVEL = 6
+SNAPSHOT_MAX_PENDING_CHUNKS = 64
+snapshot_lock = threading.Lock()
+
+def _snapshot_chunk_path(digest: str) -> str:
+    return os.path.join(SNAPSHOTS_DIR, "chunks", digest[:2], digest)
+
+def _snapshot_manifest_path(snapshot_id: str) -> str:
+    return os.path.join(SNAPSHOTS_DIR, "manifests", f"{snapshot_id}.json")
+
+def list_snapshot_ids() -> List[str]:
+    """Returns snapshot ids, newest first."""
+    manifests_dir = os.path.join(SNAPSHOTS_DIR, "manifests")
+    if not os.path.isdir(manifests_dir):
+        return []
+    return sorted((f[:-5] for f in os.listdir(manifests_dir) if f.endswith('.json')), reverse=True)
+
+def load_snapshot_manifest(snapshot_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_snapshot_manifest_path(snapshot_id), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def get_registry_entries() -> Dict[str, Dict[str, Any]]:
+    """Returns the persistable part of the bot registry."""
+    return {
+        bot_name: {'token': info['token'], 'restart_count': info.get('restart_count', 0)}
+        for bot_name, info in running_bots.items()
+    }
+
+def _write_snapshot_chunks(pending: Dict[str, Any]) -> int:
+    stored_bytes = 0
+    for digest, future in pending.items():
+        compressed = future.result()
+        chunk_path = _snapshot_chunk_path(digest)
+        os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+        temp_path = f"{chunk_path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(temp_path, chunk_path)
+        stored_bytes += len(compressed)
+    pending.clear()
+    return stored_bytes
+
+def create_snapshot(registry: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Snapshots every bot in `registry`. Blocking, so run it in a worker thread.
+
+    Files whose size and mtime match the previous snapshot reuse its chunk list without being read.
+    New chunks are compressed in a process pool across all cores.
+    """
+    with snapshot_lock:
+        previous_ids = list_snapshot_ids()
+        previous = load_snapshot_manifest(previous_ids[0]) if previous_ids else None
+        previous_bots = previous['bots'] if previous else {}
+
+        snapshot_id = base_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        suffix = 1
+        while os.path.exists(_snapshot_manifest_path(snapshot_id)):
+            snapshot_id = f"{base_id}_{suffix}"
+            suffix += 1
+        stats = {'files': 0, 'changed_files': 0, 'new_chunks': 0, 'stored_bytes': 0}
+        bots = {}
+
+        # Forking would copy the locks held by the web server and watchdog threads into the workers
+        spawn_context = multiprocessing.get_context('spawn')
+        with concurrent.futures.ProcessPoolExecutor(max_workers=SNAPSHOT_WORKERS or None, mp_context=spawn_context) as pool:
+            pending: Dict[str, Any] = {}
+            for bot_name, entry in registry.items():
+                bot_dir = os.path.join(BOTS_DIR, bot_name)
+                previous_files = previous_bots.get(bot_name, {}).get('files', {})
+                files = {}
+                for file_path, arc_name in iter_bot_files(bot_dir):
+                    stat = os.stat(file_path)
+                    stats['files'] += 1
+                    previous_file = previous_files.get(arc_name)
+                    if previous_file and previous_file['size'] == stat.st_size and previous_file['mtime'] == stat.st_mtime_ns:
+                        files[arc_name] = previous_file
+                        continue
+
+                    stats['changed_files'] += 1
+                    chunks = []
+                    with open(file_path, 'rb') as f:
+                        while True:
+                            data = f.read(SNAPSHOT_CHUNK_SIZE)
+                            if not data:
+                                break
+                            digest = hashlib.sha256(data).hexdigest()
+                            chunks.append(digest)
+                            if digest not in pending and not os.path.exists(_snapshot_chunk_path(digest)):
+                                pending[digest] = pool.submit(zlib.compress, data, SNAPSHOT_COMPRESSION_LEVEL)
+                                stats['new_chunks'] += 1
+                            if len(pending) >= SNAPSHOT_MAX_PENDING_CHUNKS:
+                                stats['stored_bytes'] += _write_snapshot_chunks(pending)
+                    files[arc_name] = {
+                        'size': stat.st_size,
+                        'mtime': stat.st_mtime_ns,
+                        'mode': stat.st_mode & 0o777,
+                        'chunks': chunks,
+                    }
+                bots[bot_name] = dict(entry, files=files)
+            stats['stored_bytes'] += _write_snapshot_chunks(pending)
+
+        manifest = {'id': snapshot_id, 'created': datetime.now().isoformat(), 'bots': bots, 'stats': stats}
+        manifest_path = _snapshot_manifest_path(snapshot_id)
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        with open(f"{manifest_path}.tmp", 'w') as f:
+            json.dump(manifest, f)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+        apply_snapshot_retention()
+        return manifest
+
+def apply_snapshot_retention() -> int:
+    """Deletes snapshots beyond the retention count and any chunks no remaining snapshot uses."""
+    snapshot_ids = list_snapshot_ids()
+    for snapshot_id in snapshot_ids[max(1, SNAPSHOT_RETENTION_COUNT):]:
+        os.remove(_snapshot_manifest_path(snapshot_id))
+
+    referenced = set()
+    for snapshot_id in list_snapshot_ids():
+        manifest = load_snapshot_manifest(snapshot_id)
+        for bot_entry in (manifest or {}).get('bots', {}).values():
+            for file_entry in bot_entry['files'].values():
+                referenced.update(file_entry['chunks'])
+
+    removed_chunks = 0
+    chunks_dir = os.path.join(SNAPSHOTS_DIR, "chunks")
+    if os.path.isdir(chunks_dir):
+        for prefix in os.listdir(chunks_dir):
+            prefix_dir = os.path.join(chunks_dir, prefix)
+            for digest in os.listdir(prefix_dir):
+                if digest not in referenced:
+                    os.remove(os.path.join(prefix_dir, digest))
+                    removed_chunks += 1
+    return removed_chunks
+
+def restore_snapshot_files(snapshot_id: str, bot_names: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Rebuilds bot directories from a snapshot and returns their registry entries. Blocking."""
+    manifest = load_snapshot_manifest(snapshot_id)
+    if not manifest:
+        raise FileNotFoundError(f"Snapshot {snapshot_id} not found")
+
+    restored = {}
+    with snapshot_lock:
+        for bot_name, bot_entry in manifest['bots'].items():
+            if bot_names is not None and bot_name not in bot_names:
+                continue
+            bot_dir = os.path.join(BOTS_DIR, bot_name)
+            staging_dir = f"{bot_dir}.restore"
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            for arc_name, file_entry in bot_entry['files'].items():
+                file_path = os.path.join(staging_dir, arc_name)
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                with open(file_path, 'wb') as f:
+                    for digest in file_entry['chunks']:
+                        with open(_snapshot_chunk_path(digest), 'rb') as chunk_file:
+                            f.write(zlib.decompress(chunk_file.read()))
+                os.chmod(file_path, file_entry['mode'])
+                os.utime(file_path, ns=(file_entry['mtime'], file_entry['mtime']))
+
+            # Keep the directory swap as short as possible
+            old_dir = f"{bot_dir}.old"
+            shutil.rmtree(old_dir, ignore_errors=True)
+            if os.path.exists(bot_dir):
+                os.rename(bot_dir, old_dir)
+            os.rename(staging_dir, bot_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+            restored[bot_name] = {key: value for key, value in bot_entry.items() if key != 'files'}
+    return restored
+
+def get_snapshot_target_bots(manifest: Dict[str, Any], target: str) -> Optional[List[str]]:
+    """Resolves the target of a restore button: None for all bots, else the bot at that position in the manifest ([] if there is none)."""
+    if target == '*':
+        return None
+    bot_names = list(manifest['bots'])
+    try:
+        return [bot_names[int(target)]]
+    except (ValueError, IndexError):
+        return []
+
+async def take_snapshot() -> Dict[str, Any]:
+    registry = get_registry_entries()
+    manifest = await fs_call(create_snapshot, registry)
+    logger.info(
+        f"Snapshot {manifest['id']} created: {manifest['stats']['changed_files']}/{manifest['stats']['files']} files changed, "
+        f"{format_bytes(manifest['stats']['stored_bytes'])} new data."
+    )
+    return manifest
+
+async def restore_bots_from_snapshot(snapshot_id: str, bot_names: Optional[List[str]] = None) -> Tuple[List[str], List[str], List[str]]:
+    """Stops the affected bots, restores their files and registry entries, and starts them again.
+
+    Bots that were stopped before the restore get their files back but stay stopped. Returns the bots
+    started, the bots left stopped and the bots that failed to start.
+    """
+    manifest = await fs_call(load_snapshot_manifest, snapshot_id)
+    if not manifest:
+        return [], [], bot_names or []
+
+    targets, reserved, stopped = [], [], set()
+    restored, kept_stopped, failed = [], [], []
+    for bot_name in manifest['bots']:
+        if bot_names is not None and bot_name not in bot_names:
+            continue
+        if bot_name not in running_bots:
+            # A deleted bot is recreated, so claim its name against a concurrent deploy or restore
+            if not reserve_bot_name(bot_name):
+                failed.append(bot_name)
+                continue
+            reserved.append(bot_name)
+        elif running_bots[bot_name]['process'].poll() is not None and not is_bot_hibernated(bot_name):
+            stopped.add(bot_name)
+        targets.append(bot_name)
+        await lifecycle_call(stop_bot_process, bot_name)
+
+    try:
+        try:
+            entries = await fs_call(restore_snapshot_files, snapshot_id, targets)
+        except Exception as e:
+            logger.error(f"Restoring snapshot {snapshot_id} failed: {e}", exc_info=True)
+            entries = {}
+        for bot_name, entry in entries.items():
+            if bot_name in stopped:
+                shared = await fs_call(is_shared_runtime_bot, bot_name)
+                hibernate_minutes = await fs_call(get_hibernate_minutes, bot_name)
+                if bot_name in running_bots:
+                    running_bots[bot_name].update(token=entry['token'], restart_count=entry.get('restart_count', 0),
+                                                  shared_runtime=shared, hibernate_minutes=hibernate_minutes)
+                kept_stopped.append(bot_name)
+                continue
+            try:
+                bot_dir = os.path.join(BOTS_DIR, bot_name)
+                bot_code = await fs_read_text(os.path.join(bot_dir, "bot.py"))
+                requirements_content = await fs_read_text(os.path.join(bot_dir, "requirements.txt"))
+                bot_info = await lifecycle_call(start_bot_subprocess, bot_name, entry['token'], bot_code, requirements_content)
+            except Exception as e:
+                logger.error(f"Could not start {bot_name} from snapshot {snapshot_id}: {e}", exc_info=True)
+                bot_info = None
+            if bot_info:
+                bot_info['restart_count'] = entry.get('restart_count', 0)
+                running_bots[bot_name] = bot_info
+                restored.append(bot_name)
+
+        # Bots that were running before the restore are not left down by a failed one: start them again with
+        # whatever files they have now
+        for bot_name in targets:
+            if bot_name in restored or bot_name in kept_stopped or bot_name in failed:
+                continue
+            if bot_name in running_bots and not await lifecycle_call(start_bot_process, bot_name):
+                logger.error(f"Could not restart {bot_name} after a failed snapshot restore.")
+            failed.append(bot_name)
+    finally:
+        reserved_bot_names.difference_update(reserved)
+    return restored, kept_stopped, failed
+
+async def snapshot_scheduler():
+    """Takes a snapshot of all bots every SNAPSHOT_INTERVAL_HOURS."""
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL_HOURS * 3600)
+        if not running_bots:
+            continue
+        try:
+            await take_snapshot()
+        except Exception as e:
+            logger.error(f"Scheduled snapshot failed: {e}", exc_info=True)
 
 def create_bot_template_files():
     """Create template files if they don't exist."""
@@ -1365,6 +3684,10 @@ async def monitor_bots():
                 # Update logs
                 update_bot_logs(bot_name)
                 
+                # Hibernated bots are stopped on purpose and woken by their next update
+                if is_bot_hibernated(bot_name):
+                    continue
+                
                 # Check if process is still running
                 if process.poll() is not None:  # Process has terminated
                     logger.warning(f"Bot {bot_name} has crashed or stopped unexpectedly.")
@@ -1372,27 +3695,108 @@ async def monitor_bots():
                     # Check if we should auto-restart
                     if AUTO_RESTART_BOTS:
                         logger.info(f"Attempting to auto-restart {bot_name}...")
-                        if restart_bot_process(bot_name):
+                        if await lifecycle_call(restart_bot_process, bot_name):
                             logger.info(f"Successfully auto-restarted {bot_name}.")
                         else:
                             logger.error(f"Failed to auto-restart {bot_name}.")
                 
-                # Update resource usage
-                if process.poll() is None:  # Only if process is running
-                    try:
-                        proc = psutil.Process(process.pid)
-                        bot_info['cpu_usage'] = proc.cpu_percent(interval=0.1)
-                        bot_info['memory_usage'] = proc.memory_info().rss
-                    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                        pass
+                if process.poll() is None:
+                    await check_bot_hibernation(bot_name)
             except Exception as e:
                 logger.error(f"Error monitoring bot {bot_name}: {e}")
+
+        # Update resource usage of all own-process bots in one sample off the loop
+        pids = {name: info['process'].pid for name, info in running_bots.items()
+                if not isinstance(info['process'], SharedRuntimeBot) and info['process'].poll() is None}
+        for bot_name, (cpu, memory) in (await asyncio.to_thread(sample_process_usage, pids)).items():
+            if bot_name in running_bots:
+                running_bots[bot_name].update(cpu_usage=cpu, memory_usage=memory)
+        if SHARED_RUNTIME:
+            await asyncio.to_thread(get_shared_runtime_usage)
                 
         await asyncio.sleep(30)  # Check every 30 seconds
 
-# --- Authorization Decorator ---
-from functools import wraps
+# --- Handler Instrumentation ---
+# authorized_only times every handler. Wall time is split into CPU time spent in the handler's own steps on
+# the event loop and time spent waiting on the Telegram API (measured by the rate limiter); the rest is
+# other waiting, e.g. filesystem or subprocess work. Latencies go into fixed histogram buckets.
+HANDLER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+handler_timing: contextvars.ContextVar = contextvars.ContextVar('handler_timing', default=None)
+handler_stats: Dict[str, Dict[str, Any]] = {}
+
+class LatencyHistogram:
+    __slots__ = ('counts', 'total')
+
+    def __init__(self):
+        self.counts = [0] * (len(HANDLER_BUCKETS) + 1)  # Last bucket is +Inf
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(HANDLER_BUCKETS, value)] += 1
+        self.total += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the largest finite bound for the +Inf bucket)."""
+        count = self.count
+        if not count:
+            return 0.0
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= q * count:
+                return HANDLER_BUCKETS[min(i, len(HANDLER_BUCKETS) - 1)]
+        return HANDLER_BUCKETS[-1]
+
+def get_handler_stats(name: str) -> Dict[str, Any]:
+    stats = handler_stats.get(name)
+    if stats is None:
+        stats = handler_stats[name] = {
+            'wall': LatencyHistogram(), 'cpu': LatencyHistogram(), 'api': LatencyHistogram(),
+            'errors': 0, 'in_flight': 0
+        }
+    return stats
+
+@types.coroutine
+def measure_cpu_time(coro, timing: Dict[str, float]):
+    """Awaits coro, adding the CPU time of each of its steps on the event loop to timing['cpu']."""
+    value, error = None, None
+    while True:
+        started = time.thread_time()
+        try:
+            yielded = coro.send(value) if error is None else coro.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            timing['cpu'] += time.thread_time() - started
+        try:
+            value, error = (yield yielded), None
+        except BaseException as e:
+            value, error = None, e
+
+async def run_instrumented_handler(name: str, coro):
+    stats = get_handler_stats(name)
+    timing = {'cpu': 0.0, 'api': 0.0}
+    token = handler_timing.set(timing)
+    stats['in_flight'] += 1
+    started = time.perf_counter()
+    try:
+        return await measure_cpu_time(coro, timing)
+    except Exception:
+        stats['errors'] += 1
+        raise
+    finally:
+        stats['in_flight'] -= 1
+        stats['wall'].observe(time.perf_counter() - started)
+        stats['cpu'].observe(timing['cpu'])
+        stats['api'].observe(timing['api'])
+        handler_timing.reset(token)
 
+# --- Authorization Decorator ---
 def authorized_only(func):
     @wraps(func)
     async def wrapped(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
@@ -1404,7 +3808,7 @@ def authorized_only(func):
             elif update.callback_query:
                 await update.callback_query.answer("🛡️ You are not authorized.", show_alert=True)
             return
-        return await func(update, context, *args, **kwargs)
+        return await run_instrumented_handler(func.__name__, func(update, context, *args, **kwargs))
     return wrapped
 
 # --- Core Command Handlers ---
@@ -1417,9 +3821,10 @@ I can host and manage your Python Telegram bots.
 """
     # Using animation instead of photo for GIF
     if update.message:
-        await update.message.reply_animation(
-            animation=LOADING_ANIMATION_URL, 
-            caption=welcome_message, 
+        await send_media_asset(
+            update.message.reply_animation,
+            START_IMAGE_URL,
+            caption=welcome_message,
             parse_mode=ParseMode.MARKDOWN, 
             reply_markup=get_main_menu_keyboard()
         )
@@ -1445,9 +3850,11 @@ This bot allows you to host other Telegram bots directly from this chat.
 
 {EMOJI.PLAY_ALL} *Bot Management:*
 - Start/Stop/Restart individual bots
-- View logs and resource usage
+- View logs and resource usage, paging back through older logs
+- Watch a bot's output live with Live Tail
+- Jump to a point in a bot's logs with `/logs <bot> YYYY-MM-DD HH:MM`
 - Download or edit bot code
-- Backup your bots
+- Backup your bots and restore them from a backup zip
 - Start or stop all bots at once
 
 {EMOJI.WARNING} *Disclaimer:*
@@ -1465,10 +3872,10 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     running_count = sum(1 for bot in running_bots.values() if bot['process'].poll() is None)
     
     # Get directory and disk stats
-    bots_dir_size = get_dir_size(BOTS_DIR)
-    mirror_dir_size = get_dir_size(MIRROR_DIR)
-    logs_dir_size = get_dir_size(LOGS_DIR)
-    total, used, free = shutil.disk_usage("/")
+    bots_dir_size = await fs_call(get_dir_size, BOTS_DIR)
+    mirror_dir_size = await fs_call(get_dir_size, MIRROR_DIR)
+    logs_dir_size = await fs_call(get_dir_size, LOGS_DIR)
+    total, used, free = await fs_call(shutil.disk_usage, "/")
     
     stats_text = f"""
 {EMOJI.BAR_CHART} *Hosting Statistics*
@@ -1483,40 +3890,136 @@ Disk Total: `{format_bytes(total)}`
 Disk Used: `{format_bytes(used)}`
 Disk Free: `{format_bytes(free)}`
 """
+    if log_retention_stats['last_run']:
+        stats_text += (
+            f"{EMOJI.CLEAN} Log Retention: reclaimed `{format_bytes(log_retention_stats['last_bytes'])}` "
+            f"at {log_retention_stats['last_run'].strftime('%H:%M')} "
+            f"(`{format_bytes(log_retention_stats['total_bytes'])}` since start)\n"
+        )
     await edit_or_reply_message(update, stats_text, get_stats_keyboard())
 
 @authorized_only
-async def system_health_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def loop_health_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    if query:
-        await query.answer("Checking system health...")
-    
-    health = get_system_health()
-    
-    health_text = f"""
-{EMOJI.HEALTH} *System Health*
-{EMOJI.BAR_CHART} *CPU Usage:* `{health['cpu_percent']}%`
-{EMOJI.STORAGE} *Memory:* `{health['memory_used']} / {health['memory_total']} ({health['memory_percent']}%)`
-{EMOJI.STORAGE} *Disk:* `{health['disk_used']} / {health['disk_total']} ({health['disk_percent']}%)`
-{EMOJI.ROCKET} *System Uptime:* `{health['boot_time']}`
-{EMOJI.ROBOT} *Running Bots:* `{sum(1 for bot in running_bots.values() if bot['process'].poll() is None)}`
-"""
-    
+    if query.data == 'loop_health_reset':
+        reset_loop_watchdog()
+        await query.answer("Watchdog statistics reset.")
+    else:
+        await query.answer()
+
+    lag = get_loop_lag_summary()
+    text = f"""
+{EMOJI.TIMER} *Event Loop*
+*Lag now:* `{lag['current'] * 1000:.0f} ms`
+*Last 5 min:* p50 `{lag['p50'] * 1000:.0f} ms`, p99 `{lag['p99'] * 1000:.0f} ms`, max `{lag['window_max'] * 1000:.0f} ms`
+*Stalls over {LOOP_LAG_THRESHOLD_MS} ms:* `{lag['stalls']}`, `{lag['stall_time']:.1f}s` in total, worst `{lag['max_lag'] * 1000:.0f} ms`
+"""
+    if lag['offenders']:
+        text += "\n*Worst Offenders:*\n"
+        for site, entry in lag['offenders'][:5]:
+            text += f"- `{site}`: `{entry['count']}`x, `{entry['total']:.1f}s` total, max `{entry['max'] * 1000:.0f} ms`\n"
+        worst_stack = lag['offenders'][0][1]['stack'].replace('`', "'")[-1500:]
+        text += f"\n*Stack of the worst stall:*\n```\n{worst_stack}```"
+    elif not LOOP_LAG_THRESHOLD_MS:
+        text += "\n_Stack capture is disabled (loop\\_lag\\_threshold\\_ms is 0)._"
+    else:
+        text += "\nNo stalls recorded."
+
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{EMOJI.RESTART} Refresh", callback_data='loop_health'),
+         InlineKeyboardButton(f"{EMOJI.CLEAN} Reset", callback_data='loop_health_reset')],
+        [InlineKeyboardButton(f"{EMOJI.BACK} Back to Stats", callback_data='stats')]
+    ])
+    await edit_or_reply_message(update, text, keyboard)
+
+@authorized_only
+async def perf_stats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if query.data == 'perf_stats_reset':
+        handler_stats.clear()
+        await query.answer("Handler statistics reset.")
+    else:
+        await query.answer()
+
+    ranked = sorted(handler_stats.items(), key=lambda item: (item[1]['wall'].quantile(0.95), item[1]['wall'].count), reverse=True)
+    text = f"{EMOJI.ROCKET} *Handler Performance*\n_Slowest handlers by p95 latency; CPU and API are per-call averages._\n\n"
+    if not ranked:
+        text += "No handler calls recorded yet."
+    for name, stats in ranked[:12]:
+        wall = stats['wall']
+        count = wall.count
+        if not count:
+            continue
+        text += (
+            f"*{name.replace('_', ' ')}* `{count}`x\n"
+            f"  p50 `{wall.quantile(0.5) * 1000:.0f} ms`, p95 `{wall.quantile(0.95) * 1000:.0f} ms`, "
+            f"CPU `{stats['cpu'].total / count * 1000:.1f} ms`, API `{stats['api'].total / count * 1000:.0f} ms`"
+        )
+        if stats['errors']:
+            text += f", {EMOJI.WARNING} `{stats['errors']}` errors"
+        if stats['in_flight']:
+            text += f", in flight `{stats['in_flight']}`"
+        text += "\n"
+
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{EMOJI.RESTART} Refresh", callback_data='perf_stats'),
+         InlineKeyboardButton(f"{EMOJI.CLEAN} Reset", callback_data='perf_stats_reset')],
+        [InlineKeyboardButton(f"{EMOJI.BACK} Back to Stats", callback_data='stats')]
+    ])
+    await edit_or_reply_message(update, text, keyboard)
+
+@authorized_only
+async def system_health_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if query:
+        await query.answer("Checking system health...")
+    
+    health = await asyncio.to_thread(get_system_health)
+    
+    health_text = f"""
+{EMOJI.HEALTH} *System Health*
+{EMOJI.BAR_CHART} *CPU Usage:* `{health['cpu_percent']}%`
+{EMOJI.STORAGE} *Memory:* `{health['memory_used']} / {health['memory_total']} ({health['memory_percent']}%)`
+{EMOJI.STORAGE} *Disk:* `{health['disk_used']} / {health['disk_total']} ({health['disk_percent']}%)`
+{EMOJI.ROCKET} *System Uptime:* `{health['boot_time']}`
+{EMOJI.ROBOT} *Running Bots:* `{sum(1 for bot in running_bots.values() if bot['process'].poll() is None)}`
+"""
+    ready_phase = 'webhook' if MANAGER_WEBHOOK else 'polling'
+    healthy_at, ready_at = get_startup_phase('healthy'), get_startup_phase(ready_phase)
+    if healthy_at is not None and ready_at is not None:
+        health_text += f"{EMOJI.TIMER} *Boot:* /health up after `{healthy_at:.2f}s`, {ready_phase} after `{ready_at:.2f}s`\n"
+
+    rate_limiter = context.bot.rate_limiter
+    if isinstance(rate_limiter, OutboundRateLimiter):
+        outbound = rate_limiter.stats
+        health_text += f"{EMOJI.UPLOAD} *Telegram Requests:* `{outbound['sent']}` sent, `{outbound['throttled']}` throttled, `{outbound['coalesced']}` edits merged, `{outbound['flood_waits']}` flood waits\n"
+    if BOT_API_PROXY:
+        proxy_summary = get_bot_api_proxy_summary()
+        health_text += f"{EMOJI.WRENCH} *Bot API Proxy:* `{sum(stats['requests'] for _, stats in proxy_summary)}` requests, `{sum(stats['in_flight'] for _, stats in proxy_summary)}` in flight, `{sum(stats['errors'] for _, stats in proxy_summary)}` errors\n"
+        for bot_name, stats in proxy_summary[:3]:
+            average_ms = stats['total_time'] / stats['requests'] * 1000 if stats['requests'] else 0
+            health_text += f"- `{bot_name}`: `{stats['requests']}` requests, avg `{average_ms:.0f} ms`, `{stats['throttled']}` throttled\n"
+    if SHARED_RUNTIME:
+        shared_bots = [name for name, info in running_bots.items() if isinstance(info['process'], SharedRuntimeBot) and info['process'].poll() is None]
+        health_text += f"{EMOJI.WRENCH} *Shared Runtime:* `{len(shared_bots)}`/`{SHARED_RUNTIME_MAX_BOTS}` bots loaded\n"
+    if WEBHOOK_INGRESS:
+        health_text += f"{EMOJI.LIVE} *Webhook Ingress:* `{len(ingress_routes)}` bots, `{ingress_stats['forwarded']}` forwarded, `{ingress_stats['unavailable']}` unavailable, `{ingress_stats['rejected']}` rejected, `{sum(1 for name in running_bots if is_bot_hibernated(name))}` hibernated\n"
+    
     # Add info about top resource-consuming bots
     if running_bots:
         health_text += "\n*Top Resource-Using Bots:*\n"
         
         # Get resource usage for all running bots
         bot_resources = []
+        pids = {}
         for bot_name, bot_info in running_bots.items():
-            if bot_info['process'].poll() is None:  # Only if process is running
-                try:
-                    proc = psutil.Process(bot_info['process'].pid)
-                    cpu = proc.cpu_percent(interval=0.1)
-                    memory = proc.memory_info().rss
-                    bot_resources.append((bot_name, cpu, memory))
-                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                    pass
+            if isinstance(bot_info['process'], SharedRuntimeBot):
+                if bot_info['process'].poll() is None:
+                    bot_resources.append((bot_name, bot_info.get('cpu_usage', 0.0), 0))
+            elif bot_info['process'].poll() is None:  # Only if process is running
+                pids[bot_name] = bot_info['process'].pid
+        usage = await asyncio.to_thread(sample_process_usage, pids)
+        bot_resources.extend((bot_name, cpu, memory) for bot_name, (cpu, memory) in usage.items())
         
         # Sort by CPU usage and show top 3
         if bot_resources:
@@ -1549,7 +4052,10 @@ async def list_bots_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Add bot list
     for bot_name, info in running_bots.items():
-        status_emoji = EMOJI.GREEN_CIRCLE if info['process'].poll() is None else EMOJI.RED_CIRCLE
+        if is_bot_hibernated(bot_name):
+            status_emoji = EMOJI.SLEEP
+        else:
+            status_emoji = EMOJI.GREEN_CIRCLE if info['process'].poll() is None else EMOJI.RED_CIRCLE
         keyboard.append([InlineKeyboardButton(f"{status_emoji} {bot_name}", callback_data=f"select_bot:{bot_name}")])
     
     # Add batch operations
@@ -1572,9 +4078,9 @@ async def start_all_bots_command(update: Update, context: ContextTypes.DEFAULT_T
     started_count = 0
     failed_count = 0
     
-    for bot_name in running_bots:
-        if running_bots[bot_name]['process'].poll() is not None:  # Bot is not running
-            if start_bot_process(bot_name):
+    for bot_name in list(running_bots.keys()):
+        if bot_name in running_bots and running_bots[bot_name]['process'].poll() is not None:  # Bot is not running
+            if await lifecycle_call(start_bot_process, bot_name):
                 started_count += 1
             else:
                 failed_count += 1
@@ -1595,8 +4101,8 @@ async def stop_all_bots_command(update: Update, context: ContextTypes.DEFAULT_TY
     stopped_count = 0
     
     for bot_name in list(running_bots.keys()):
-        if running_bots[bot_name]['process'].poll() is None:  # Bot is running
-            if stop_bot_process(bot_name):
+        if bot_name in running_bots and running_bots[bot_name]['process'].poll() is None:  # Bot is running
+            if await lifecycle_call(stop_bot_process, bot_name):
                 stopped_count += 1
     
     await loading_msg.edit_caption(f"{EMOJI.SUCCESS} Stopped {stopped_count} bots.", reply_markup=get_main_menu_keyboard())
@@ -1608,16 +4114,116 @@ async def clean_logs_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     loading_msg = await send_loading_animation(context, query.message.chat_id, f"{EMOJI.LOADING} Cleaning old logs...")
     
-    cleaned_count = clean_old_logs()
+    cleaned_count, reclaimed = await fs_call(enforce_log_retention, None, get_active_log_paths())
     
     await loading_msg.edit_caption(
-        f"{EMOJI.SUCCESS} Cleaned {cleaned_count} old log files.\n\n"
-        f"Log retention policy: {LOG_RETENTION_DAYS} days",
+        f"{EMOJI.SUCCESS} Cleaned {cleaned_count} old log files ({format_bytes(reclaimed)}).\n\n"
+        f"Log retention policy: {LOG_RETENTION_DAYS} days, {format_bytes(LOG_MAX_BYTES_PER_BOT)} per bot, {format_bytes(LOG_MAX_TOTAL_BYTES)} total",
         reply_markup=get_stats_keyboard()
     )
 
+@authorized_only
+async def snapshot_list_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+
+    snapshot_ids = await fs_call(list_snapshot_ids)
+    snapshot_size = await fs_call(get_dir_size, SNAPSHOTS_DIR)
+    schedule_text = f"every {SNAPSHOT_INTERVAL_HOURS} hours" if SNAPSHOT_INTERVAL_HOURS else "disabled"
+    text = f"""
+{EMOJI.BACKUP} *Snapshots*
+Scheduled snapshots: `{schedule_text}`, keeping the last `{SNAPSHOT_RETENTION_COUNT}`.
+Snapshot storage: `{format_bytes(snapshot_size)}`
+"""
+    if not snapshot_ids:
+        text += "\n_No snapshots have been taken yet._"
+    else:
+        text += "\nSelect a snapshot to restore from it:"
+    await edit_or_reply_message(update, text, get_snapshot_list_keyboard(snapshot_ids))
+
+@authorized_only
+async def snapshot_now_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer("Taking snapshot...")
+
+    if not running_bots:
+        await edit_or_reply_message(update, f"{EMOJI.CLIPBOARD} There are no bots to snapshot.", get_snapshot_list_keyboard(await fs_call(list_snapshot_ids)))
+        return
+
+    loading_msg = await send_loading_animation(context, query.message.chat_id, f"{EMOJI.LOADING} Taking a snapshot of all bots...")
+    try:
+        manifest = await take_snapshot()
+        stats = manifest['stats']
+        await loading_msg.edit_caption(
+            f"{EMOJI.SUCCESS} Snapshot `{manifest['id']}` created.\n\n"
+            f"Bots: `{len(manifest['bots'])}`\n"
+            f"Changed files: `{stats['changed_files']}/{stats['files']}`\n"
+            f"New data stored: `{format_bytes(stats['stored_bytes'])}`",
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=get_snapshot_list_keyboard(await fs_call(list_snapshot_ids))
+        )
+    except Exception as e:
+        logger.error(f"Error taking snapshot: {e}", exc_info=True)
+        await loading_msg.edit_caption(f"{EMOJI.CANCEL} Failed to take snapshot: {str(e)}", reply_markup=get_stats_keyboard())
+
+@authorized_only
+async def snapshot_view_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+
+    snapshot_id = query.data.split(':', 1)[1]
+    manifest = await fs_call(load_snapshot_manifest, snapshot_id)
+    if not manifest:
+        await edit_or_reply_message(update, f"{EMOJI.CANCEL} Snapshot not found.", get_snapshot_list_keyboard(await fs_call(list_snapshot_ids)))
+        return
+
+    text = f"{EMOJI.BACKUP} *Snapshot* `{snapshot_id}`\n\n"
+    for bot_name, bot_entry in manifest['bots'].items():
+        bot_size = sum(file_entry['size'] for file_entry in bot_entry['files'].values())
+        text += f"- `{bot_name}`: {len(bot_entry['files'])} files, `{format_bytes(bot_size)}`\n"
+    await edit_or_reply_message(update, text, get_snapshot_keyboard(snapshot_id, list(manifest['bots'])))
+
+@authorized_only
+async def snapshot_restore_confirm_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+
+    _, snapshot_id, target = query.data.split(':', 2)
+    manifest = await fs_call(load_snapshot_manifest, snapshot_id)
+    target_bots = get_snapshot_target_bots(manifest, target) if manifest else []
+    if target_bots == []:
+        await edit_or_reply_message(update, f"{EMOJI.CANCEL} Snapshot not found.", get_snapshot_list_keyboard(await fs_call(list_snapshot_ids)))
+        return
+    target_text = "all bots" if target_bots is None else f"`{target_bots[0]}`"
+    await edit_or_reply_message(
+        update,
+        f"{EMOJI.WARNING} Restore {target_text} from snapshot `{snapshot_id}`?\n\nCurrent code will be replaced and running bots restarted; stopped bots stay stopped.",
+        get_snapshot_restore_confirmation_keyboard(snapshot_id, target)
+    )
+
+@authorized_only
+async def snapshot_restore_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer("Restoring...")
+
+    _, snapshot_id, target = query.data.split(':', 2)
+    loading_msg = await send_loading_animation(context, query.message.chat_id, f"{EMOJI.LOADING} Restoring from snapshot `{snapshot_id}`...")
+    try:
+        manifest = await fs_call(load_snapshot_manifest, snapshot_id)
+        target_bots = get_snapshot_target_bots(manifest, target) if manifest else []
+        restored, kept_stopped, failed = await restore_bots_from_snapshot(snapshot_id, target_bots)
+        result_text = f"{EMOJI.SUCCESS} Restored and started {len(restored)} bots."
+        if kept_stopped:
+            result_text += f"\n{EMOJI.STOP} Restored but left stopped: {', '.join(kept_stopped)}"
+        if failed:
+            result_text += f"\n{EMOJI.WARNING} Failed to restore: {', '.join(failed)} (bots that were running were started again)"
+        await loading_msg.edit_caption(result_text, reply_markup=get_main_menu_keyboard())
+    except Exception as e:
+        logger.error(f"Error restoring snapshot {snapshot_id}: {e}", exc_info=True)
+        await loading_msg.edit_caption(f"{EMOJI.CANCEL} Failed to restore snapshot: {str(e)}", reply_markup=get_stats_keyboard())
+
 # --- Conversation Handlers States ---
-(ASK_BOT_NAME, GET_BOT_FILE, GET_TOKEN, GET_REQUIREMENTS, ASK_MIRROR_FILE, EDIT_CODE) = range(6)
+(ASK_BOT_NAME, GET_BOT_FILE, GET_TOKEN, GET_REQUIREMENTS, ASK_MIRROR_FILE, EDIT_CODE, GET_RESTORE_FILE, ASK_LOG_QUERY) = range(8)
 
 # --- Upload Bot Conversation ---
 @authorized_only
@@ -1646,7 +4252,7 @@ async def ask_bot_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         await update.message.reply_text(f"{EMOJI.CANCEL} Invalid name. Please use only letters, numbers, and underscores. Try again.", reply_markup=get_cancel_keyboard())
         return ASK_BOT_NAME
         
-    if bot_name in running_bots:
+    if bot_name in running_bots or bot_name in reserved_bot_names:
         await update.message.reply_text(f"{EMOJI.CANCEL} A bot with this name already exists. Please choose another name.", reply_markup=get_cancel_keyboard())
         return ASK_BOT_NAME
         
@@ -1666,14 +4272,25 @@ async def receive_bot_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         
     loading_msg = await send_loading_animation(context, update.effective_chat.id, f"{EMOJI.LOADING} Downloading your bot file...")
     
+    # Timed here and carried into the deploy trace started once the token and requirements are in
+    upload_started = time.perf_counter()
     with tempfile.TemporaryDirectory() as temp_dir:
         temp_file_path = os.path.join(temp_dir, document.file_name)
         if not await download_file(context.bot, document.file_id, temp_file_path):
             await loading_msg.edit_caption(f"{EMOJI.CANCEL} Failed to download the file. Please try again.", reply_markup=get_cancel_keyboard())
             return GET_BOT_FILE
             
-        with open(temp_file_path, 'r', encoding='utf-8') as f:
-            context.user_data['bot_code'] = f.read()
+        context.user_data['bot_code'] = await fs_read_text(temp_file_path)
+    
+    await loading_msg.edit_caption(f"{EMOJI.LOADING} Checking your code...")
+    compile_started = time.perf_counter()
+    compile_error = await preflight_compile(context.user_data['bot_code'])
+    context.user_data['deploy_spans'] = {
+        'download': compile_started - upload_started, 'compile': time.perf_counter() - compile_started
+    }
+    if compile_error:
+        await loading_msg.edit_caption(f"{compile_error}\n\nPlease fix it and send the file again.", parse_mode=ParseMode.MARKDOWN, reply_markup=get_cancel_keyboard())
+        return GET_BOT_FILE
     
     bot_name = context.user_data['bot_name']
     await loading_msg.edit_caption(f"{EMOJI.SUCCESS} Bot file received!\n\n{EMOJI.KEY} Now, please send me the Telegram token for `{bot_name}`.", parse_mode=ParseMode.MARKDOWN, reply_markup=get_cancel_keyboard())
@@ -1715,8 +4332,7 @@ async def receive_requirements_file(update: Update, context: ContextTypes.DEFAUL
             await loading_msg.edit_caption(f"{EMOJI.CANCEL} Failed to download the requirements file. Please try again.", reply_markup=get_cancel_keyboard())
             return GET_REQUIREMENTS
         
-        with open(temp_file_path, 'r', encoding='utf-8') as f:
-            context.user_data['requirements_content'] = f.read()
+        context.user_data['requirements_content'] = await fs_read_text(temp_file_path)
     
     await loading_msg.delete()
     return await finalize_and_run_bot(update, context)
@@ -1735,10 +4351,19 @@ async def finalize_and_run_bot(update: Update, context: ContextTypes.DEFAULT_TYP
     
     status_msg = await send_loading_animation(context, chat_id, f"{EMOJI.LOADING} Finalizing setup and starting `{bot_name}`...")
     
-    bot_info = start_bot_subprocess(bot_name, bot_token, bot_code, requirements_content)
+    if not reserve_bot_name(bot_name):
+        await status_msg.edit_caption(f"{EMOJI.CANCEL} A bot named `{bot_name}` was created in the meantime. Please upload again with another name.", parse_mode=ParseMode.MARKDOWN, reply_markup=get_back_to_main_menu_keyboard())
+        context.user_data.clear()
+        return ConversationHandler.END
+    try:
+        with lifecycle_trace(bot_name, 'deploy', context.user_data.get('deploy_spans')):
+            bot_info = await lifecycle_call(start_bot_subprocess, bot_name, bot_token, bot_code, requirements_content)
+            if bot_info:
+                running_bots[bot_name] = bot_info
+    finally:
+        reserved_bot_names.discard(bot_name)
     
     if bot_info:
-        running_bots[bot_name] = bot_info
         await status_msg.edit_caption(f"{EMOJI.PARTY} Hooray! Your bot `{bot_name}` is now running!", parse_mode=ParseMode.MARKDOWN, reply_markup=get_back_to_main_menu_keyboard())
     else:
         await status_msg.edit_caption(f"{EMOJI.CANCEL} A critical error occurred while starting your bot. Please check your code and token, then try again.", reply_markup=get_back_to_main_menu_keyboard())
@@ -1768,7 +4393,7 @@ async def template_list_command(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
     
     # Create template files if they don't exist
-    create_bot_template_files()
+    await fs_call(create_bot_template_files)
     
     template_text = f"{EMOJI.TEMPLATE} *Bot Templates*\n\nChoose a template to create a new bot quickly:"
     await edit_or_reply_message(update, template_text, get_template_list_keyboard())
@@ -1788,9 +4413,11 @@ async def select_template_command(update: Update, context: ContextTypes.DEFAULT_
         return
 
     template_info = BOT_TEMPLATES[template_id]
-    template_path = os.path.join(os.getcwd(), template_info['file'])
+    template_path = os.path.join(DATA_DIR, template_info['file'])
 
-    if not os.path.exists(template_path):
+    await fs_call(create_bot_template_files)
+    template_code = await fs_read_text(template_path)
+    if template_code is None:
         await edit_or_reply_message(
             update,
             f"{EMOJI.CANCEL} Template file not found. Please try again later.",
@@ -1798,9 +4425,6 @@ async def select_template_command(update: Update, context: ContextTypes.DEFAULT_
         )
         return
 
-    with open(template_path, 'r') as f:
-        template_code = f.read()
-
     template_preview = template_code[:500] + "..." if len(template_code) > 500 else template_code
 
     template_text = f"""
@@ -1829,9 +4453,11 @@ async def use_template_command(update: Update, context: ContextTypes.DEFAULT_TYP
         return ConversationHandler.END
 
     template_info = BOT_TEMPLATES[template_id]
-    template_path = os.path.join(os.getcwd(), template_info['file'])
+    template_path = os.path.join(DATA_DIR, template_info['file'])
 
-    if not os.path.exists(template_path):
+    await fs_call(create_bot_template_files)
+    template_code = await fs_read_text(template_path)
+    if template_code is None:
         await edit_or_reply_message(
             update,
             f"{EMOJI.CANCEL} Template file not found. Please try again later.",
@@ -1839,9 +4465,6 @@ async def use_template_command(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         return ConversationHandler.END
 
-    with open(template_path, 'r') as f:
-        template_code = f.read()
-
     # Store the template code in user_data
     context.user_data['bot_code'] = template_code
 
@@ -1861,591 +4484,2135 @@ async def use_template_command(update: Update, context: ContextTypes.DEFAULT_TYP
     )
     return ASK_BOT_NAME
 
---- Mirror File Conversation & Management ---
+# --- Mirror File Conversation & Management ---
 @authorized_only
 async def mirror_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-query = update.callback_query
-await query.answer()
-
-if not RENDER_EXTERNAL_URL:
-await edit_or_reply_message(update, f"{EMOJI.WARNING} Mirror service is not configured.", get_back_to_main_menu_keyboard())
-return ConversationHandler.END
-
-await query.message.delete()
-await query.message.chat.send_message(
-f"{EMOJI.MIRROR} *File Mirror*\n\nSend me any file (up to {MAX_MIRROR_FILE_SIZE/1024/1024:.0f}MB).",
-parse_mode=ParseMode.MARKDOWN,
-reply_markup=get_cancel_keyboard()
-)
-return ASK_MIRROR_FILE
+    query = update.callback_query
+    await query.answer()
+
+    if not RENDER_EXTERNAL_URL:
+        await edit_or_reply_message(update, f"{EMOJI.WARNING} Mirror service is not configured.", get_back_to_main_menu_keyboard())
+        return ConversationHandler.END
+
+    ttl_hours = context.user_data.setdefault('mirror_ttl_hours', MIRROR_DEFAULT_TTL_HOURS)
+    await query.message.delete()
+    await query.message.chat.send_message(
+        get_mirror_prompt_text(ttl_hours),
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=get_mirror_queue_keyboard(ttl_hours)
+    )
+    return ASK_MIRROR_FILE
+
+def get_mirror_prompt_text(ttl_hours: int) -> str:
+    return (
+        f"{EMOJI.MIRROR} *File Mirror*\n\nSend me one or more files (up to {MAX_MIRROR_FILE_SIZE/1024/1024:.0f}MB each).\n"
+        f"Each file is queued and you will get a link as soon as it is downloaded. Press *Done* when you are finished.\n\n"
+        f"Keep files for: *{format_mirror_ttl(ttl_hours)}*"
+    )
+
+async def mirror_set_ttl(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    ttl_hours = int(query.data.split(':', 1)[1])
+    await query.answer(f"Files will be kept for: {format_mirror_ttl(ttl_hours)}")
+
+    context.user_data['mirror_ttl_hours'] = ttl_hours
+    await edit_or_reply_message(update, get_mirror_prompt_text(ttl_hours), get_mirror_queue_keyboard(ttl_hours))
+    return ASK_MIRROR_FILE
+
 async def receive_mirror_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-message = update.message
-file_source = message.document or message.video or message.audio or (message.photo[-1] if message.photo else None)
+    message = update.message
+    file_source = message.document or message.video or message.audio or (message.photo[-1] if message.photo else None)
 
-if not file_source:
-await message.reply_text(f"{EMOJI.CANCEL} Please send a file or media to mirror.", reply_markup=get_cancel_keyboard())
-return ASK_MIRROR_FILE
+    if not file_source:
+        await message.reply_text(f"{EMOJI.CANCEL} Please send a file or media to mirror.", reply_markup=get_mirror_queue_keyboard())
+        return ASK_MIRROR_FILE
 
-if file_source.file_size > MAX_MIRROR_FILE_SIZE:
-await message.reply_text(f"{EMOJI.CANCEL} File is too large. Maximum size is {MAX_MIRROR_FILE_SIZE/1024/1024:.0f}MB.", reply_markup=get_cancel_keyboard())
-return ASK_MIRROR_FILE
+    if file_source.file_size > MAX_MIRROR_FILE_SIZE:
+        await message.reply_text(f"{EMOJI.CANCEL} File is too large. Maximum size is {MAX_MIRROR_FILE_SIZE/1024/1024:.0f}MB.", reply_markup=get_mirror_queue_keyboard())
+        return ASK_MIRROR_FILE
 
-loading_msg = await send_loading_animation(context, message.chat_id, f"{EMOJI.LOADING} Downloading your file...")
+    if MIRROR_STORAGE_QUOTA and file_source.file_size > MIRROR_STORAGE_QUOTA:
+        await message.reply_text(f"{EMOJI.CANCEL} File is larger than the mirror storage quota of {format_bytes(MIRROR_STORAGE_QUOTA)}.", reply_markup=get_mirror_queue_keyboard())
+        return ASK_MIRROR_FILE
 
-try:
-file_name = getattr(file_source, 'file_name', f"{file_source.file_unique_id}.dat")
-sanitized_filename = f"{file_source.file_unique_id}_{os.path.basename(file_name)}"
-file_path = os.path.join(MIRROR_DIR, sanitized_filename)
+    if not await fs_call(mirror_disk_can_fit, file_source.file_size):
+        await message.reply_text(f"{EMOJI.CANCEL} There is not enough disk space for this file, even after clearing the mirror storage.", reply_markup=get_mirror_queue_keyboard())
+        return ASK_MIRROR_FILE
 
-if not await download_file(context.bot, file_source.file_id, file_path):
-await loading_msg.edit_caption(f"{EMOJI.CANCEL} Failed to download the file. Please try again.", reply_markup=get_cancel_keyboard())
-return ASK_MIRROR_FILE
+    file_name = getattr(file_source, 'file_name', None) or f"{file_source.file_unique_id}.dat"
+    sanitized_filename = f"{file_source.file_unique_id}_{os.path.basename(file_name)}"
 
-file_url = f"{RENDER_EXTERNAL_URL}/mirror/{sanitized_filename}"
+    if mirror_user_queue_full(update.effective_user.id):
+        await message.reply_text(
+            f"{EMOJI.WARNING} You already have {MIRROR_MAX_QUEUED_PER_USER} files waiting. Please wait for some of them to finish.",
+            reply_markup=get_mirror_queue_keyboard()
+        )
+        return ASK_MIRROR_FILE
+
+    # The status message is set up before queuing so a fast worker can't be overwritten by it
+    status_msg = await send_loading_animation(
+        context,
+        message.chat_id,
+        f"{EMOJI.LOADING} `{file_name}` is queued (position {mirror_queue_length() + 1}).\n\nSend another file or press *Done*.",
+        reply_markup=get_mirror_queue_keyboard()
+    )
+    await enqueue_mirror_job({
+        'id': f"{message.chat_id}:{message.message_id}",
+        'user_id': update.effective_user.id,
+        'bot': context.bot,
+        'file_id': file_source.file_id,
+        'file_name': file_name,
+        'file_size': file_source.file_size,
+        'file_path': os.path.join(MIRROR_DIR, sanitized_filename),
+        'ttl_hours': context.user_data.get('mirror_ttl_hours', MIRROR_DEFAULT_TTL_HOURS),
+        'status_msg': status_msg,
+        'last_update': 0.0,
+    })
+
+    context.user_data['mirror_queued'] = context.user_data.get('mirror_queued', 0) + 1
+    return ASK_MIRROR_FILE
+
+async def mirror_done(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
 
-await loading_msg.edit_caption(
-f"{EMOJI.SUCCESS} *File Mirrored Successfully!*\n\n"
-f"Here is your direct link:\n`{file_url}`",
-parse_mode=ParseMode.MARKDOWN,
-reply_markup=get_back_to_main_menu_keyboard()
-)
-except Exception as e:
-logger.error(f"Error mirroring file: {e}", exc_info=True)
-await loading_msg.edit_caption(f"{EMOJI.CANCEL} An error occurred while mirroring the file. Please try again.")
+    queued = context.user_data.pop('mirror_queued', 0)
+    context.user_data.pop('mirror_ttl_hours', None)
+    await edit_or_reply_message(
+        update,
+        f"{EMOJI.SUCCESS} {queued} file(s) queued for mirroring. Each status message will show its link when ready.",
+        get_back_to_main_menu_keyboard()
+    )
+    return ConversationHandler.END
 
-return ConversationHandler.END
 @authorized_only
 async def manage_mirror_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-query = update.callback_query
-await query.answer()
-
-mirror_size = get_dir_size(MIRROR_DIR)
-text = f"""
-{EMOJI.MIRROR} Mirror Management
-You are currently using {format_bytes(mirror_size)} of storage for mirrored files.
-Maximum file size: {format_bytes(MAX_MIRROR_FILE_SIZE)}
-Remember that this storage is temporary and will be wiped on server restarts or redeploys.
+    query = update.callback_query
+    await query.answer()
+
+    mirror_size = await fs_call(get_dir_size, MIRROR_DIR)
+    text = f"""
+{EMOJI.MIRROR} *Mirror Management*
+You are currently using `{format_bytes(mirror_size)}` of storage for mirrored files.
+Maximum file size: `{format_bytes(MAX_MIRROR_FILE_SIZE)}`
+Ingest queue: `{len(mirror_active_jobs)}` downloading, `{mirror_queue_length()}` waiting
+Storage quota: `{format_bytes(get_mirror_usage())} / {format_bytes(MIRROR_STORAGE_QUOTA)}` (least recently downloaded files are evicted first)
+_Remember that this storage is temporary and will be wiped on server restarts or redeploys._
 """
-await edit_or_reply_message(update, text, get_mirror_management_keyboard(mirror_size))
+    await edit_or_reply_message(update, text, get_mirror_management_keyboard(mirror_size))
 
 @authorized_only
 async def browse_mirror_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-query = update.callback_query
-await query.answer()
+    query = update.callback_query
+    await query.answer()
+
+    files = [entry for entry in await fs_scan_dir(MIRROR_DIR) if not entry.name.endswith('.part')]
+    if not files:
+        await edit_or_reply_message(update, f"{EMOJI.MIRROR} No mirrored files found.", get_mirror_management_keyboard(0))
+        return
 
-if not os.path.exists(MIRROR_DIR) or not os.listdir(MIRROR_DIR):
-await edit_or_reply_message(update, f"{EMOJI.MIRROR} No mirrored files found.", get_mirror_management_keyboard(0))
-return
+    files.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
 
-files = os.listdir(MIRROR_DIR)
-files.sort(key=lambda x: os.path.getmtime(os.path.join(MIRROR_DIR, x)), reverse=True)
+    text = f"{EMOJI.MIRROR} *Mirrored Files*\n\n"
 
-text = f"{EMOJI.MIRROR} *Mirrored Files*\n\n"
+    for i, entry in enumerate(files[:10], 1):
+        file_name = entry.name
+        file_size = entry.stat().st_size
+        file_date = datetime.fromtimestamp(entry.stat().st_mtime).strftime("%Y-%m-%d %H:%M")
+        file_url = f"{RENDER_EXTERNAL_URL}/mirror/{file_name}"
 
-for i, file_name in enumerate(files[:10], 1):
-file_path = os.path.join(MIRROR_DIR, file_name)
-file_size = os.path.getsize(file_path)
-file_date = datetime.fromtimestamp(os.path.getmtime(file_path)).strftime("%Y-%m-%d %H:%M")
-file_url = f"{RENDER_EXTERNAL_URL}/mirror/{file_name}"
+        text += f"{i}. [{file_name}]({file_url}) - `{format_bytes(file_size)}` - {file_date}"
+        info = mirror_index.get(file_name)
+        if info and info['ttl_hours']:
+            expires_at = datetime.fromtimestamp(info['created'] + info['ttl_hours'] * 3600).strftime("%Y-%m-%d %H:%M")
+            text += f" (expires {expires_at})"
+        text += "\n"
 
-text += f"{i}. [{file_name}]({file_url}) - `{format_bytes(file_size)}` - {file_date}\n"
+    if len(files) > 10:
+        text += f"\n_...and {len(files) - 10} more files._"
 
-if len(files) > 10:
-text += f"\n_...and {len(files) - 10} more files._"
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{EMOJI.BACK} Back to Mirror Management", callback_data='manage_mirror')]
+    ])
 
-keyboard = InlineKeyboardMarkup([
-[InlineKeyboardButton(f"{EMOJI.BACK} Back to Mirror Management", callback_data='manage_mirror')]
-])
+    await edit_or_reply_message(update, text, keyboard)
 
-await edit_or_reply_message(update, text, keyboard)
 @authorized_only
 async def delete_all_mirror_confirm_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-query = update.callback_query
-await query.answer()
+    query = update.callback_query
+    await query.answer()
+
+    text = f"{EMOJI.WARNING} Are you sure you want to delete all mirrored files? This action cannot be undone."
+    await edit_or_reply_message(update, text, get_delete_all_mirror_confirmation_keyboard())
 
-text = f"{EMOJI.WARNING} Are you sure you want to delete all mirrored files? This action cannot be undone."
-await edit_or_reply_message(update, text, get_delete_all_mirror_confirmation_keyboard())
 @authorized_only
 async def delete_all_mirror_final_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-query = update.callback_query
-await query.answer("Deleting files...")
+    query = update.callback_query
+    await query.answer("Deleting files...")
 
-try:
-shutil.rmtree(MIRROR_DIR)
-os.makedirs(MIRROR_DIR)
-text = f"{EMOJI.SUCCESS} All mirrored files have been deleted."
-except Exception as e:
-logger.error(f"Error deleting mirror directory: {e}")
-text = f"{EMOJI.CANCEL} An error occurred while deleting files."
-
-await edit_or_reply_message(update, text, get_stats_keyboard())
---- Bot Edit Code Handlers ---
+    try:
+        await fs_call(shutil.rmtree, MIRROR_DIR)
+        await fs_call(os.makedirs, MIRROR_DIR)
+        await fs_call(clear_mirror_index)
+        text = f"{EMOJI.SUCCESS} All mirrored files have been deleted."
+    except Exception as e:
+        logger.error(f"Error deleting mirror directory: {e}")
+        text = f"{EMOJI.CANCEL} An error occurred while deleting files."
+
+    await edit_or_reply_message(update, text, get_stats_keyboard())
+
+# --- Restore Backup Conversation ---
 @authorized_only
-async def edit_bot_code(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-query = update.callback_query
-await query.answer()
+async def restore_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
 
-_, action, bot_name = query.data.split(':', 2)
+    if len(running_bots) >= MAX_BOTS_PER_USER:
+        await query.message.reply_text(f"{EMOJI.WARNING} You have reached the maximum of *{MAX_BOTS_PER_USER}* bots.", parse_mode=ParseMode.MARKDOWN, reply_markup=get_back_to_main_menu_keyboard())
+        return ConversationHandler.END
 
-if bot_name not in running_bots:
-await edit_or_reply_message(update, f"{EMOJI.CANCEL} Bot not found.", get_back_to_main_menu_keyboard())
-return ConversationHandler.END
+    await query.message.delete()
+    await query.message.chat.send_message(
+        f"{EMOJI.RESTORE} *Restore Backup*\n\nSend me a backup `.zip` created with the *Backup Bot* button. "
+        f"The bot will be recreated and started right away.",
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=get_cancel_keyboard()
+    )
+    return GET_RESTORE_FILE
 
-bot_dir = running_bots[bot_name]['bot_dir']
-bot_file_path = os.path.join(bot_dir, "bot.py")
+async def receive_restore_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    document = update.message.document
+    if not document or not document.file_name.lower().endswith('.zip'):
+        await update.message.reply_text(f"{EMOJI.CANCEL} Please send a backup `.zip` file.", parse_mode=ParseMode.MARKDOWN, reply_markup=get_cancel_keyboard())
+        return GET_RESTORE_FILE
 
-if not os.path.exists(bot_file_path):
-await edit_or_reply_message(update, f"{EMOJI.CANCEL} Bot file not found.", get_back_to_main_menu_keyboard())
-return ConversationHandler.END
+    if document.file_size > TELEGRAM_UPLOAD_LIMIT:
+        await update.message.reply_text(f"{EMOJI.CANCEL} File is too large. Maximum size is {format_bytes(TELEGRAM_UPLOAD_LIMIT)}.", reply_markup=get_cancel_keyboard())
+        return GET_RESTORE_FILE
 
-with open(bot_file_path, 'r', encoding='utf-8') as f:
-bot_code = f.read()
+    loading_msg = await send_loading_animation(context, update.effective_chat.id, f"{EMOJI.LOADING} Downloading your backup...")
 
-# Store the bot name and code in user_data
-context.user_data['edit_bot_name'] = bot_name
-context.user_data['edit_bot_code'] = bot_code
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_file_path = os.path.join(temp_dir, "backup.zip")
+        if not await download_file(context.bot, document.file_id, temp_file_path):
+            await loading_msg.edit_caption(f"{EMOJI.CANCEL} Failed to download the file. Please try again.", reply_markup=get_cancel_keyboard())
+            return GET_RESTORE_FILE
 
-# Send the code as a document for editing
-with tempfile.NamedTemporaryFile(suffix='.py', delete=False) as temp_file:
-temp_file_path = temp_file.name
-with open(temp_file_path, 'w', encoding='utf-8') as f:
-f.write(bot_code)
+        await loading_msg.edit_caption(f"{EMOJI.LOADING} Extracting backup...")
+        try:
+            metadata = await fs_call(read_backup_archive_metadata, temp_file_path)
+        except (ValueError, zipfile.BadZipFile, json.JSONDecodeError) as e:
+            await loading_msg.edit_caption(f"{EMOJI.CANCEL} Cannot restore this backup: {e}", reply_markup=get_cancel_keyboard())
+            return GET_RESTORE_FILE
+        except OSError as e:
+            logger.error(f"Error reading backup {document.file_name}: {e}", exc_info=True)
+            await loading_msg.edit_caption(f"{EMOJI.CANCEL} Could not read the backup: {e}", reply_markup=get_cancel_keyboard())
+            return GET_RESTORE_FILE
+
+        bot_name = metadata['bot_name']
+        if not reserve_bot_name(bot_name):
+            await loading_msg.edit_caption(f"{EMOJI.CANCEL} Cannot restore this backup: A bot named {bot_name} already exists. Delete it first to restore this backup.", reply_markup=get_cancel_keyboard())
+            return GET_RESTORE_FILE
+        try:
+            await fs_call(extract_backup_archive, temp_file_path)
+
+            bot_dir = os.path.join(BOTS_DIR, bot_name)
+            await loading_msg.edit_caption(f"{EMOJI.LOADING} Starting `{bot_name}`...", parse_mode=ParseMode.MARKDOWN)
+
+            bot_code = await fs_read_text(os.path.join(bot_dir, "bot.py"))
+            requirements_content = await fs_read_text(os.path.join(bot_dir, "requirements.txt"))
+
+            bot_info = await lifecycle_call(start_bot_subprocess, bot_name, metadata['token'], bot_code, requirements_content)
+            if bot_info:
+                bot_info['restart_count'] = metadata.get('restart_count', 0)
+                running_bots[bot_name] = bot_info
+        except (ValueError, zipfile.BadZipFile, json.JSONDecodeError) as e:
+            await loading_msg.edit_caption(f"{EMOJI.CANCEL} Cannot restore this backup: {e}", reply_markup=get_cancel_keyboard())
+            return GET_RESTORE_FILE
+        except OSError as e:
+            # Disk full or permissions; extract_backup_archive has removed its partial files
+            logger.error(f"Error restoring {bot_name} from backup: {e}", exc_info=True)
+            await loading_msg.edit_caption(f"{EMOJI.CANCEL} Could not restore `{bot_name}`: {e}", parse_mode=ParseMode.MARKDOWN, reply_markup=get_cancel_keyboard())
+            return GET_RESTORE_FILE
+        finally:
+            reserved_bot_names.discard(bot_name)
 
-await query.message.reply_document(
-document=open(temp_file_path, 'rb'),
-filename=f"{bot_name}.py",
-caption=f"{EMOJI.CODE} Here's the code for `{bot_name}`.\n\nEdit it and send it back to update the bot.",
-parse_mode=ParseMode.MARKDOWN,
-reply_markup=get_edit_code_keyboard(bot_name)
-)
+    if bot_info:
+        await loading_msg.edit_caption(
+            f"{EMOJI.PARTY} `{bot_name}` has been restored from the backup of {metadata.get('backup_date', 'an unknown date')} and is running!",
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=get_bot_actions_keyboard(bot_name)
+        )
+    else:
+        await loading_msg.edit_caption(f"{EMOJI.CANCEL} The files were restored but `{bot_name}` failed to start.", parse_mode=ParseMode.MARKDOWN, reply_markup=get_back_to_main_menu_keyboard())
 
-os.unlink(temp_file_path)
+    context.user_data.clear()
+    return ConversationHandler.END
+
+# --- Log Search Conversation ---
+@authorized_only
+async def log_search_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+
+    bot_name = query.data.split(':', 1)[1] if ':' in query.data else None
+    context.user_data['log_search_bot'] = bot_name
+    scope_text = f"the logs of `{bot_name}`" if bot_name else "the logs of all bots"
+
+    await query.message.delete()
+    await query.message.chat.send_message(
+        f"{EMOJI.SEARCH} *Log Search*\n\nSend me what to look for in {scope_text}.\n\n"
+        f"- Words are matched case-insensitively, `/regex/` for a regular expression\n"
+        f"- `bot:name` to search a single bot\n"
+        f"- `level:warning` for warnings and worse\n"
+        f"- `since:2h`, `until:2024-01-31` for a time range (`m`, `h`, `d` or a date)\n\n"
+        f"Example: `timeout level:error since:1d`",
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=get_cancel_keyboard()
+    )
+    return ASK_LOG_QUERY
+
+def format_log_search_results(query_text: str, hits: List[Tuple[str, str]], page: int) -> str:
+    if not hits:
+        return f"{EMOJI.SEARCH} No log lines match `{query_text}`."
+    lines = []
+    for bot_name, line in hits:
+        preview = line if len(line) <= LOG_SEARCH_LINE_PREVIEW else line[:LOG_SEARCH_LINE_PREVIEW] + "..."
+        lines.append(f"[{bot_name}] {preview}".replace('`', "'"))
+    return f"{EMOJI.SEARCH} *Results for* `{query_text}` *(page {page + 1})*\n\n```\n" + "\n".join(lines) + "\n```"
+
+async def run_log_search(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int):
+    search = context.user_data.get('log_search')
+    if not search:
+        await edit_or_reply_message(update, f"{EMOJI.WARNING} This search has expired. Please start a new one.", get_stats_keyboard())
+        return
+
+    try:
+        parsed = parse_log_query(search['text'])
+    except ValueError as e:
+        await edit_or_reply_message(update, f"{EMOJI.CANCEL} {e}", get_cancel_keyboard())
+        return
+    if search['bot'] and not parsed['bot']:
+        parsed['bot'] = search['bot']
+
+    hits, has_more = await fs_call(search_logs, parsed, get_active_log_paths(), page * LOG_SEARCH_PAGE_SIZE)
+    await edit_or_reply_message(update, format_log_search_results(search['text'], hits, page), get_log_search_results_keyboard(page, has_more))
+
+async def receive_log_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query_text = update.message.text.strip()
+    try:
+        parse_log_query(query_text)
+    except ValueError as e:
+        await update.message.reply_text(f"{EMOJI.CANCEL} {e}", reply_markup=get_cancel_keyboard())
+        return ASK_LOG_QUERY
+
+    context.user_data['log_search'] = {'text': query_text, 'bot': context.user_data.pop('log_search_bot', None)}
+    await run_log_search(update, context, 0)
+    return ConversationHandler.END
+
+@authorized_only
+async def log_search_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+
+    page = int(query.data.split(':', 1)[1])
+    await run_log_search(update, context, page)
+
+# --- Log Paging Handlers ---
+async def build_log_page(bot_name: str, segment_pos: int, page: int) -> Tuple[str, InlineKeyboardMarkup]:
+    """Renders one page of a bot's logs, walking across segments, with its navigation keyboard."""
+    if bot_name in running_bots:
+        update_bot_logs(bot_name)
+    segments = await fs_call(get_bot_log_segments, bot_name)
+    if not segments:
+        return f"{EMOJI.LOGS} No logs available for `{bot_name}`.", get_log_page_keyboard(bot_name, 0, 0, 1, 0)
+
+    segment_pos = min(max(segment_pos, 0), len(segments) - 1)
+    path = segments[segment_pos]
+    try:
+        lines, page, total_pages = await fs_call(read_log_page, path, page)
+    except (OSError, struct.error) as e:
+        logger.error(f"Error reading log page from {path}: {e}")
+        return f"{EMOJI.CANCEL} Could not read logs for `{bot_name}`.", get_log_page_keyboard(bot_name, 0, 0, 1, 0)
+
+    body = "\n".join(
+        (line[:LOG_PAGE_LINE_PREVIEW] + "...") if len(line) > LOG_PAGE_LINE_PREVIEW else line
+        for line in lines
+    ).replace("`", "'") or "(empty)"
+    text = (
+        f"{EMOJI.LOGS} *Logs for `{bot_name}`*\n"
+        f"Segment `{os.path.basename(path)}` ({segment_pos + 1}/{len(segments)}), page {total_pages - page}/{total_pages}\n\n"
+        f"```\n{body}\n```"
+    )
+    return text, get_log_page_keyboard(bot_name, segment_pos, page, total_pages, len(segments))
+
+@authorized_only
+async def log_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+
+    _, segment_pos, page, bot_name = query.data.split(':', 3)
+    text, reply_markup = await build_log_page(bot_name, int(segment_pos), int(page))
+    await edit_or_reply_message(update, text, reply_markup)
+
+@authorized_only
+async def logs_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """`/logs <bot> [YYYY-MM-DD HH:MM | 2h]` opens a bot's logs at the newest page or at a point in time."""
+    if not context.args:
+        await update.message.reply_text("Usage: `/logs <bot> [YYYY-MM-DD HH:MM | 30m | 2h | 7d]`", parse_mode=ParseMode.MARKDOWN)
+        return
+
+    bot_name = context.args[0]
+    segment_pos, page = 0, 0
+    if len(context.args) > 1:
+        timestamp = parse_time_filter("T".join(context.args[1:3]))
+        if timestamp is None:
+            await update.message.reply_text(f"{EMOJI.CANCEL} Invalid time. Use `YYYY-MM-DD HH:MM`, `30m`, `2h` or `7d`.", parse_mode=ParseMode.MARKDOWN)
+            return
+        segments = await fs_call(get_bot_log_segments, bot_name)
+        if segments:
+            segment_pos = find_log_segment_for_time(segments, timestamp)
+            page = await fs_call(find_log_page_for_time, segments[segment_pos], timestamp)
+
+    text, reply_markup = await build_log_page(bot_name, segment_pos, page)
+    await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+
+# --- Live Log Tail Handlers ---
+@authorized_only
+async def log_tail_start_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+
+    action, bot_name = query.data.split(':', 1)
+    if bot_name not in running_bots:
+        await edit_or_reply_message(update, f"{EMOJI.CANCEL} Bot not found.", reply_markup=get_back_to_main_menu_keyboard())
+        return
+
+    if action == 'tail_resume':
+        message = query.message
+    else:
+        message = await query.message.reply_text(f"{EMOJI.LIVE} Starting live tail of `{bot_name}`...", parse_mode=ParseMode.MARKDOWN)
+    tail = open_log_tail(bot_name, context.bot, (message.chat_id, message.message_id))
+    try:
+        await message.edit_text(render_log_tail(bot_name, tail), parse_mode=ParseMode.MARKDOWN, reply_markup=get_log_tail_keyboard(bot_name))
+    except BadRequest as e:
+        if "not modified" not in str(e):
+            logger.error(f"Error starting live tail of {bot_name}: {e}")
+
+@authorized_only
+async def log_tail_stop_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+
+    bot_name = query.data.split(':', 1)[1]
+    tail = log_tails.get(bot_name)
+    if tail is None:
+        await query.edit_message_reply_markup(reply_markup=get_log_tail_keyboard(bot_name, live=False))
+        return
+    tail['viewers'].discard((query.message.chat_id, query.message.message_id))
+    await edit_or_reply_message(update, render_log_tail(bot_name, tail, f"{EMOJI.STOP} Live tail stopped."), get_log_tail_keyboard(bot_name, live=False))
+
+# --- Bot Edit Code Handlers ---
+@authorized_only
+async def edit_bot_code(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+
+    _, action, bot_name = query.data.split(':', 2)
+
+    if bot_name not in running_bots:
+        await edit_or_reply_message(update, f"{EMOJI.CANCEL} Bot not found.", get_back_to_main_menu_keyboard())
+        return ConversationHandler.END
+
+    bot_dir = running_bots[bot_name]['bot_dir']
+    bot_file_path = os.path.join(bot_dir, "bot.py")
+
+    bot_code = await fs_read_text(bot_file_path)
+    if bot_code is None:
+        await edit_or_reply_message(update, f"{EMOJI.CANCEL} Bot file not found.", get_back_to_main_menu_keyboard())
+        return ConversationHandler.END
+
+    # Store the bot name and code in user_data
+    context.user_data['edit_bot_name'] = bot_name
+    context.user_data['edit_bot_code'] = bot_code
+
+    # Send the code as a document for editing
+    await query.message.reply_document(
+        document=bot_code.encode('utf-8'),
+        filename=f"{bot_name}.py",
+        caption=f"{EMOJI.CODE} Here's the code for `{bot_name}`.\n\nEdit it and send it back to update the bot.",
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=get_edit_code_keyboard(bot_name)
+    )
+
+    return EDIT_CODE
 
-return EDIT_CODE
 async def receive_edited_code(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-document = update.message.document
-if not document or not any(document.file_name.lower().endswith(ft) for ft in ALLOWED_FILE_TYPES):
-await update.message.reply_text(f"{EMOJI.CANCEL} Invalid file type. Please send a Python file.", reply_markup=get_cancel_keyboard())
-return EDIT_CODE
-
-loading_msg = await send_loading_animation(context, update.effective_chat.id, f"{EMOJI.LOADING} Downloading your edited code...")
-
-with tempfile.TemporaryDirectory() as temp_dir:
-temp_file_path = os.path.join(temp_dir, document.file_name)
-if not await download_file(context.bot, document.file_id, temp_file_path):
-await loading_msg.edit_caption(f"{EMOJI.CANCEL} Failed to download the file. Please try again.", reply_markup=get_cancel_keyboard())
-return EDIT_CODE
-
-with open(temp_file_path, 'r', encoding='utf-8') as f:
-edited_code = f.read()
-
-bot_name = context.user_data['edit_bot_name']
-
-# Update the bot code
-bot_dir = running_bots[bot_name]['bot_dir']
-bot_file_path = os.path.join(bot_dir, "bot.py")
-
-with open(bot_file_path, 'w', encoding='utf-8') as f:
-f.write(edited_code)
-
-await loading_msg.edit_caption(
-f"{EMOJI.SUCCESS} Code for `{bot_name}` has been updated!\n\n"
-f"Would you like to restart the bot to apply changes?",
-parse_mode=ParseMode.MARKDOWN,
-reply_markup=InlineKeyboardMarkup([
-[InlineKeyboardButton(f"{EMOJI.RESTART} Yes, restart now", callback_data=f'bot_action:restart:{bot_name}')],
-[InlineKeyboardButton(f"{EMOJI.CANCEL} No, I'll do it later", callback_data=f'select_bot:{bot_name}')]
-])
-)
+    document = update.message.document
+    if not document or not any(document.file_name.lower().endswith(ft) for ft in ALLOWED_FILE_TYPES):
+        await update.message.reply_text(f"{EMOJI.CANCEL} Invalid file type. Please send a Python file.", reply_markup=get_cancel_keyboard())
+        return EDIT_CODE
+
+    loading_msg = await send_loading_animation(context, update.effective_chat.id, f"{EMOJI.LOADING} Downloading your edited code...")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_file_path = os.path.join(temp_dir, document.file_name)
+        if not await download_file(context.bot, document.file_id, temp_file_path):
+            await loading_msg.edit_caption(f"{EMOJI.CANCEL} Failed to download the file. Please try again.", reply_markup=get_cancel_keyboard())
+            return EDIT_CODE
+
+        edited_code = await fs_read_text(temp_file_path)
+
+    await loading_msg.edit_caption(f"{EMOJI.LOADING} Checking your code...")
+    compile_error = await preflight_compile(edited_code)
+    if compile_error:
+        await loading_msg.edit_caption(f"{compile_error}\n\nThe code was not saved. Please fix it and send the file again.", parse_mode=ParseMode.MARKDOWN, reply_markup=get_cancel_keyboard())
+        return EDIT_CODE
+
+    bot_name = context.user_data['edit_bot_name']
+
+    # Update the bot code
+    bot_dir = running_bots[bot_name]['bot_dir']
+    bot_file_path = os.path.join(bot_dir, "bot.py")
+
+    await fs_call(write_bot_code, bot_file_path, edited_code)
+
+    await loading_msg.edit_caption(
+        f"{EMOJI.SUCCESS} Code for `{bot_name}` has been updated!\n\n"
+        f"Would you like to restart the bot to apply changes?",
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton(f"{EMOJI.RESTART} Yes, restart now", callback_data=f'bot_action:restart:{bot_name}')],
+            [InlineKeyboardButton(f"{EMOJI.CANCEL} No, I'll do it later", callback_data=f'select_bot:{bot_name}')]
+        ])
+    )
+
+    context.user_data.clear()
+    return ConversationHandler.END
 
-context.user_data.clear()
-return ConversationHandler.END
 async def save_edited_code(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-query = update.callback_query
-await query.answer()
+    query = update.callback_query
+    await query.answer()
 
-_, bot_name = query.data.split(':', 1)
+    _, bot_name = query.data.split(':', 1)
 
-await query.edit_message_text(
-f"{EMOJI.CODE} Please send me the edited Python file for `{bot_name}`.",
-parse_mode=ParseMode.MARKDOWN,
-reply_markup=get_cancel_keyboard()
-)
+    await query.edit_message_text(
+        f"{EMOJI.CODE} Please send me the edited Python file for `{bot_name}`.",
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=get_cancel_keyboard()
+    )
+
+    return EDIT_CODE
 
-return EDIT_CODE
---- Other Callback Query Handlers ---
+# --- Other Callback Query Handlers ---
 async def main_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-query = update.callback_query
-await query.answer()
+    query = update.callback_query
+    await query.answer()
 
-welcome_message = f"""
-{EMOJI.SPARKLES} Welcome to BotHoster Pro! {EMOJI.SPARKLES}
+    welcome_message = f"""
+{EMOJI.SPARKLES} *Welcome to BotHoster Pro!* {EMOJI.SPARKLES}
 I can host and manage your Python Telegram bots.
 {EMOJI.GEAR} Use the menu below to get started.
 """
-await query.message.delete()
-await query.message.chat.send_animation(
-animation=LOADING_ANIMATION_URL,
-caption=welcome_message,
-parse_mode=ParseMode.MARKDOWN,
-reply_markup=get_main_menu_keyboard()
-)
+    await query.message.delete()
+    await send_media_asset(
+        query.message.chat.send_animation,
+        START_IMAGE_URL,
+        caption=welcome_message,
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=get_main_menu_keyboard()
+    )
 
 @authorized_only
 async def select_bot_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-query = update.callback_query
-await query.answer()
-
-bot_name = query.data.split(':')[1]
-
-if bot_name not in running_bots:
-await edit_or_reply_message(update, f"{EMOJI.CANCEL} Bot not found. It might have been removed.", get_back_to_main_menu_keyboard())
-return
-
-info = running_bots[bot_name]
-is_running = info['process'].poll() is None
-status_emoji = EMOJI.GREEN_CIRCLE if is_running else EMOJI.RED_CIRCLE
-status_text = "Running" if is_running else "Stopped"
+    query = update.callback_query
+    await query.answer()
 
-uptime = "N/A"
-if is_running:
-td = datetime.now() - info['start_time']
-uptime = str(td).split('.')[0]
+    bot_name = query.data.split(':')[1]
 
-restart_count = info.get('restart_count', 0)
-last_restart = info.get('last_restart')
-last_restart_text = last_restart.strftime("%Y-%m-%d %H:%M:%S") if last_restart else "N/A"
+    if bot_name not in running_bots:
+        await edit_or_reply_message(update, f"{EMOJI.CANCEL} Bot not found. It might have been removed.", get_back_to_main_menu_keyboard())
+        return
 
-text = f"""
-{EMOJI.GEAR} Managing Bot: {bot_name}
-Status: {status_emoji} {status_text}
-Uptime: {uptime}
-Restarts: {restart_count}
-Last Restart: {last_restart_text}
+    info = running_bots[bot_name]
+    is_running = info['process'].poll() is None
+    status_emoji = EMOJI.GREEN_CIRCLE if is_running else EMOJI.RED_CIRCLE
+    status_text = "Running" if is_running else "Stopped"
+    if is_bot_hibernated(bot_name):
+        status_emoji = EMOJI.SLEEP
+        status_text = f"Hibernated (wakes on next update, idle {timedelta(seconds=int(get_bot_idle_seconds(info)))})"
 
+    uptime = "N/A"
+    if is_running:
+        td = datetime.now() - info['start_time']
+        uptime = str(td).split('.')[0]
+
+    restart_count = info.get('restart_count', 0)
+    last_restart = info.get('last_restart')
+    last_restart_text = last_restart.strftime("%Y-%m-%d %H:%M:%S") if last_restart else "N/A"
+
+    await fs_call(check_first_output, bot_name)
+    lifecycle_text = ""
+    last_deploy = get_last_lifecycle_trace(bot_name, ('deploy',))
+    if last_deploy:
+        lifecycle_text += f"*Last Deploy Took:* `{format_lifecycle_trace(last_deploy)}`\n"
+    last_start = get_last_lifecycle_trace(bot_name, ('deploy', 'start', 'restart'))
+    if last_start and last_start is not last_deploy:
+        lifecycle_text += f"*Last {last_start['operation'].title()} Took:* `{format_lifecycle_trace(last_start)}`\n"
+    ingest = log_ingest_stats.get(bot_name)
+    if ingest and ingest['dropped_lines']:
+        lifecycle_text += f"*Log Lines Dropped:* `{ingest['dropped_lines']}` (`{format_bytes(ingest['dropped_bytes'])}`, over `{format_bytes(LOG_RATE_LIMIT)}/s`)\n"
+
+    text = f"""
+{EMOJI.GEAR} *Managing Bot:* `{bot_name}`
+*Status:* {status_emoji} {status_text}
+*Uptime:* `{uptime}`
+*Restarts:* `{restart_count}`
+*Last Restart:* `{last_restart_text}`
+{lifecycle_text}
 What would you like to do?
 """
-await edit_or_reply_message(update, text, get_bot_actions_keyboard(bot_name))
+    await edit_or_reply_message(update, text, get_bot_actions_keyboard(bot_name))
 
 @authorized_only
 async def bot_action_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-query = update.callback_query
-await query.answer()
-
-
-Line Wrapping
-
-Collapse
-Copy
-1
-2
-3
-4
-5
-6
-7
-8
-9
-10
-11
-12
-13
-14
-15
-16
-17
-18
-19
-20
-21
-22
-23
-24
-25
-26
-27
-28
-29
-30
-31
-32
-33
-34
-35
-36
-37
-38
-39
-40
-41
-_, action, bot_name = query.data.split(':', 2)
-
-if action == 'delete_confirm':
-    await edit_or_reply_message(update, f"{EMOJI.WARNING} Are you sure you want to permanently delete `{bot_name}`?", reply_markup=get_delete_confirmation_keyboard(bot_name))
-    return
-
-if action == 'edit':
-    # This is handled by the conversation handler
-    return await edit_bot_code(update, context)
-
-loading_msg = await send_loading_animation(context, query.message.chat_id, f"{EMOJI.LOADING} Processing request for `{bot_name}`...")
-
-if bot_name not in running_bots and action != 'backup':
-    await loading_msg.edit_caption(f"{EMOJI.CANCEL} Bot not found.", reply_markup=get_back_to_main_menu_keyboard())
-    return
-    
-if action == 'stop':
-    stop_bot_process(bot_name)
-    await loading_msg.edit_caption(f"{EMOJI.STOP} Bot `{bot_name}` has been stopped.", reply_markup=get_bot_actions_keyboard(bot_name))
-
-elif action == 'start':
-    if start_bot_process(bot_name):
-        await loading_msg.edit_caption(f"{EMOJI.SUCCESS} Bot `{bot_name}` successfully started!", reply_markup=get_bot_actions_keyboard(bot_name))
-    else:
-        await loading_msg.edit_caption(f"{EMOJI.CANCEL} Failed to start `{bot_name}`.", reply_markup=get_bot_actions_keyboard(bot_name))
+    query = update.callback_query
+    await query.answer()
 
-elif action == 'restart':
-    if restart_bot_process(bot_name):
-        await loading_msg.edit_caption(f"{EMOJI.SUCCESS} Bot `{bot_name}` successfully restarted!", reply_markup=get_bot_actions_keyboard(bot_name))
-    else:
-        await loading_msg.edit_caption(f"{EMOJI.CANCEL} Failed to restart `{bot_name}`.", reply_markup=get_bot_actions_keyboard(bot_name))
+    _, action, bot_name = query.data.split(':', 2)
 
-elif action == 'logs':
-    logs = get_bot_logs(bot_name)
-    log_output = f"... {logs[-3500:]}" if len(logs) > 3500 else logs
-    await loading_msg.delete()
-    await query.message.reply_text(f"{EMOJI.LOGS} *Logs for `{bot_name}`:*\n\n```\n{log_output}\n```", parse_mode=ParseMode.MARKDOWN, reply_markup=get_bot_actions_keyboard(bot_name))
-
-elif action == 'resources':
-    resources = get_bot_resource_usage(bot_name)
-    resource_text = f"""
-{EMOJI.HEALTH} Resource Usage for {bot_name}
-{EMOJI.BAR_CHART} CPU Usage: {resources['cpu_percent']:.1f}%
-{EMOJI.STORAGE} Memory Usage: {resources['memory_used']} ({resources['memory_percent']:.1f}%)
-{EMOJI.ROCKET} Threads: {resources['threads']}
-{EMOJI.INFO} Status: {resources['status']}
-{EMOJI.ROCKET} Running Time: {resources['running_time']}
+    if action == 'delete_confirm':
+        await edit_or_reply_message(update, f"{EMOJI.WARNING} Are you sure you want to permanently delete `{bot_name}`?", reply_markup=get_delete_confirmation_keyboard(bot_name))
+        return
+
+    if action == 'edit':
+        # This is handled by the conversation handler
+        return await edit_bot_code(update, context)
+
+    loading_msg = await send_loading_animation(context, query.message.chat_id, f"{EMOJI.LOADING} Processing request for `{bot_name}`...")
+
+    if bot_name not in running_bots and action != 'backup':
+        await loading_msg.edit_caption(f"{EMOJI.CANCEL} Bot not found.", reply_markup=get_back_to_main_menu_keyboard())
+        return
+
+    if action == 'stop':
+        await lifecycle_call(stop_bot_process, bot_name)
+        await loading_msg.edit_caption(f"{EMOJI.STOP} Bot `{bot_name}` has been stopped.", reply_markup=get_bot_actions_keyboard(bot_name))
+
+    elif action == 'start':
+        if await lifecycle_call(start_bot_process, bot_name):
+            await loading_msg.edit_caption(f"{EMOJI.SUCCESS} Bot `{bot_name}` successfully started!", reply_markup=get_bot_actions_keyboard(bot_name))
+        else:
+            await loading_msg.edit_caption(f"{EMOJI.CANCEL} Failed to start `{bot_name}`.", reply_markup=get_bot_actions_keyboard(bot_name))
+
+    elif action == 'restart':
+        if await lifecycle_call(restart_bot_process, bot_name):
+            await loading_msg.edit_caption(f"{EMOJI.SUCCESS} Bot `{bot_name}` successfully restarted!", reply_markup=get_bot_actions_keyboard(bot_name))
+        else:
+            await loading_msg.edit_caption(f"{EMOJI.CANCEL} Failed to restart `{bot_name}`.", reply_markup=get_bot_actions_keyboard(bot_name))
+
+    elif action == 'runtime':
+        shared = not running_bots[bot_name].get('shared_runtime')
+        running_bots[bot_name]['shared_runtime'] = shared
+        await fs_call(set_shared_runtime_bot, bot_name, shared)
+        mode = "the shared runtime" if shared else "its own process"
+        if await lifecycle_call(restart_bot_process, bot_name):
+            await loading_msg.edit_caption(f"{EMOJI.SUCCESS} Bot `{bot_name}` now runs in {mode}.", parse_mode=ParseMode.MARKDOWN, reply_markup=get_bot_actions_keyboard(bot_name))
+        else:
+            await loading_msg.edit_caption(f"{EMOJI.CANCEL} Switched `{bot_name}` to {mode}, but the restart failed.", parse_mode=ParseMode.MARKDOWN, reply_markup=get_bot_actions_keyboard(bot_name))
+
+    elif action == 'hibernate':
+        minutes = running_bots[bot_name].get('hibernate_minutes', 0)
+        served = await is_served_by_ingress(bot_name)
+        if served:
+            options = HIBERNATE_OPTIONS
+            next_minutes = options[(options.index(minutes) + 1) % len(options)] if minutes in options else 0
+        else:
+            next_minutes = 0  # A policy can always be switched off, but only set for bots the ingress can wake
+        if not served and not minutes:
+            policy_text = (f"{EMOJI.WARNING} `{bot_name}` can't hibernate: it isn't receiving updates through the webhook ingress, "
+                           "so no update could wake it. Bots in the shared runtime or with their own update loop can't hibernate.")
+        else:
+            running_bots[bot_name]['hibernate_minutes'] = next_minutes
+            await fs_call(set_hibernate_minutes, bot_name, next_minutes)
+            if next_minutes:
+                policy_text = f"{EMOJI.SLEEP} `{bot_name}` will hibernate after {next_minutes} minutes without updates and wake on the next one."
+            else:
+                policy_text = f"{EMOJI.SLEEP} `{bot_name}` will keep running when idle."
+        await loading_msg.edit_caption(policy_text, parse_mode=ParseMode.MARKDOWN, reply_markup=get_bot_actions_keyboard(bot_name))
+
+    elif action == 'logs':
+        text, reply_markup = await build_log_page(bot_name, 0, 0)
+        await loading_msg.delete()
+        await query.message.reply_text(text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+
+    elif action == 'resources':
+        resources = await asyncio.to_thread(get_bot_resource_usage, bot_name)
+        resource_text = f"""
+{EMOJI.HEALTH} *Resource Usage for* `{bot_name}`
+{EMOJI.BAR_CHART} *CPU Usage:* `{resources['cpu_percent']:.1f}%`
+{EMOJI.STORAGE} *Memory Usage:* `{resources['memory_used']} ({resources['memory_percent']:.1f}%)`
+{EMOJI.ROCKET} *Threads:* `{resources['threads']}`
+{EMOJI.INFO} *Status:* `{resources['status']}`
+{EMOJI.ROCKET} *Running Time:* `{resources['running_time']}`
 """
-await loading_msg.edit_caption(resource_text, parse_mode=ParseMode.MARKDOWN, reply_markup=get_bot_actions_keyboard(bot_name))
-
-elif action == 'download':
-bot_dir = running_bots[bot_name]['bot_dir']
-zip_buffer = io.BytesIO()
-with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_f:
-for item_name in ["bot.py", "requirements.txt"]:
-item_path = os.path.join(bot_dir, item_name)
-if os.path.exists(item_path):
-zip_f.write(item_path, item_name)
-zip_buffer.seek(0)
-
-await loading_msg.delete()
-await query.message.reply_document(document=zip_buffer, filename=f"{bot_name}_source.zip", caption=f"{EMOJI.DOWNLOAD} Here's the source code for `{bot_name}`.")
-
-elif action == 'backup':
-try:
-# Create a backup of the bot
-bot_dir = running_bots[bot_name]['bot_dir']
-backup_buffer = io.BytesIO()
-
-with zipfile.ZipFile(backup_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_f:
-# Add bot files
-for root, _, files in os.walk(bot_dir):
-for file in files:
-file_path = os.path.join(root, file)
-arc_name = os.path.relpath(file_path, bot_dir)
-zip_f.write(file_path, arc_name)
-
-# Add metadata
-metadata = {
-"bot_name": bot_name,
-"token": running_bots[bot_name]['token'],
-"backup_date": datetime.now().isoformat(),
-"restart_count": running_bots[bot_name].get('restart_count', 0)
-}
+        await loading_msg.edit_caption(resource_text, parse_mode=ParseMode.MARKDOWN, reply_markup=get_bot_actions_keyboard(bot_name))
 
-zip_f.writestr("metadata.json", json.dumps(metadata, indent=2))
+    elif action == 'download':
+        bot_dir = running_bots[bot_name]['bot_dir']
+        archive = await fs_call(build_bot_archive, bot_dir, ["bot.py", "requirements.txt"])
+        try:
+            await loading_msg.delete()
+            await query.message.reply_document(document=archive, filename=f"{bot_name}_source.zip", caption=f"{EMOJI.DOWNLOAD} Here's the source code for `{bot_name}`.")
+        finally:
+            archive.close()
 
-backup_buffer.seek(0)
-await loading_msg.delete()
-await query.message.reply_document(
-document=backup_buffer,
-filename=f"{bot_name}_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
-caption=f"{EMOJI.BACKUP} Backup of `{bot_name}` created successfully!",
-parse_mode=ParseMode.MARKDOWN
-)
-except Exception as e:
-logger.error(f"Error creating backup for {bot_name}: {e}")
-await loading_msg.edit_caption(f"{EMOJI.CANCEL} Failed to create backup: {str(e)}", reply_markup=get_bot_actions_keyboard(bot_name))
+    elif action == 'backup':
+        archive = None
+        try:
+            # Create a backup of the bot on disk in a worker thread
+            bot_dir = running_bots[bot_name]['bot_dir']
+            metadata = {
+                "bot_name": bot_name,
+                "token": running_bots[bot_name]['token'],
+                "backup_date": datetime.now().isoformat(),
+                "restart_count": running_bots[bot_name].get('restart_count', 0)
+            }
+            archive = await fs_call(build_bot_archive, bot_dir, None, metadata)
+
+            archive_size = get_archive_size(archive)
+            if archive_size > TELEGRAM_UPLOAD_LIMIT:
+                await loading_msg.edit_caption(
+                    f"{EMOJI.CANCEL} Backup is {format_bytes(archive_size)}, which is over Telegram's {format_bytes(TELEGRAM_UPLOAD_LIMIT)} upload limit.",
+                    reply_markup=get_bot_actions_keyboard(bot_name)
+                )
+                return
+
+            await loading_msg.delete()
+            await query.message.reply_document(
+                document=archive,
+                filename=f"{bot_name}_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                caption=f"{EMOJI.BACKUP} Backup of `{bot_name}` created successfully!",
+                parse_mode=ParseMode.MARKDOWN
+            )
+        except Exception as e:
+            logger.error(f"Error creating backup for {bot_name}: {e}")
+            await loading_msg.edit_caption(f"{EMOJI.CANCEL} Failed to create backup: {str(e)}", reply_markup=get_bot_actions_keyboard(bot_name))
+        finally:
+            if archive:
+                archive.close()
 
-elif action == 'delete_final':
-bot_dir = running_bots[bot_name].get('bot_dir')
-stop_bot_process(bot_name)
-del running_bots[bot_name]
+    elif action == 'delete_final':
+        bot_dir = running_bots[bot_name].get('bot_dir')
+        await lifecycle_call(stop_bot_process, bot_name)
+        running_bots.pop(bot_name, None)
 
-if bot_dir and os.path.exists(bot_dir):
-shutil.rmtree(bot_dir, ignore_errors=True)
+        if bot_dir:
+            await fs_remove_tree(bot_dir)
 
-# Also clean up log files
-log_dir = os.path.join(LOGS_DIR, bot_name)
-if os.path.exists(log_dir):
-shutil.rmtree(log_dir, ignore_errors=True)
+        # Also clean up log files
+        forget_log_segments(bot_name)
+        forget_ingress_route(bot_name)
+        await fs_call(forget_lifecycle_traces, bot_name)
+        forget_log_ingest_stats(bot_name)
+        await fs_remove_tree(os.path.join(LOGS_DIR, bot_name))
+
+        await loading_msg.edit_caption(f"{EMOJI.SUCCESS} Bot `{bot_name}` has been deleted.", reply_markup=get_back_to_main_menu_keyboard())
 
-await loading_msg.edit_caption(f"{EMOJI.SUCCESS} Bot `{bot_name}` has been deleted.", reply_markup=get_back_to_main_menu_keyboard())
 @authorized_only
 async def delete_all_bots_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
-query = update.callback_query
-await query.answer()
+    query = update.callback_query
+    await query.answer()
 
-if not running_bots:
-await edit_or_reply_message(update, f"{EMOJI.CLIPBOARD} There are no bots to delete.", get_main_menu_keyboard())
-return
+    if not running_bots:
+        await edit_or_reply_message(update, f"{EMOJI.CLIPBOARD} There are no bots to delete.", get_main_menu_keyboard())
+        return
+
+    await edit_or_reply_message(update, f"{EMOJI.WARNING} *DANGER ZONE*\n\nAre you sure you want to delete all *{len(running_bots)}* bots?", get_delete_all_confirmation_keyboard())
 
-await edit_or_reply_message(update, f"{EMOJI.WARNING} *DANGER ZONE*\n\nAre you sure you want to delete all *{len(running_bots)}* bots?", get_delete_all_confirmation_keyboard())
 @authorized_only
 async def delete_all_bots_final(update: Update, context: ContextTypes.DEFAULT_TYPE):
-query = update.callback_query
-await query.answer()
-
-loading_msg = await send_loading_animation(context, query.message.chat_id, f"{EMOJI.LOADING} Deleting all bots...")
-
-for bot_name in list(running_bots.keys()):
-bot_dir = running_bots[bot_name].get('bot_dir')
-stop_bot_process(bot_name)
-if bot_dir and os.path.exists(bot_dir):
-shutil.rmtree(bot_dir, ignore_errors=True)
+    query = update.callback_query
+    await query.answer()
 
-# Also clean up log files
-log_dir = os.path.join(LOGS_DIR, bot_name)
-if os.path.exists(log_dir):
-shutil.rmtree(log_dir, ignore_errors=True)
+    loading_msg = await send_loading_animation(context, query.message.chat_id, f"{EMOJI.LOADING} Deleting all bots...")
 
-running_bots.clear()
+    for bot_name in list(running_bots.keys()):
+        if bot_name not in running_bots:
+            continue
+        bot_dir = running_bots[bot_name].get('bot_dir')
+        await lifecycle_call(stop_bot_process, bot_name)
+        running_bots.pop(bot_name, None)
+        if bot_dir:
+            await fs_remove_tree(bot_dir)
+
+        # Also clean up log files
+        forget_log_segments(bot_name)
+        forget_ingress_route(bot_name)
+        await fs_call(forget_lifecycle_traces, bot_name)
+        forget_log_ingest_stats(bot_name)
+        await fs_remove_tree(os.path.join(LOGS_DIR, bot_name))
+
+    await loading_msg.edit_caption(f"{EMOJI.SUCCESS} All hosted bots have been removed.", reply_markup=get_main_menu_keyboard())
 
-await loading_msg.edit_caption(f"{EMOJI.SUCCESS} All hosted bots have been removed.", reply_markup=get_main_menu_keyboard())
 @authorized_only
 async def settings_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-query = update.callback_query
-await query.answer()
+    query = update.callback_query
+    await query.answer()
+
+    settings_text = f"""
+{EMOJI.GEAR} *BotHoster Pro Settings*
+_These settings are configured in the users.json file._
+
+{EMOJI.ROBOT} *Authorization*
+- Authorized User IDs: `{', '.join(map(str, AUTHORIZED_USERS))}`
+
+{EMOJI.WRENCH} *Limits & Rules*
+- Max Bots Per User: `{MAX_BOTS_PER_USER}`
+- Max Bot Script Size: `{MAX_BOT_FILE_SIZE/1024/1024:.1f} MB`
+- Max Mirror File Size: `{MAX_MIRROR_FILE_SIZE/1024/1024:.0f} MB`
+- Auto Restart Bots: `{'Enabled' if AUTO_RESTART_BOTS else 'Disabled'}`
+- Log Retention: `{LOG_RETENTION_DAYS} days`, `{format_bytes(LOG_MAX_BYTES_PER_BOT)}` per bot, `{format_bytes(LOG_MAX_TOTAL_BYTES)}` total
+- Mirror Workers: `{MIRROR_WORKERS}` (max `{MIRROR_MAX_QUEUED_PER_USER}` queued per user)
+- Archive Compression Level: `{ARCHIVE_COMPRESSION_LEVEL}` (skipping `{', '.join(ARCHIVE_EXCLUDE_DIRS)}`)
+- Mirror Storage Quota: `{format_bytes(MIRROR_STORAGE_QUOTA)}` (default TTL: `{format_mirror_ttl(MIRROR_DEFAULT_TTL_HOURS)}`)
+
+{EMOJI.TEMPLATE} *Templates*
+- Available Templates: `{len(BOT_TEMPLATES)}`
+"""
+    await edit_or_reply_message(update, settings_text, get_main_menu_keyboard())
+
+async def autoreact(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.message:
+        try:
+            await update.message.set_reaction(reaction="👍")
+        except Exception as e:
+            logger.info(f"Could not set reaction: {e}")
+
+# --- Manager Webhook ---
+# With MANAGER_WEBHOOK set, Telegram delivers the manager's updates to a secret path on the app.py web
+# server instead of the manager long-polling getUpdates. The HTTP thread checks the secret token and hands
+# each update to the Application's update queue on the bot's event loop.
+WEBHOOK_MAX_BODY = 1024 * 1024
+manager_application: Optional[Application] = None
+manager_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_webhook_path() -> str:
+    return "/telegram/" + hashlib.sha256(f"path:{WEBHOOK_SECRET}".encode('utf-8')).hexdigest()[:32]
+
+def is_manager_webhook_path(path: str) -> bool:
+    return MANAGER_WEBHOOK and path.split('?', 1)[0] == get_webhook_path()
+
+def submit_webhook_update(secret_token: Optional[str], body: bytes) -> int:
+    """Queues an update received by the web server; returns the HTTP status to answer with.
+
+    Called from the web server's threads, so the update is handed over to the bot's event loop.
+    """
+    if not secret_token or not hmac.compare_digest(secret_token, WEBHOOK_SECRET):
+        return 403
+    if manager_application is None or manager_loop is None:
+        return 503
+    try:
+        update = Update.de_json(json.loads(body), manager_application.bot)
+    except (ValueError, TypeError):
+        return 400
+    if update is None:
+        return 400
+    future = asyncio.run_coroutine_threadsafe(manager_application.update_queue.put(update), manager_loop)
+    try:
+        future.result(timeout=10)
+    except Exception as e:
+        logger.error(f"Could not queue webhook update {update.update_id}: {e}")
+        return 503
+    return 200
+
+def run_manager_webhook(application: Application):
+    """Runs the application fed by webhook updates from the web server until SIGINT or SIGTERM."""
+    global manager_loop
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    async def serve():
+        global manager_application, manager_loop
+        stop_event = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        manager_application, manager_loop = application, loop
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip('/') + get_webhook_path(),
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=WEBHOOK_MAX_CONNECTIONS
+        )
+        logger.info("Bot is receiving updates via webhook.")
+        report_startup('webhook')
+        try:
+            await stop_event.wait()
+        finally:
+            manager_application = None
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+    try:
+        loop.run_until_complete(serve())
+    finally:
+        manager_loop = None
+        loop.close()
+
+# --- Hosted Bot Shim ---
+# Hosted bots are started through this shim. It runs bot.py from the bytecode compiled at start-up when that
+# still matches the source, and adjusts python-telegram-bot according to the environment the manager passes in.
+BOT_SHIM_NAME = "bothoster_shim.py"
+BOT_SHIM_CODE = r'''"""BotHoster shim: runs bot.py, routing its Bot API calls and updates through the host."""
+import asyncio
+import builtins
+import importlib.util
+import json
+import marshal
+import os
+import signal
+import sys
+import time
+import types
+
+API_BASE_URL = os.environ.get("BOTHOSTER_API_BASE_URL")
+FIRST_OUTPUT_FILE = os.environ.get("BOTHOSTER_FIRST_OUTPUT_FILE")
+SOCKET_PATH = os.environ.get("BOTHOSTER_INGRESS_SOCKET")
+WEBHOOK_URL = os.environ.get("BOTHOSTER_INGRESS_URL")
+WEBHOOK_SECRET = os.environ.get("BOTHOSTER_INGRESS_SECRET")
+TELEGRAM_API = "https://api.telegram.org/"
 
-settings_text = f"""
-{EMOJI.GEAR} BotHoster Pro Settings
-These settings are configured in the users.json file.
 
-{EMOJI.ROBOT} Authorization
+def use_api_proxy(bot_class):
+    """Points every Bot that would talk to api.telegram.org at the host's Bot API proxy instead."""
+    original_init = bot_class.__init__
 
-Authorized User IDs: {', '.join(map(str, AUTHORIZED_USERS))}
-{EMOJI.WRENCH} Limits & Rules
+    def __init__(self, token, base_url="https://api.telegram.org/bot", base_file_url="https://api.telegram.org/file/bot", *args, **kwargs):
+        if base_url.startswith(TELEGRAM_API):
+            base_url = API_BASE_URL + "/bot"
+        if base_file_url.startswith(TELEGRAM_API):
+            base_file_url = API_BASE_URL + "/file/bot"
+        original_init(self, token, base_url, base_file_url, *args, **kwargs)
 
-Max Bots Per User: {MAX_BOTS_PER_USER}
-Max Bot Script Size: {MAX_BOT_FILE_SIZE/1024/1024:.1f} MB
-Max Mirror File Size: {MAX_MIRROR_FILE_SIZE/1024/1024:.0f} MB
-Auto Restart Bots: {'Enabled' if AUTO_RESTART_BOTS else 'Disabled'}
-Log Retention: {LOG_RETENTION_DAYS} days
-{EMOJI.TEMPLATE} Templates
+    bot_class.__init__ = __init__
 
-Available Templates: {len(BOT_TEMPLATES)}
+
+async def serve(application, allowed_updates=None, drop_pending_updates=None):
+    from telegram import Update
+
+    async def handle(reader, writer):
+        try:
+            data = await reader.read()
+            update = Update.de_json(json.loads(data), application.bot)
+            if update is not None:
+                await application.update_queue.put(update)
+            writer.write(b"ok")
+            await writer.drain()
+        except Exception as e:
+            print(f"Ingress error: {e}", file=sys.stderr, flush=True)
+        finally:
+            writer.close()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    if os.path.exists(SOCKET_PATH):
+        os.remove(SOCKET_PATH)
+    server = await asyncio.start_unix_server(handle, path=SOCKET_PATH)
+    await application.bot.set_webhook(
+        url=WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=allowed_updates,
+        drop_pending_updates=drop_pending_updates,
+    )
+    print("Receiving updates through the BotHoster webhook ingress", flush=True)
+    try:
+        await stop.wait()
+    finally:
+        server.close()
+        await server.wait_closed()
+        if os.path.exists(SOCKET_PATH):
+            os.remove(SOCKET_PATH)
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def run_ingress(self, *args, allowed_updates=None, drop_pending_updates=None, **kwargs):
+    asyncio.run(serve(self, allowed_updates, drop_pending_updates))
+
+
+class FirstOutputStream:
+    """Wraps stdout/stderr to note when the bot first wrote anything, for the host's deploy timings."""
+    pending = True
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        if FirstOutputStream.pending and text:
+            FirstOutputStream.pending = False
+            try:
+                with open(FIRST_OUTPUT_FILE, "w") as f:
+                    f.write(repr(time.time()))
+            except OSError:
+                pass
+        return self.stream.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def load_code(path):
+    """Returns the code of path, from its hash-checked .pyc when that matches the source."""
+    with open(path, "rb") as f:
+        source = f.read()
+    try:
+        with open(importlib.util.cache_from_source(path), "rb") as f:
+            data = f.read()
+        if (data[:4] == importlib.util.MAGIC_NUMBER and int.from_bytes(data[4:8], "little") & 1
+                and data[8:16] == importlib.util.source_hash(source)):
+            return marshal.loads(data[16:])
+    except (OSError, ValueError, EOFError):
+        pass
+    return compile(source, path, "exec", dont_inherit=True)
+
+
+def run_main(path):
+    module = types.ModuleType("__main__")
+    module.__file__ = os.path.abspath(path)
+    module.__builtins__ = builtins
+    sys.modules["__main__"] = module
+    exec(load_code(path), module.__dict__)
+
+
+if __name__ == "__main__":
+    if API_BASE_URL or SOCKET_PATH:
+        try:
+            import telegram
+            from telegram.ext import Application
+            if API_BASE_URL:
+                use_api_proxy(telegram.Bot)
+            if SOCKET_PATH:
+                Application.run_polling = run_ingress
+        except ImportError:
+            pass
+    if FIRST_OUTPUT_FILE:
+        sys.stdout = FirstOutputStream(sys.stdout)
+        sys.stderr = FirstOutputStream(sys.stderr)
+    sys.argv = sys.argv[1:]
+    run_main(sys.argv[0])
+'''
+
+# --- Webhook Ingress for Hosted Bots ---
+# With webhook_ingress enabled, the hosted bot shim (BOT_SHIM_NAME in the bot dir) replaces
+# Application.run_polling: the child registers a webhook pointing at
+# /ingress/<route> on the app.py server and listens on a Unix socket in its bot dir. The web server looks
+# the route up, checks the bot's secret token and forwards the update body over that socket, so one
+# port serves every bot and no child keeps a getUpdates connection open.
+INGRESS_PATH_PREFIX = "/ingress/"
+INGRESS_SOCKET_NAME = "ingress.sock"
+INGRESS_TIMEOUT = 10
+ingress_routes: Dict[str, str] = {}
+ingress_stats = {'forwarded': 0, 'rejected': 0, 'unavailable': 0}
+
+
+def _ingress_digest(purpose: str, bot_token: str) -> str:
+    return hmac.new(WEBHOOK_SECRET.encode('utf-8'), f"{purpose}:{bot_token}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+def get_ingress_route(bot_token: str) -> str:
+    return _ingress_digest("route", bot_token)[:32]
+
+def get_ingress_secret(bot_token: str) -> str:
+    return _ingress_digest("secret", bot_token)
+
+def get_ingress_socket_path(bot_name: str) -> str:
+    return os.path.abspath(os.path.join(BOTS_DIR, bot_name, INGRESS_SOCKET_NAME))
+
+def prepare_bot_shim(bot_name: str, bot_token: str, bot_dir: str) -> Dict[str, str]:
+    """Writes the shim into the bot dir, registers the bot's ingress route and returns the child's environment."""
+    with open(os.path.join(bot_dir, BOT_SHIM_NAME), 'w', encoding='utf-8') as f:
+        f.write(BOT_SHIM_CODE)
+    env = dict(os.environ)
+    if WEBHOOK_INGRESS:
+        route = get_ingress_route(bot_token)
+        ingress_routes[route] = bot_name
+        env['BOTHOSTER_INGRESS_SOCKET'] = get_ingress_socket_path(bot_name)
+        env['BOTHOSTER_INGRESS_URL'] = WEBHOOK_URL.rstrip('/') + INGRESS_PATH_PREFIX + route
+        env['BOTHOSTER_INGRESS_SECRET'] = get_ingress_secret(bot_token)
+    if BOT_API_PROXY:
+        env['BOTHOSTER_API_BASE_URL'] = f"http://127.0.0.1:{BOT_API_PROXY_PORT}"
+    return env
+
+def forget_ingress_route(bot_name: str):
+    for route, name in list(ingress_routes.items()):
+        if name == bot_name:
+            ingress_routes.pop(route, None)
+
+def forward_ingress_update(path: str, secret_token: Optional[str], body: bytes) -> int:
+    """Forwards an update for a hosted bot to its Unix socket; returns the HTTP status to answer with.
+
+    Called from the web server's threads. A bot that is not listening gets a 503, so Telegram retries later.
+    """
+    bot_name = ingress_routes.get(path[len(INGRESS_PATH_PREFIX):].split('?', 1)[0])
+    bot_info = running_bots.get(bot_name) if bot_name else None
+    if not bot_info:
+        return 404
+    if not secret_token or not hmac.compare_digest(secret_token, get_ingress_secret(bot_info['token'])):
+        ingress_stats['rejected'] += 1
+        return 403
+    if buffer_hibernated_update(bot_name, bot_info, body):
+        return 200
+    if not send_ingress_update(bot_name, body):
+        ingress_stats['unavailable'] += 1
+        return 503
+    bot_info['last_update'] = time.time()
+    ingress_stats['forwarded'] += 1
+    return 200
+
+def send_ingress_update(bot_name: str, body: bytes) -> bool:
+    """Hands one update to the bot's ingress socket; True once the bot has acknowledged it."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(INGRESS_TIMEOUT)
+            sock.connect(get_ingress_socket_path(bot_name))
+            sock.sendall(body)
+            sock.shutdown(socket.SHUT_WR)
+            return sock.recv(2) == b"ok"
+    except OSError:
+        return False
+
+# --- Bot Hibernation ---
+# With the webhook ingress, a bot that has been idle long enough can be stopped and woken again by its next
+# update: updates that arrive while it is asleep or starting up are buffered and replayed in order.
+HIBERNATE_POLICY_FILE = ".hibernate"
+HIBERNATE_OPTIONS = [0, 15, 60, 240]  # Idle minutes before hibernating, 0 = never
+HIBERNATE_BUFFER_LIMIT = 100
+HIBERNATE_WAKE_TIMEOUT = 60
+HIBERNATE_REPLAY_ATTEMPTS = 3
+
+hibernation_lock = threading.Lock()
+
+def get_hibernate_minutes(bot_name: str) -> int:
+    policy_path = os.path.join(BOTS_DIR, bot_name, HIBERNATE_POLICY_FILE)
+    try:
+        with open(policy_path, 'r', encoding='utf-8') as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+def set_hibernate_minutes(bot_name: str, minutes: int):
+    policy_path = os.path.join(BOTS_DIR, bot_name, HIBERNATE_POLICY_FILE)
+    if minutes:
+        with open(policy_path, 'w', encoding='utf-8') as f:
+            f.write(str(minutes))
+    elif os.path.exists(policy_path):
+        os.remove(policy_path)
+
+def is_bot_hibernated(bot_name: str) -> bool:
+    bot_info = running_bots.get(bot_name)
+    return bool(bot_info and 'hibernation' in bot_info and bot_info['process'].poll() is not None)
+
+def get_bot_idle_seconds(bot_info: Dict[str, Any]) -> float:
+    return time.time() - bot_info.get('last_update', bot_info['start_time'].timestamp())
+
+def has_ingress_socket(bot_name: str, since: float) -> bool:
+    """True if the bot opened its ingress socket at or after `since`; older sockets were left by a previous run."""
+    try:
+        return os.stat(get_ingress_socket_path(bot_name)).st_mtime >= since
+    except OSError:
+        return False
+
+async def is_served_by_ingress(bot_name: str) -> bool:
+    """True once the running bot takes its updates through the webhook ingress, i.e. it can be woken by one.
+
+    Only bots started through the shim's run_polling listen on the ingress socket; a bot that never opened it
+    would never see the update meant to wake it.
+    """
+    bot_info = running_bots.get(bot_name)
+    if not WEBHOOK_INGRESS or not bot_info or isinstance(bot_info['process'], SharedRuntimeBot):
+        return False
+    if 'last_update' in bot_info or bot_info.get('ingress_ready'):
+        return True
+    if await fs_call(has_ingress_socket, bot_name, bot_info['start_time'].timestamp()):
+        bot_info['ingress_ready'] = True
+        return True
+    return False
+
+async def hibernate_bot(bot_name: str):
+    """Stops an idle bot but keeps its webhook and ingress route, so its next update wakes it."""
+    await lifecycle_call(stop_bot_process, bot_name)
+    bot_info = running_bots.get(bot_name)
+    if bot_info is None:
+        return
+    bot_info['hibernation'] = {'since': time.time(), 'buffer': [], 'waking': False, 'dropped': 0}
+    logger.info(f"Bot {bot_name} hibernated after {bot_info.get('hibernate_minutes', 0)} idle minutes.")
+
+async def check_bot_hibernation(bot_name: str):
+    """Called from the monitor loop for running bots."""
+    bot_info = running_bots[bot_name]
+    minutes = bot_info.get('hibernate_minutes', 0)
+    if not WEBHOOK_INGRESS or not minutes or 'hibernation' in bot_info:
+        return
+    if get_bot_idle_seconds(bot_info) >= minutes * 60 and await is_served_by_ingress(bot_name):
+        await hibernate_bot(bot_name)
+
+def buffer_hibernated_update(bot_name: str, bot_info: Dict[str, Any], body: bytes) -> bool:
+    """Buffers an update for a hibernated or waking bot and starts the wake-up; False if the bot is awake.
+
+    Called from the web server's threads.
+    """
+    with hibernation_lock:
+        hibernation = bot_info.get('hibernation')
+        if hibernation is None:
+            return False
+        if len(hibernation['buffer']) < HIBERNATE_BUFFER_LIMIT:
+            hibernation['buffer'].append(body)
+        else:
+            hibernation['dropped'] += 1
+        if hibernation['waking'] or event_loop is None:
+            return True
+        hibernation['waking'] = True
+    event_loop.call_soon_threadsafe(lambda: asyncio.create_task(wake_bot(bot_name, hibernation)))
+    return True
+
+async def wake_bot(bot_name: str, hibernation: Dict[str, Any]):
+    """Starts a hibernated bot, waits for its ingress socket and replays the buffered updates.
+
+    The bot can be stopped or deleted while this runs, so its entry is looked up again after every await;
+    once it is gone or replaced, the wake-up is abandoned.
+    """
+    slept = time.time() - hibernation['since']
+    logger.info(f"Waking bot {bot_name} after {slept:.0f}s of hibernation.")
+    started = time.monotonic()
+    socket_path = get_ingress_socket_path(bot_name)
+    bot_info = running_bots.get(bot_name)
+    if bot_info is None or bot_info.get('hibernation') is not hibernation:
+        return
+    if bot_info['process'].poll() is not None:
+        if await fs_exists(socket_path):
+            await fs_call(os.remove, socket_path)  # Left behind if the bot was killed, it would look ready too early
+        woke = await lifecycle_call(start_bot_process, bot_name)
+        if bot_name not in running_bots:
+            logger.info(f"Bot {bot_name} was deleted while waking up.")
+            return
+        if not woke:
+            logger.error(f"Failed to wake bot {bot_name}, will retry on its next update.")
+            with hibernation_lock:
+                hibernation['waking'] = False
+            return
+        # The fresh bot_info keeps buffering until the replay has caught up
+        bot_info = running_bots[bot_name]
+        bot_info['hibernation'] = hibernation
+    while not await fs_exists(socket_path):
+        if running_bots.get(bot_name) is not bot_info:
+            logger.info(f"Bot {bot_name} was stopped or deleted while waking up.")
+            return
+        if bot_info['process'].poll() is not None or time.monotonic() - started > HIBERNATE_WAKE_TIMEOUT:
+            logger.error(f"Bot {bot_name} did not come up after waking, {len(hibernation['buffer'])} buffered updates dropped.")
+            with hibernation_lock:
+                bot_info.pop('hibernation', None)
+            return
+        await asyncio.sleep(0.2)
+
+    replayed = 0
+    while True:
+        with hibernation_lock:
+            if running_bots.get(bot_name) is not bot_info or not hibernation['buffer']:
+                bot_info.pop('hibernation', None)
+                break
+            body = hibernation['buffer'].pop(0)
+        # Telegram already got a 200 for this update, so it is retried here rather than by Telegram
+        for attempt in range(HIBERNATE_REPLAY_ATTEMPTS):
+            if await asyncio.to_thread(send_ingress_update, bot_name, body):
+                replayed += 1
+                ingress_stats['forwarded'] += 1
+                break
+            await asyncio.sleep(2 ** attempt)
+        else:
+            logger.warning(f"Bot {bot_name} did not accept a buffered update after {HIBERNATE_REPLAY_ATTEMPTS} attempts, dropping it.")
+            ingress_stats['unavailable'] += 1
+            hibernation['dropped'] += 1
+    bot_info['last_update'] = time.time()
+    logger.info(f"Bot {bot_name} woke in {time.monotonic() - started:.1f}s, replayed {replayed} updates"
+                + (f", {hibernation['dropped']} dropped" if hibernation['dropped'] else "") + ".")
+
+# --- Bot API Proxy ---
+# With bot_api_proxy enabled, the manager runs a Bot API proxy on 127.0.0.1:BOT_API_PROXY_PORT and the shim
+# points hosted bots at it. Requests are relayed over one pooled keep-alive httpx client (HTTP/2 when the
+# h2 package is installed), so every bot shares the same upstream connections and TLS sessions.
+TELEGRAM_API_UPSTREAM = os.environ.get("TELEGRAM_API_UPSTREAM", "https://api.telegram.org")
+BOT_API_PROXY_TIMEOUT = 30.0
+BOT_API_PROXY_READ_TIMEOUT = 90.0  # long enough for getUpdates long polls
+BOT_API_PROXY_QUEUE_TIMEOUT = 60
+BOT_API_PROXY_PATH_PATTERN = re.compile(r'^/(?:file/)?bot([^/]+)/')
+bot_api_proxy_client: Optional["httpx.Client"] = None
+bot_api_proxy_server: Optional[ThreadingHTTPServer] = None
+bot_api_proxy_slots: Dict[str, threading.BoundedSemaphore] = {}
+bot_api_proxy_stats: Dict[str, Dict[str, Any]] = {}
+bot_api_proxy_lock = threading.Lock()
+
+def _bot_api_proxy_entry(bot_token: str) -> Tuple[threading.BoundedSemaphore, Dict[str, Any]]:
+    with bot_api_proxy_lock:
+        if bot_token not in bot_api_proxy_slots:
+            bot_api_proxy_slots[bot_token] = threading.BoundedSemaphore(BOT_API_PROXY_MAX_CONCURRENCY)
+            bot_api_proxy_stats[bot_token] = {'requests': 0, 'errors': 0, 'throttled': 0, 'in_flight': 0, 'total_time': 0.0}
+        return bot_api_proxy_slots[bot_token], bot_api_proxy_stats[bot_token]
+
+def _update_bot_api_proxy_stats(stats: Dict[str, Any], **deltas):
+    with bot_api_proxy_lock:
+        for key, delta in deltas.items():
+            stats[key] += delta
+
+class BotAPIProxyHandler(BaseHTTPRequestHandler):
+    """Relays /bot<token>/<method> and /file/bot<token>/<path> requests from hosted bots to the Bot API."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.relay()
+
+    def do_POST(self):
+        self.relay()
+
+    def reply_error(self, status: int, description: str):
+        data = json.dumps({"ok": False, "error_code": status, "description": description}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def relay(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        match = BOT_API_PROXY_PATH_PATTERN.match(self.path)
+        bot_token = match.group(1) if match else None
+        if not bot_token or bot_token not in {info['token'] for info in list(running_bots.values())}:
+            self.reply_error(403, "Forbidden: not a hosted bot")
+            return
+
+        slot, stats = _bot_api_proxy_entry(bot_token)
+        if not slot.acquire(blocking=False):
+            _update_bot_api_proxy_stats(stats, throttled=1)
+            if not slot.acquire(timeout=BOT_API_PROXY_QUEUE_TIMEOUT):
+                self.reply_error(429, "Too Many Requests: proxy concurrency limit reached")
+                return
+        _update_bot_api_proxy_stats(stats, in_flight=1)
+        started = time.monotonic()
+        failed = False
+        try:
+            headers = {'Content-Type': self.headers['Content-Type']} if self.headers.get('Content-Type') else {}
+            with bot_api_proxy_client.stream(self.command, TELEGRAM_API_UPSTREAM + self.path, content=body, headers=headers) as response:
+                failed = response.status_code >= 400
+                self.send_response(response.status_code)
+                for header in ('Content-Type', 'Content-Encoding'):
+                    if header in response.headers:
+                        self.send_header(header, response.headers[header])
+                content_length = response.headers.get('Content-Length')
+                if content_length is None:
+                    data = b"".join(response.iter_raw())
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                else:
+                    self.send_header('Content-Length', content_length)
+                    self.end_headers()
+                    for chunk in response.iter_raw():
+                        self.wfile.write(chunk)
+        except httpx.HTTPError as e:
+            failed = True
+            logger.warning(f"Bot API proxy request failed: {type(e).__name__}")
+            try:
+                self.reply_error(502, "Bad Gateway: Bot API unreachable")
+            except OSError:
+                self.close_connection = True
+        except OSError:
+            # The bot went away mid-response (e.g. it was stopped during a long poll)
+            self.close_connection = True
+        finally:
+            slot.release()
+            _update_bot_api_proxy_stats(stats, in_flight=-1, requests=1, errors=int(failed), total_time=time.monotonic() - started)
+
+class BotAPIProxyServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Every hosted bot connects to the proxy; with socketserver's default backlog of 5, a burst of new
+    # connections (e.g. after Start All) gets reset
+    request_queue_size = 128
+
+def start_bot_api_proxy():
+    """Starts the Bot API proxy in a background thread."""
+    global bot_api_proxy_client, bot_api_proxy_server
+    try:
+        import h2  # noqa: F401 - enables HTTP/2 in httpx
+        http2 = True
+    except ImportError:
+        http2 = False
+    # httpx logs every request URL at INFO level, which would put each relayed request and its token in our logs
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    bot_api_proxy_client = httpx.Client(
+        http2=http2,
+        timeout=httpx.Timeout(BOT_API_PROXY_TIMEOUT, read=BOT_API_PROXY_READ_TIMEOUT),
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+    )
+    bot_api_proxy_server = BotAPIProxyServer(('127.0.0.1', BOT_API_PROXY_PORT), BotAPIProxyHandler)
+    threading.Thread(target=bot_api_proxy_server.serve_forever, name="bot-api-proxy", daemon=True).start()
+    logger.info(f"Bot API proxy listening on 127.0.0.1:{BOT_API_PROXY_PORT} (HTTP/2 {'on' if http2 else 'off'}).")
+
+def get_bot_api_proxy_summary() -> List[Tuple[str, Dict[str, Any]]]:
+    """Returns (bot name, stats) pairs for the proxy, busiest bots first."""
+    names = {info['token']: bot_name for bot_name, info in list(running_bots.items())}
+    with bot_api_proxy_lock:
+        summary = [(names.get(bot_token, "(removed)"), dict(stats)) for bot_token, stats in bot_api_proxy_stats.items()]
+    return sorted(summary, key=lambda item: item[1]['requests'], reverse=True)
+
+# --- Shared Runtime ---
+# Trusted, lightweight bots can opt in to run as separate Applications inside one shared worker process
+# instead of a process each. The worker is controlled over a Unix socket; each bot keeps its own log pipe.
+# Control requests block, so they never run on the event loop: loading and unloading happen on the lifecycle
+# thread as part of starting and stopping a bot, and usage stats are fetched with asyncio.to_thread.
+RUNTIME_DIR = "data/runtime"
+RUNTIME_WORKER_NAME = "bothoster_runtime.py"
+RUNTIME_CONTROL_SOCKET = "control.sock"
+RUNTIME_MARKER_FILE = ".shared_runtime"
+RUNTIME_REQUEST_TIMEOUT = 120
+RUNTIME_WORKER_CODE = r'''"""BotHoster shared runtime: runs many python-telegram-bot Applications in one process on one event loop.
+
+The manager loads and unloads bots over a Unix control socket. Each bot's output is routed to a pipe the
+manager passes in with the load request, and its coroutines are accounted to it for CPU time.
 """
-await edit_or_reply_message(update, settings_text, get_main_menu_keyboard())
-async def autoreact(update: Update, context: ContextTypes.DEFAULT_TYPE):
-if update.message:
-try:
-await update.message.set_reaction(reaction="👍")
-except Exception as e:
-logger.info(f"Could not set reaction: {e}")
+import asyncio
+import builtins
+import collections.abc
+import contextvars
+import importlib.util
+import io
+import json
+import marshal
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+
+CONTROL_SOCKET = sys.argv[1]
+API_BASE_URL = os.environ.get("BOTHOSTER_API_BASE_URL")
+TELEGRAM_API = "https://api.telegram.org/"
+MAX_PENDING_OUTPUT = 1024 * 1024
+
+current_bot = contextvars.ContextVar("current_bot", default=None)
+bots = {}
+pending_apps = {}
+worker_stdout = sys.stdout
+
+
+def emit(bot, data):
+    """Writes to the bot's pipe without ever blocking the shared loop; output beyond the buffer is dropped."""
+    bot["pending"] += data
+    if len(bot["pending"]) > MAX_PENDING_OUTPUT:
+        del bot["pending"][:len(bot["pending"]) - MAX_PENDING_OUTPUT]
+        bot["pending"][:0] = b"--- output dropped: log reader too slow ---\n"
+    try:
+        written = os.write(bot["fd"], bot["pending"])
+        del bot["pending"][:written]
+    except BlockingIOError:
+        pass
+    except OSError:
+        bot["pending"].clear()
+
+
+class RoutedStream(io.TextIOBase):
+    """stdout/stderr replacement that sends text to the pipe of the bot whose code is running."""
+
+    def write(self, text):
+        bot = bots.get(current_bot.get())
+        if bot is None:
+            worker_stdout.write(text)
+            worker_stdout.flush()
+        else:
+            emit(bot, text.encode("utf-8", errors="replace"))
+        return len(text)
+
+    def writable(self):
+        return True
+
+
+class AccountedCoroutine(collections.abc.Coroutine):
+    """Wraps a coroutine and adds the CPU time of each step to its bot's stats."""
+
+    __slots__ = ("coro", "stats")
+
+    def __init__(self, coro, stats):
+        self.coro = coro
+        self.stats = stats
+
+    def send(self, value):
+        started = time.thread_time()
+        try:
+            return self.coro.send(value)
+        finally:
+            self.stats["cpu_time"] += time.thread_time() - started
+
+    def throw(self, *args):
+        started = time.thread_time()
+        try:
+            return self.coro.throw(*args)
+        finally:
+            self.stats["cpu_time"] += time.thread_time() - started
+
+    def close(self):
+        return self.coro.close()
+
+    def __await__(self):
+        return self
+
+
+def task_factory(loop, coro, **kwargs):
+    bot = bots.get(current_bot.get())
+    if bot is not None:
+        coro = AccountedCoroutine(coro, bot["stats"])
+    return asyncio.Task(coro, loop=loop, **kwargs)
+
+
+def load_code(path):
+    """Returns the code of path, from its hash-checked .pyc when that matches the source."""
+    with open(path, "rb") as f:
+        source = f.read()
+    try:
+        with open(importlib.util.cache_from_source(path), "rb") as f:
+            data = f.read()
+        if (data[:4] == importlib.util.MAGIC_NUMBER and int.from_bytes(data[4:8], "little") & 1
+                and data[8:16] == importlib.util.source_hash(source)):
+            return marshal.loads(data[16:])
+    except (OSError, ValueError, EOFError):
+        pass
+    return compile(source, path, "exec", dont_inherit=True)
+
+
+def capture_run_polling(self, *args, **kwargs):
+    """Replaces Application.run_polling: the runtime starts polling itself once bot.py has been executed."""
+    pending_apps[current_bot.get()] = (self, kwargs)
+
+
+async def load_bot(name, bot_dir, fd):
+    from telegram import Update
+    from telegram.ext import TypeHandler
+
+    current_bot.set(name)
+    os.set_blocking(fd, False)
+    bot = {"fd": fd, "pending": bytearray(), "app": None, "context": contextvars.copy_context(),
+           "stats": {"cpu_time": 0.0, "updates": 0, "errors": 0, "loaded_at": time.time()}}
+    bots[name] = bot
+    try:
+        bot_path = os.path.join(bot_dir, "bot.py")
+        sys.path.insert(0, bot_dir)
+        try:
+            exec(load_code(bot_path), {"__name__": "__main__", "__file__": bot_path, "__builtins__": builtins})
+        finally:
+            sys.path.remove(bot_dir)
+        if name not in pending_apps:
+            raise RuntimeError("bot.py did not call Application.run_polling()")
+        app, polling_kwargs = pending_apps.pop(name)
+
+        async def count_update(update, context):
+            bot["stats"]["updates"] += 1
+
+        async def report_error(update, context):
+            bot["stats"]["errors"] += 1
+            traceback.print_exception(context.error, file=sys.stderr)
+
+        app.add_handler(TypeHandler(Update, count_update), group=-1000)
+        if not app.error_handlers:
+            app.add_error_handler(report_error)
+        bot["app"] = app
+        await app.initialize()
+        if app.post_init:
+            await app.post_init(app)
+        await app.start()
+        await app.updater.start_polling(
+            allowed_updates=polling_kwargs.get("allowed_updates"),
+            drop_pending_updates=polling_kwargs.get("drop_pending_updates"),
+        )
+        print(f"--- Loaded into the shared runtime (pid {os.getpid()}) ---", flush=True)
+    except BaseException:
+        traceback.print_exc()
+        await unload_bot(name)
+        raise
+
+
+async def unload_bot(name):
+    bot = bots.get(name)
+    if bot is None:
+        return
+    app = bot["app"]
+    try:
+        if app is not None:
+            if app.updater and app.updater.running:
+                await app.updater.stop()
+            if app.running:
+                await app.stop()
+                if app.post_stop:
+                    await app.post_stop(app)
+            await app.shutdown()
+            if app.post_shutdown:
+                await app.post_shutdown(app)
+    except Exception:
+        traceback.print_exc()
+    finally:
+        bots.pop(name, None)
+        pending_apps.pop(name, None)
+        os.close(bot["fd"])
+
+
+async def handle_request(request, fds):
+    op = request.get("op")
+    if op == "load":
+        await asyncio.get_running_loop().create_task(load_bot(request["name"], request["bot_dir"], fds[0]), context=contextvars.Context())
+        return {"ok": True}
+    for fd in fds:
+        os.close(fd)
+    if op == "unload":
+        bot = bots.get(request["name"])
+        if bot is not None:
+            # Shut down in the bot's own context so its final output still goes to its log
+            await asyncio.get_running_loop().create_task(unload_bot(request["name"]), context=bot["context"])
+        return {"ok": True}
+    if op == "stats":
+        return {"ok": True, "bots": {name: bot["stats"] for name, bot in bots.items()}}
+    if op == "ping":
+        return {"ok": True, "pid": os.getpid()}
+    return {"ok": False, "error": f"unknown op {op!r}"}
+
+
+def serve_control(loop):
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if os.path.exists(CONTROL_SOCKET):
+        os.remove(CONTROL_SOCKET)
+    server.bind(CONTROL_SOCKET)
+    server.listen(16)
+    while True:
+        conn, _ = server.accept()
+        with conn:
+            fds = []
+            try:
+                message, fds, _, _ = socket.recv_fds(conn, 65536, 4)
+                future = asyncio.run_coroutine_threadsafe(handle_request(json.loads(message), fds), loop)
+                response = future.result(timeout=120)
+            except Exception as e:
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            try:
+                conn.sendall(json.dumps(response).encode("utf-8"))
+            except OSError:
+                pass
+
+
+def use_api_proxy(bot_class):
+    """Points every Bot that would talk to api.telegram.org at the host's Bot API proxy instead."""
+    original_init = bot_class.__init__
+
+    def __init__(self, token, base_url="https://api.telegram.org/bot", base_file_url="https://api.telegram.org/file/bot", *args, **kwargs):
+        if base_url.startswith(TELEGRAM_API):
+            base_url = API_BASE_URL + "/bot"
+        if base_file_url.startswith(TELEGRAM_API):
+            base_file_url = API_BASE_URL + "/file/bot"
+        original_init(self, token, base_url, base_file_url, *args, **kwargs)
+
+    bot_class.__init__ = __init__
+
 
---- Main Application Setup ---
 def main():
-"""Initializes and runs the bot application."""
-application = Application.builder().token(TOKEN).build()
-
-# Create template files
-create_bot_template_files()
-
-# Start the bot monitor task
-global bot_monitor_task
-bot_monitor_task = asyncio.create_task(monitor_bots())
-
-upload_conv_handler = ConversationHandler(
-entry_points=[CallbackQueryHandler(upload_start, pattern='^upload_start$')],
-states={
-ASK_BOT_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, ask_bot_file)],
-GET_BOT_FILE: [MessageHandler(filters.Document.ALL, receive_bot_file)],
-GET_TOKEN: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_token_and_ask_requirements)],
-GET_REQUIREMENTS: [
-CallbackQueryHandler(handle_requirements_decision, pattern='^(has_requirements|no_requirements)$'),
-MessageHandler(filters.Document.ALL, receive_requirements_file),
-],
-},
-fallbacks=[CallbackQueryHandler(cancel_operation, pattern='^cancel_operation$'), CommandHandler('cancel', cancel_operation)],
-per_user=True, per_chat=True
-)
+    import telegram
+    from telegram.ext import Application
+
+    if API_BASE_URL:
+        use_api_proxy(telegram.Bot)
+    Application.run_polling = capture_run_polling
+    sys.stdout = sys.stderr = RoutedStream()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.set_task_factory(task_factory)
+    threading.Thread(target=serve_control, args=(loop,), daemon=True).start()
+    print(f"Shared runtime ready (pid {os.getpid()})")
+    loop.run_forever()
+
+
+if __name__ == "__main__":
+    main()
+'''
 
-mirror_conv_handler = ConversationHandler(
-entry_points=[CallbackQueryHandler(mirror_start, pattern='^mirror_start$')],
-states={
-ASK_MIRROR_FILE: [MessageHandler(filters.ALL & ~filters.COMMAND, receive_mirror_file)]
-},
-fallbacks=[CallbackQueryHandler(cancel_operation, pattern='^cancel_operation$'), CommandHandler('cancel', cancel_operation)],
-per_user=True, per_chat=True
-)
+shared_runtime = {'process': None, 'log_file': None}
 
-edit_code_conv_handler = ConversationHandler(
-entry_points=[CallbackQueryHandler(edit_bot_code, pattern='^bot_action:edit:')],
-states={
-EDIT_CODE: [
-CallbackQueryHandler(save_edited_code, pattern='^save_code:'),
-MessageHandler(filters.Document.ALL, receive_edited_code)
-]
-},
-fallbacks=[CallbackQueryHandler(cancel_operation, pattern='^cancel_operation$'), CommandHandler('cancel', cancel_operation)],
-per_user=True, per_chat=True
-)
+def is_shared_runtime_bot(bot_name: str) -> bool:
+    return os.path.exists(os.path.join(BOTS_DIR, bot_name, RUNTIME_MARKER_FILE))
+
+def set_shared_runtime_bot(bot_name: str, enabled: bool):
+    marker_path = os.path.join(BOTS_DIR, bot_name, RUNTIME_MARKER_FILE)
+    if enabled:
+        with open(marker_path, 'w', encoding='utf-8') as f:
+            f.write("Run this bot inside the BotHoster shared runtime.\n")
+    elif os.path.exists(marker_path):
+        os.remove(marker_path)
+
+def is_shared_runtime_worker(pid: int, control_path: str) -> bool:
+    """Checks that `pid` is still a shared worker serving `control_path`; after a restart it may belong to
+    an unrelated process, such as a hosted bot, which is a process group leader too."""
+    try:
+        return psutil.Process(pid).cmdline()[1:] == [RUNTIME_WORKER_NAME, control_path]
+    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess, IndexError):
+        return False
+
+def ensure_shared_runtime() -> subprocess.Popen:
+    """Returns the shared worker process, starting it if it is not running."""
+    process = shared_runtime['process']
+    if process and process.poll() is None:
+        return process
+    os.makedirs(RUNTIME_DIR, exist_ok=True)
+    with open(os.path.join(RUNTIME_DIR, RUNTIME_WORKER_NAME), 'w', encoding='utf-8') as f:
+        f.write(RUNTIME_WORKER_CODE)
+    if shared_runtime['log_file']:
+        shared_runtime['log_file'].close()
+    shared_runtime['log_file'] = open(os.path.join(RUNTIME_DIR, "runtime.log"), 'a', encoding='utf-8')
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    if BOT_API_PROXY:
+        env['BOTHOSTER_API_BASE_URL'] = f"http://127.0.0.1:{BOT_API_PROXY_PORT}"
+    control_path = os.path.abspath(os.path.join(RUNTIME_DIR, RUNTIME_CONTROL_SOCKET))
+    if os.path.exists(control_path):
+        os.remove(control_path)
+    pid_path = os.path.join(RUNTIME_DIR, "runtime.pid")
+    if os.path.exists(pid_path):
+        # A worker left behind by a previous manager would keep polling for its bots
+        try:
+            with open(pid_path, 'r') as f:
+                stale_pid = int(f.read().strip())
+            if is_shared_runtime_worker(stale_pid, control_path):
+                os.killpg(stale_pid, signal.SIGTERM)
+        except (ValueError, ProcessLookupError, PermissionError):
+            pass
+    process = subprocess.Popen(
+        ['python3', RUNTIME_WORKER_NAME, control_path],
+        env=env,
+        stdout=shared_runtime['log_file'],
+        stderr=subprocess.STDOUT,
+        cwd=RUNTIME_DIR,
+        preexec_fn=os.setsid
+    )
+    shared_runtime['process'] = process
+    with open(pid_path, 'w') as f:
+        f.write(str(process.pid))
+    deadline = time.time() + 10
+    while not os.path.exists(control_path):
+        if process.poll() is not None or time.time() > deadline:
+            raise RuntimeError(f"Shared runtime failed to start, see {RUNTIME_DIR}/runtime.log")
+        time.sleep(0.05)
+    logger.info(f"Started shared runtime with PID {process.pid}.")
+    return process
+
+def shared_runtime_request(request: Dict[str, Any], fds: Optional[List[int]] = None) -> Dict[str, Any]:
+    """Sends one control request to the shared worker and returns its reply."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(RUNTIME_REQUEST_TIMEOUT)
+        sock.connect(os.path.join(RUNTIME_DIR, RUNTIME_CONTROL_SOCKET))
+        socket.send_fds(sock, [json.dumps(request).encode('utf-8')], fds or [])
+        sock.shutdown(socket.SHUT_WR)
+        chunks = []
+        while chunk := sock.recv(65536):
+            chunks.append(chunk)
+    response = json.loads(b"".join(chunks) or b"{}")
+    if not response.get('ok'):
+        raise RuntimeError(response.get('error', "no response from the shared runtime"))
+    return response
+
+class SharedRuntimeBot:
+    """Stands in for the Popen of a bot loaded into the shared runtime.
+
+    It is also its own stdout: reads drain the bot's log pipe, and the bot counts as exited once the pipe closes,
+    which happens when the bot fails to load, is unloaded or the worker dies.
+    """
+
+    def __init__(self, bot_name: str, worker: subprocess.Popen, read_fd: int):
+        self.bot_name = bot_name
+        self.worker = worker
+        self.pid = worker.pid
+        self.returncode = None
+        self.stdout = self
+        self._fd = read_fd
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def read(self) -> str:
+        if self._fd is None:
+            return ""
+        chunks = []
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                chunks.append(self._decoder.decode(b"", final=True))
+                os.close(self._fd)
+                self._fd = None
+                if self.returncode is None:
+                    self.returncode = 1
+                break
+            chunks.append(self._decoder.decode(data))
+        return "".join(chunks)
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def poll(self) -> Optional[int]:
+        if self.returncode is None and self.worker.poll() is not None:
+            self.returncode = self.worker.returncode
+        return self.returncode
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        return self.returncode
+
+    def unload(self):
+        if self.poll() is None:
+            try:
+                shared_runtime_request({'op': 'unload', 'name': self.bot_name})
+            except (OSError, RuntimeError) as e:
+                logger.warning(f"Could not unload {self.bot_name} from the shared runtime: {e}")
+            self.returncode = 0
+
+def load_into_shared_runtime(bot_name: str, bot_dir: str) -> SharedRuntimeBot:
+    loaded = sum(1 for info in list(running_bots.values()) if isinstance(info['process'], SharedRuntimeBot) and info['process'].poll() is None)
+    if loaded >= SHARED_RUNTIME_MAX_BOTS:
+        raise RuntimeError(f"Shared runtime is full ({SHARED_RUNTIME_MAX_BOTS} bots)")
+    worker = ensure_shared_runtime()
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    process = SharedRuntimeBot(bot_name, worker, read_fd)
+    try:
+        shared_runtime_request({'op': 'load', 'name': bot_name, 'bot_dir': os.path.abspath(bot_dir)}, [write_fd])
+    except RuntimeError as e:
+        # The worker has already closed its end, so the output read from here on ends with the traceback
+        logger.error(f"Failed to load {bot_name} into the shared runtime: {e}")
+    except BaseException:
+        # Timed out or could not connect: nothing will ever read the pipe
+        os.close(read_fd)
+        raise
+    finally:
+        os.close(write_fd)
+    return process
+
+def get_shared_runtime_usage() -> Dict[str, Dict[str, Any]]:
+    """Per-bot CPU time, update and error counts from the shared worker, plus a CPU percentage since the last call."""
+    process = shared_runtime['process']
+    if not process or process.poll() is not None:
+        return {}
+    try:
+        stats = shared_runtime_request({'op': 'stats'})['bots']
+    except (OSError, RuntimeError, ValueError):
+        return {}
+    now = time.time()
+    for bot_name, bot_stats in stats.items():
+        bot_info = running_bots.get(bot_name)
+        if not bot_info:
+            continue
+        last_time, last_cpu = bot_info.get('runtime_sample', (bot_stats['loaded_at'], 0.0))
+        elapsed = now - last_time
+        bot_stats['cpu_percent'] = (bot_stats['cpu_time'] - last_cpu) / elapsed * 100 if elapsed > 0 else 0.0
+        bot_info['runtime_sample'] = (now, bot_stats['cpu_time'])
+        bot_info['cpu_usage'] = bot_stats['cpu_percent']
+    return stats
+
+# --- Startup Report ---
+# app.py binds the web server before importing this module and times that import the way
+# `python -X importtime` would; it hands the results over here and the remaining phases are
+# marked as the manager comes up. Phase times are seconds since app.py started.
+startup_report: Dict[str, Any] = {'started': None, 'phases': [], 'imports': []}
+
+def set_startup_profile(started: float, phases: List[Tuple[str, float]], imports: List[Tuple[str, float, float]]):
+    """started is app.py's perf_counter() at launch; imports are (module, self seconds, cumulative seconds)."""
+    startup_report.update(started=started, phases=list(phases), imports=list(imports))
+
+def mark_startup_phase(name: str):
+    if startup_report['started'] is not None:
+        startup_report['phases'].append((name, time.perf_counter() - startup_report['started']))
+
+def report_startup(phase: str):
+    """Marks the phase at which the manager starts receiving updates and logs the startup report."""
+    mark_startup_phase(phase)
+    if startup_report['started'] is not None:
+        logger.info(format_startup_report())
+
+async def report_startup_once_polling(application: Application):
+    """run_polling starts polling only after post_init returns, and starts the application once polling runs."""
+    while not application.running:
+        await asyncio.sleep(0.05)
+    report_startup('polling')
+
+def get_startup_phase(name: str) -> Optional[float]:
+    return next((seconds for phase, seconds in startup_report['phases'] if phase == name), None)
+
+def format_startup_report(top: int = 15) -> str:
+    lines = ["Startup phases: " + ", ".join(f"{name} at {seconds:.3f}s" for name, seconds in startup_report['phases'])]
+    imports = sorted(startup_report['imports'], key=lambda entry: entry[2], reverse=True)[:top]
+    if imports:
+        lines.append("Slowest imports:     self [ms] | cumulative [ms] | module")
+        lines.extend(f"{self_time * 1000:26.1f} | {cumulative * 1000:15.1f} | {module}" for module, self_time, cumulative in imports)
+    return "\n".join(lines)
+
+# --- Metrics ---
+# Prometheus text exposition for the /metrics endpoint of app.py.
+METRICS_LOCAL_HOSTS = ('127.0.0.1', '::1', '::ffff:127.0.0.1')
+METRICS_RENDER_TIMEOUT = 5
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _metric_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(str(value))}"' for name, value in labels.items()) + "}"
+
+def format_metric(name: str, metric_type: str, help_text: str, samples: List[Tuple[Dict[str, str], float]]) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    lines.extend(f"{name}{_metric_labels(labels)} {value}" for labels, value in samples)
+    return lines
+
+def format_histogram(name: str, help_text: str, histograms: List[Tuple[Dict[str, str], LatencyHistogram]]) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, histogram in histograms:
+        cumulative = 0
+        for bound, count in zip(HANDLER_BUCKETS + (float('inf'),), histogram.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f"{name}_bucket{_metric_labels({**labels, 'le': le})} {cumulative}")
+        lines.append(f"{name}_sum{_metric_labels(labels)} {histogram.total}")
+        lines.append(f"{name}_count{_metric_labels(labels)} {cumulative}")
+    return lines
+
+def is_metrics_request_authorized(authorization: Optional[str], client_host: str) -> bool:
+    """Requires the bearer token when METRICS_TOKEN is set; without one, only local scrapers are answered."""
+    if not METRICS_TOKEN:
+        return client_host in METRICS_LOCAL_HOSTS
+    return bool(authorization) and hmac.compare_digest(authorization, f"Bearer {METRICS_TOKEN}")
+
+def render_metrics_threadsafe() -> Optional[str]:
+    """Renders the metrics for the web server's threads; None if the event loop is not running or too busy to answer.
+
+    The stats are only ever changed on the event loop, so they are read there too.
+    """
+    if event_loop is None:
+        return None
+    future = asyncio.run_coroutine_threadsafe(collect_metrics(), event_loop)
+    try:
+        return future.result(timeout=METRICS_RENDER_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        return None
+
+async def collect_metrics() -> str:
+    return render_metrics()
 
-application.add_handler(upload_conv_handler)
-application.add_handler(mirror_conv_handler)
-application.add_handler(edit_code_conv_handler)
-
-application.add_handler(CommandHandler("start", start_command))
-application.add_handler(CommandHandler("list", list_bots_command))
-application.add_handler(CommandHandler("stats", stats_command))
-application.add_handler(CommandHandler("help", help_command))
-application.add_handler(CallbackQueryHandler(main_menu_callback, pattern='^main_menu$'))
-application.add_handler(CallbackQueryHandler(list_bots_command, pattern='^list_bots$'))
-application.add_handler(CallbackQueryHandler(stats_command, pattern='^stats$'))
-application.add_handler(CallbackQueryHandler(help_command, pattern='^help$'))
-application.add_handler(CallbackQueryHandler(settings_callback, pattern='^settings$'))
-application.add_handler(CallbackQueryHandler(system_health_command, pattern='^system_health$'))
-application.add_handler(CallbackQueryHandler(clean_logs_command, pattern='^clean_logs$'))
-
-application.add_handler(CallbackQueryHandler(template_list_command, pattern='^template_list$'))
-application.add_handler(CallbackQueryHandler(select_template_command, pattern='^select_template:'))
-application.add_handler(CallbackQueryHandler(use_template_command, pattern='^use_template:'))
-
-application.add_handler(CallbackQueryHandler(start_all_bots_command, pattern='^start_all_bots$'))
-application.add_handler(CallbackQueryHandler(stop_all_bots_command, pattern='^stop_all_bots$'))
-application.add_handler(CallbackQueryHandler(manage_mirror_callback, pattern='^manage_mirror$'))
-application.add_handler(CallbackQueryHandler(browse_mirror_callback, pattern='^browse_mirror$'))
-application.add_handler(CallbackQueryHandler(delete_all_mirror_confirm_callback, pattern='^delete_all_mirror_confirm$'))
-application.add_handler(CallbackQueryHandler(delete_all_mirror_final_callback, pattern='^delete_all_mirror_final$'))
-application.add_handler(CallbackQueryHandler(select_bot_callback, pattern=r'^select_bot:'))
-application.add_handler(CallbackQueryHandler(bot_action_callback, pattern=r'^bot_action:'))
-
-application.add_handler(CallbackQueryHandler(delete_all_bots_confirm, pattern='^delete_all_confirm$'))
-application.add_handler(CallbackQueryHandler(delete_all_bots_final, pattern='^delete_all_final$'))
-application.add_handler(MessageHandler(filters.COMMAND, start_command)) # Fallback for unknown commands
-application.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND, autoreact))
-
-logger.info("Bot is starting...")
-application.run_polling()
-if name == "main":
-main()
-
-
-Traceback (most recent call last):
-  File "/app/app.py", line 5, in <module>
-    import bot  # Import the enhanced bot logic
-    ^^^^^^^^^^
-  File "/app/bot.py", line 171
-    = "\ud83d\udcdd"
-    ^
-SyntaxError: invalid syntax
+def render_metrics() -> str:
+    """Prometheus text for all metrics. Runs on the event loop."""
+    lag = get_loop_lag_summary()
+    lines = []
+    lines += format_metric("bothoster_bots", "gauge", "Hosted bots by state.", [
+        ({'state': 'running'}, sum(1 for info in running_bots.values() if info['process'].poll() is None)),
+        ({'state': 'total'}, len(running_bots)),
+    ])
+    lines += format_metric("bothoster_event_loop_lag_seconds", "gauge", "Event loop lag over the recent heartbeat window.", [
+        ({'quantile': '0.5'}, lag['p50']),
+        ({'quantile': '0.99'}, lag['p99']),
+        ({'quantile': '1'}, lag['window_max']),
+    ])
+    lines += format_metric("bothoster_event_loop_stalls_total", "counter", "Event loop stalls longer than the watchdog threshold.", [({}, lag['stalls'])])
+    lines += format_metric("bothoster_event_loop_stall_seconds_total", "counter", "Time the event loop spent stalled, by blocking site.",
+                           [({'site': site}, entry['total']) for site, entry in lag['offenders']])
+    lines += format_metric("bothoster_event_loop_stall_site_total", "counter", "Event loop stalls by blocking site.",
+                           [({'site': site}, entry['count']) for site, entry in lag['offenders']])
+    handlers = sorted(handler_stats.items())
+    lines += format_histogram("bothoster_handler_duration_seconds", "Wall-clock latency of manager bot handlers.",
+                              [({'handler': name}, stats['wall']) for name, stats in handlers])
+    lines += format_histogram("bothoster_handler_cpu_seconds", "Event loop CPU time spent inside manager bot handlers.",
+                              [({'handler': name}, stats['cpu']) for name, stats in handlers])
+    lines += format_histogram("bothoster_handler_api_wait_seconds", "Time manager bot handlers spent waiting on the Telegram API.",
+                              [({'handler': name}, stats['api']) for name, stats in handlers])
+    lines += format_metric("bothoster_handler_errors_total", "counter", "Manager bot handler calls that raised.",
+                           [({'handler': name}, stats['errors']) for name, stats in handlers])
+    lines += format_metric("bothoster_handler_in_flight", "gauge", "Manager bot handler calls currently running.",
+                           [({'handler': name}, stats['in_flight']) for name, stats in handlers])
+    ingest = sorted(log_ingest_stats.items())
+    lines += format_metric("bothoster_log_read_bytes_total", "counter", "Bytes of hosted bot output read by the manager.",
+                           [({'bot': name}, stats['read_bytes']) for name, stats in ingest])
+    lines += format_metric("bothoster_log_dropped_lines_total", "counter", "Hosted bot output lines dropped by the log rate limit.",
+                           [({'bot': name}, stats['dropped_lines']) for name, stats in ingest])
+    lines += format_metric("bothoster_log_dropped_bytes_total", "counter", "Bytes of hosted bot output dropped by the log rate limit.",
+                           [({'bot': name}, stats['dropped_bytes']) for name, stats in ingest])
+    lines += format_metric("bothoster_startup_phase_seconds", "gauge", "Seconds from process start to each startup phase.",
+                           [({'phase': name}, seconds) for name, seconds in startup_report['phases']])
+    return "\n".join(lines) + "\n"
+
+# --- Main Application Setup ---
+async def post_init(application: Application):
+    """Starts background tasks once the application's event loop is running."""
+    global bot_monitor_task, mirror_sweeper_task, snapshot_scheduler_task, log_retention_task
+    global event_loop
+    event_loop = asyncio.get_running_loop()
+    if SLOW_CALL_WARNING_MS:
+        enable_slow_call_warning(SLOW_CALL_WARNING_MS)
+    start_loop_watchdog()
+    bot_monitor_task = asyncio.create_task(monitor_bots())
+    load_media_cache()
+    load_lifecycle_traces()
+    start_mirror_workers()
+    load_mirror_index()
+    mirror_sweeper_task = asyncio.create_task(mirror_sweeper())
+    if SNAPSHOT_INTERVAL_HOURS:
+        snapshot_scheduler_task = asyncio.create_task(snapshot_scheduler())
+    log_retention_task = asyncio.create_task(log_retention_scheduler())
+    if BOT_API_PROXY:
+        start_bot_api_proxy()
+    if not MANAGER_WEBHOOK:
+        asyncio.create_task(report_startup_once_polling(application))
+
+def main():
+    """Initializes and runs the bot application."""
+    builder = Application.builder().token(TOKEN).rate_limiter(OutboundRateLimiter()).post_init(post_init)
+    if TELEGRAM_API_BASE_URL:
+        builder = builder.base_url(TELEGRAM_API_BASE_URL).base_file_url(TELEGRAM_API_BASE_URL.replace('/bot', '/file/bot'))
+    if MANAGER_WEBHOOK:
+        builder = builder.concurrent_updates(WEBHOOK_CONCURRENT_UPDATES)
+    application = builder.build()
+    mark_startup_phase('application_built')
+
+    upload_conv_handler = ConversationHandler(
+        entry_points=[CallbackQueryHandler(upload_start, pattern='^upload_start$')],
+        states={
+            ASK_BOT_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, ask_bot_file)],
+            GET_BOT_FILE: [MessageHandler(filters.Document.ALL, receive_bot_file)],
+            GET_TOKEN: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_token_and_ask_requirements)],
+            GET_REQUIREMENTS: [
+                CallbackQueryHandler(handle_requirements_decision, pattern='^(has_requirements|no_requirements)$'),
+                MessageHandler(filters.Document.ALL, receive_requirements_file),
+            ],
+        },
+        fallbacks=[CallbackQueryHandler(cancel_operation, pattern='^cancel_operation$'), CommandHandler('cancel', cancel_operation)],
+        per_user=True, per_chat=True
+    )
+
+    mirror_conv_handler = ConversationHandler(
+        entry_points=[CallbackQueryHandler(mirror_start, pattern='^mirror_start$')],
+        states={
+            ASK_MIRROR_FILE: [
+                CallbackQueryHandler(mirror_done, pattern='^mirror_done$'),
+                CallbackQueryHandler(mirror_set_ttl, pattern='^mirror_ttl:'),
+                MessageHandler(filters.ALL & ~filters.COMMAND, receive_mirror_file)
+            ]
+        },
+        fallbacks=[CallbackQueryHandler(cancel_operation, pattern='^cancel_operation$'), CommandHandler('cancel', cancel_operation)],
+        per_user=True, per_chat=True
+    )
+
+    edit_code_conv_handler = ConversationHandler(
+        entry_points=[CallbackQueryHandler(edit_bot_code, pattern='^bot_action:edit:')],
+        states={
+            EDIT_CODE: [
+                CallbackQueryHandler(save_edited_code, pattern='^save_code:'),
+                MessageHandler(filters.Document.ALL, receive_edited_code)
+            ]
+        },
+        fallbacks=[CallbackQueryHandler(cancel_operation, pattern='^cancel_operation$'), CommandHandler('cancel', cancel_operation)],
+        per_user=True, per_chat=True
+    )
+
+    restore_conv_handler = ConversationHandler(
+        entry_points=[CallbackQueryHandler(restore_start, pattern='^restore_start$')],
+        states={
+            GET_RESTORE_FILE: [MessageHandler(filters.Document.ALL, receive_restore_file)]
+        },
+        fallbacks=[CallbackQueryHandler(cancel_operation, pattern='^cancel_operation$'), CommandHandler('cancel', cancel_operation)],
+        per_user=True, per_chat=True
+    )
+
+    log_search_conv_handler = ConversationHandler(
+        entry_points=[CallbackQueryHandler(log_search_start, pattern='^log_search(:.+)?$')],
+        states={
+            ASK_LOG_QUERY: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_log_query)]
+        },
+        fallbacks=[CallbackQueryHandler(cancel_operation, pattern='^cancel_operation$'), CommandHandler('cancel', cancel_operation)],
+        per_user=True, per_chat=True
+    )
+
+    application.add_handler(upload_conv_handler)
+    application.add_handler(mirror_conv_handler)
+    application.add_handler(restore_conv_handler)
+    application.add_handler(log_search_conv_handler)
+    application.add_handler(edit_code_conv_handler)
+
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("list", list_bots_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("logs", logs_command))
+    application.add_handler(CallbackQueryHandler(main_menu_callback, pattern='^main_menu$'))
+    application.add_handler(CallbackQueryHandler(list_bots_command, pattern='^list_bots$'))
+    application.add_handler(CallbackQueryHandler(stats_command, pattern='^stats$'))
+    application.add_handler(CallbackQueryHandler(help_command, pattern='^help$'))
+    application.add_handler(CallbackQueryHandler(settings_callback, pattern='^settings$'))
+    application.add_handler(CallbackQueryHandler(system_health_command, pattern='^system_health$'))
+    application.add_handler(CallbackQueryHandler(loop_health_callback, pattern='^loop_health(_reset)?$'))
+    application.add_handler(CallbackQueryHandler(perf_stats_callback, pattern='^perf_stats(_reset)?$'))
+    application.add_handler(CallbackQueryHandler(clean_logs_command, pattern='^clean_logs$'))
+    application.add_handler(CallbackQueryHandler(log_search_page_callback, pattern='^log_search_page:'))
+    application.add_handler(CallbackQueryHandler(log_page_callback, pattern='^logs_page:'))
+    application.add_handler(CallbackQueryHandler(log_tail_start_callback, pattern='^tail_(start|resume):'))
+    application.add_handler(CallbackQueryHandler(log_tail_stop_callback, pattern='^tail_stop:'))
+    application.add_handler(CallbackQueryHandler(snapshot_list_callback, pattern='^snap_list$'))
+    application.add_handler(CallbackQueryHandler(snapshot_now_callback, pattern='^snap_now$'))
+    application.add_handler(CallbackQueryHandler(snapshot_view_callback, pattern='^snap_view:'))
+    application.add_handler(CallbackQueryHandler(snapshot_restore_confirm_callback, pattern='^snap_rc:'))
+    application.add_handler(CallbackQueryHandler(snapshot_restore_callback, pattern='^snap_r:'))
+
+    application.add_handler(CallbackQueryHandler(template_list_command, pattern='^template_list$'))
+    application.add_handler(CallbackQueryHandler(select_template_command, pattern='^select_template:'))
+    application.add_handler(CallbackQueryHandler(use_template_command, pattern='^use_template:'))
+
+    application.add_handler(CallbackQueryHandler(start_all_bots_command, pattern='^start_all_bots$'))
+    application.add_handler(CallbackQueryHandler(stop_all_bots_command, pattern='^stop_all_bots$'))
+    application.add_handler(CallbackQueryHandler(manage_mirror_callback, pattern='^manage_mirror$'))
+    application.add_handler(CallbackQueryHandler(browse_mirror_callback, pattern='^browse_mirror$'))
+    application.add_handler(CallbackQueryHandler(delete_all_mirror_confirm_callback, pattern='^delete_all_mirror_confirm$'))
+    application.add_handler(CallbackQueryHandler(delete_all_mirror_final_callback, pattern='^delete_all_mirror_final$'))
+    application.add_handler(CallbackQueryHandler(select_bot_callback, pattern=r'^select_bot:'))
+    application.add_handler(CallbackQueryHandler(bot_action_callback, pattern=r'^bot_action:'))
+
+    application.add_handler(CallbackQueryHandler(delete_all_bots_confirm, pattern='^delete_all_confirm$'))
+    application.add_handler(CallbackQueryHandler(delete_all_bots_final, pattern='^delete_all_final$'))
+    application.add_handler(MessageHandler(filters.COMMAND, start_command)) # Fallback for unknown commands
+    application.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND, autoreact))
+
+    logger.info("Bot is starting...")
+    if MANAGER_WEBHOOK:
+        run_manager_webhook(application)
+    else:
+        application.run_polling()
+
+if __name__ == "__main__":
+    main()